@@ -0,0 +1,89 @@
+''' CPU affinity, scheduling classes and NUMA placement of contexts, with Linux APIs only (os.sched_*, sysfs, and the mbind syscall).
+Where the hardware or permissions do not allow something (no NUMA, no real-time scheduling), it is skipped with a warning.
+'''
+
+import ctypes
+import os
+import platform
+import warnings
+from enum import Enum
+from typing import Dict, List, Set
+
+cpu_path = '/sys/devices/system/cpu'
+
+class Sched(Enum):
+	''' Scheduling class of a context's process '''
+	other = os.SCHED_OTHER 	# Default time-sharing
+	batch = os.SCHED_BATCH 	# Time-sharing, for CPU-bound work which need not wake up promptly
+	idle = os.SCHED_IDLE 	# Only when nothing else runs
+	fifo = os.SCHED_FIFO 	# Real-time, runs until it blocks (give a priority, 1-99)
+	rr = os.SCHED_RR 		# Real-time, round robin between equal priorities
+
+def read(path: str) -> str:
+	with open(path) as f:
+		return f.read().strip()
+
+def physical_cores(cpus: Set[int]=None) -> List[List[int]]:
+	''' CPUs of `cpus` (by default, those this process may run on) grouped by physical core, in CPU order.
+	Each CPU is its own core if the topology is unknown.
+	'''
+	cpus = os.sched_getaffinity(0) if cpus is None else cpus
+	cores: Dict[tuple, List[int]] = {}
+	for cpu in sorted(cpus):
+		try:
+			topology = f'{cpu_path}/cpu{cpu}/topology'
+			key = (read(f'{topology}/physical_package_id'), read(f'{topology}/core_id'))
+		except OSError:
+			key = (cpu,)
+		cores.setdefault(key, []).append(cpu)
+	return list(cores.values())
+
+def numa_node(cpus: Set[int]) -> int:
+	''' NUMA node of the first of `cpus`, or None if unknown '''
+	if not cpus:
+		return None
+	try:
+		nodes = [d for d in os.listdir(f'{cpu_path}/cpu{min(cpus)}') if d.startswith('node') and d[4:].isdigit()]
+	except OSError:
+		return None
+	return int(nodes[0][4:]) if nodes else None
+
+def pin(cpus: Set[int]=None, sched: Sched=None, priority: int=0):
+	''' Run the calling process on `cpus`, in scheduling class `sched` (with `priority`, for real-time classes) '''
+	if cpus is not None:
+		try:
+			os.sched_setaffinity(0, cpus)
+		except OSError as e:
+			warnings.warn(f'Could not pin to CPUs {sorted(cpus)}: {e}')
+	if sched is not None:
+		try:
+			os.sched_setscheduler(0, sched.value, os.sched_param(priority if sched in (Sched.fifo, Sched.rr) else 0))
+		except OSError as e:
+			warnings.warn(f'Could not set scheduling class {sched.name}: {e}')
+
+''' NUMA memory policy '''
+
+mbind_syscall = {'x86_64': 237, 'aarch64': 235, 'ppc64le': 259, 's390x': 268}.get(platform.machine())
+MPOL_PREFERRED = 1
+MPOL_MF_MOVE = 1 << 1
+
+def bind_memory(buf: memoryview, node: int) -> bool:
+	''' Prefer NUMA node `node` for the pages of `buf` (page-aligned, such as a shared memory segment), moving those already there.
+	Returns whether the kernel took it.
+	'''
+	if mbind_syscall is None:
+		return False
+	mask = (ctypes.c_ulong * (node // 64 + 1))()
+	mask[node // 64] = 1 << (node % 64)
+	ref = ctypes.c_char.from_buffer(buf)
+	addr = ctypes.addressof(ref)
+	del ref # Releases the buffer
+	libc = ctypes.CDLL(None, use_errno=True)
+	libc.syscall.restype = ctypes.c_long
+	res = libc.syscall(
+		ctypes.c_long(mbind_syscall), ctypes.c_void_p(addr), ctypes.c_ulong(len(buf)), ctypes.c_int(MPOL_PREFERRED),
+		mask, ctypes.c_ulong(64 * len(mask) + 1), ctypes.c_uint(MPOL_MF_MOVE),
+	)
+	if res != 0:
+		warnings.warn(f'Could not bind memory to NUMA node {node}: {os.strerror(ctypes.get_errno())}')
+	return res == 0
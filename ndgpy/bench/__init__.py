@@ -0,0 +1,4 @@
+''' Benchmark suite for graph topologies and transports. Run `python -m ndgpy.bench --help` ''' 
+
+from .harness import *
+from .scenarios import *
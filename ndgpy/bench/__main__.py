@@ -0,0 +1,56 @@
+''' Command-line entry point: run scenarios, print a table, and optionally write or compare JSON results ''' 
+
+import argparse
+import json
+import os
+import platform
+import sys
+import numpy as np
+
+from .scenarios import *
+
+columns = [('rate', '{:>10.0f}'), ('p50_us', '{:>10.1f}'), ('p99_us', '{:>10.1f}'), ('p999_us', '{:>10.1f}'), ('cpu_us_per_msg', '{:>15.2f}'), ('rss_mb', '{:>8.1f}'), ('delivered', '{:>10.1%}')]
+
+def label(name: str, params: dict) -> str:
+	return name + ''.join(f' {k}={v}' for k, v in params.items() if k != 'n')
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='ndgpy-bench', description='Benchmark ndgpy graph topologies and transports')
+	parser.add_argument('-s', '--scenario', action='append', choices=list(scenarios), help='Only run these scenarios (repeatable)')
+	parser.add_argument('-q', '--quick', action='store_true', help='Fewer messages per run')
+	parser.add_argument('-o', '--output', help='Write results as JSON to this file')
+	parser.add_argument('-c', '--compare', help='JSON results of an earlier run to compare rate and p99 against')
+	args = parser.parse_args(argv)
+
+	baseline = {}
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = {r['label']: r for r in json.load(f)['results']}
+
+	print(f'{"scenario":<40}' + ''.join(f'{c:>{len(fmt.format(0))}}' for c, fmt in columns), flush=True)
+	results = []
+	for name, params in suite(args.quick):
+		if args.scenario and name not in args.scenario:
+			continue
+		metrics = scenarios[name](**params)
+		r = {'label': label(name, params), 'scenario': name, 'params': params, **metrics}
+		results.append(r)
+		line = f'{r["label"]:<40}' + ''.join(fmt.format(r[c]) for c, fmt in columns)
+		if r['label'] in baseline:
+			old = baseline[r['label']]
+			line += f'  rate {r["rate"] / old["rate"]:.2f}x, p99 {r["p99_us"] / old["p99_us"]:.2f}x'
+		print(line, flush=True)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump({
+				'python': platform.python_version(),
+				'numpy': np.__version__,
+				'platform': platform.platform(),
+				'cpus': len(os.sched_getaffinity(0)),
+				'argv': sys.argv[1:] if argv is None else argv,
+				'results': results,
+			}, f, indent=2)
+
+if __name__ == '__main__':
+	main()
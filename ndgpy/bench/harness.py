@@ -0,0 +1,67 @@
+''' Measurement nodes and metrics shared by the benchmark scenarios ''' 
+
+import numpy as np
+import os
+import resource
+import time
+from typing import Dict, List
+
+from ndgpy.data import *
+from ndgpy.network import *
+from ndgpy.nodes.base import *
+from ndgpy.nodes.interfaces import *
+
+Result = Dict[str, float]
+
+def stamp_dtype(width: int=8) -> np.dtype:
+	''' Record of `width` bytes (at least 8) starting with a send timestamp ''' 
+	assert width >= 8
+	fields = [('t', np.int64)]
+	if width > 8:
+		fields.append(('pad', np.uint8, (width - 8,)))
+	return np.dtype(fields)
+
+class Stamp(Emitter):
+	''' Emits the current time, in ns ''' 
+	def __init__(self, width: int=8):
+		super().__init__(stamp_dtype(width))
+
+	async def compute(self):
+		self.output['t'] = time.monotonic_ns()
+
+class Sink(Collector):
+	''' Records the age of each distinct input (by timestamp) on arrival. Inputs coalesced by unbuffered links are counted once. ''' 
+	def __init__(self, capacity: int):
+		super().__init__()
+		self.latencies = np.zeros(capacity, dtype=np.int64)
+		self.n = 0
+		self.last = None
+
+	async def compute(self, values):
+		t = int(values[0]['t'])
+		if t != self.last and self.n < len(self.latencies):
+			self.latencies[self.n] = time.monotonic_ns() - t
+			self.n += 1
+			self.last = t
+
+def usage() -> Dict[str, float]:
+	''' CPU seconds and resident MB of this process ''' 
+	ru = resource.getrusage(resource.RUSAGE_SELF)
+	with open('/proc/self/status') as f:
+		rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+	return {'cpu_s': ru.ru_utime + ru.ru_stime, 'rss_mb': rss / 1024}
+
+def summarize(latencies: np.ndarray, n_sent: int, elapsed: float, cpu_s: float, rss_mb: float) -> Result:
+	''' Metrics of one run; latencies in ns ''' 
+	n = max(len(latencies), 1)
+	pct = np.percentile(latencies, [50, 99, 99.9]) / 1e3 if len(latencies) else [np.nan]*3
+	return {
+		'messages': len(latencies),
+		'delivered': len(latencies) / max(n_sent, 1),
+		'rate': len(latencies) / elapsed,
+		'p50_us': float(pct[0]),
+		'p99_us': float(pct[1]),
+		'p999_us': float(pct[2]),
+		'cpu_us_per_msg': 1e6 * cpu_s / n,
+		'rss_mb': rss_mb,
+	}
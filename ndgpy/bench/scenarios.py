@@ -0,0 +1,195 @@
+''' Benchmark scenarios. Each runs one configuration and returns its metrics.
+In-context scenarios run an ExecPlan in this process; cross-context scenarios drive the boundary nodes in a producer and a consumer process,
+as two contexts would.
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import shortuuid
+import time
+import zmq.asyncio as azmq
+
+from ndgpy.data import *
+from ndgpy.network import *
+from ndgpy.nodes.base import *
+from ndgpy.nodes.boundary import *
+from ndgpy.nodes.interfaces import *
+from ndgpy.plan import ExecPlan, TracedExecPlan
+from ndgpy.trace import *
+from .harness import *
+
+class Relay(OutBranch):
+	''' Forwards its input record '''
+	def __init__(self, dtype: np.dtype):
+		super().__init__(dtype)
+
+	async def compute(self, value: Struct):
+		self.output.set(value)
+
+''' In-context '''
+
+async def run_plan(src: Stamp, nodes: List[Node], sink: Sink, n: int, trace: bool=False, telemetry: bool=True) -> Result:
+	nodes = {m.id: m for m in nodes}
+	plan = TracedExecPlan(nodes, Tracer()) if trace else ExecPlan(nodes, telemetry=telemetry)
+	u0, t0 = usage(), time.perf_counter()
+	for _ in range(n):
+		await plan.activate(src.id)
+	elapsed, u1 = time.perf_counter() - t0, usage()
+	return summarize(sink.latencies[:sink.n], n, elapsed, u1['cpu_s'] - u0['cpu_s'], u1['rss_mb'])
+
+def chain(depth: int=4, width: int=8, n: int=20000, trace: bool=False, telemetry: bool=True) -> Result:
+	''' Stamp -> `depth` Relays -> Sink '''
+	src, sink = Stamp(width), Sink(n)
+	nodes, prev = [src, sink], src
+	for _ in range(depth):
+		relay = Relay(src.dtype)
+		prev.sends_to(relay)
+		nodes.append(relay)
+		prev = relay
+	prev.sends_to(sink)
+	return asyncio.run(run_plan(src, nodes, sink, n, trace, telemetry))
+
+def fan(fanout: int=8, width: int=8, n: int=10000, trace: bool=False, telemetry: bool=True) -> Result:
+	''' Stamp -> `fanout` Relays -> Sink joining all of them '''
+	src, sink = Stamp(width), Sink(n)
+	relays = [Relay(src.dtype) for _ in range(fanout)]
+	src.sends_to(*relays)
+	sink.receives_from(*relays)
+	return asyncio.run(run_plan(src, [src, sink] + relays, sink, n, trace, telemetry))
+
+''' Cross-context '''
+
+def make_link(smm: AFSharedMemoryManager, link: str, dtype: np.dtype, source_id: NodeID, trace: bool=False) -> Tuple[Writer, Emitter]:
+	''' Publisher and subscriber for one link, as Layout.link() would create them '''
+	dtype = traced_dtype(dtype) if trace else dtype
+	if link == 'ring':
+		data = SharedRing(smm, dtype, 1024)
+		pub, sub = (TracedRingPublisher, TracedRingSubscriber) if trace else (RingPublisher, RingSubscriber)
+		return pub(source_id, data.serialize()), sub(source_id, data.serialize(), 'bench_pub')
+	if link == 'buffered':
+		data = SharedStreamingArray(smm, dtype, 16)
+	else:
+		data = VersionedSharedStruct(smm, dtype)
+	pub, sub = (TracedPublisher, TracedSubscriber) if trace else (Publisher, Subscriber)
+	return pub(source_id, data.serialize()), sub(source_id, data.serialize(), 'bench_pub')
+
+def resources(node: Resourced, smm: AFSharedMemoryManager, zmq_ctx, doorbell: Doorbell) -> Resources:
+	res = {Resource.smm: smm, Resource.zmq_ctx: zmq_ctx, Resource.doorbell: doorbell}
+	return {r: res[r] for r in node.rspec}
+
+def producer(pubs: List[Writer], width: int, n: int, period: float, ready, go, results):
+	async def main():
+		with AFSharedMemoryManager() as smm:
+			zmq_ctx = azmq.Context()
+			zmq_ctx.MAX_SOCKETS = 4*len(pubs) + 16
+			doorbell = Doorbell(zmq_ctx, 'bench_pub')
+			srcs = [Stamp(width) for _ in pubs]
+			for src, pub in zip(srcs, pubs):
+				await pub.start(resources(pub, smm, zmq_ctx, doorbell))
+			ready.set()
+			go.wait()
+			u0 = usage()
+			for _ in range(n):
+				for src, pub in zip(srcs, pubs):
+					await src.compute()
+					await pub.compute(src.output)
+				await asyncio.sleep(period) # Also lets the doorbell flush
+			u1 = usage()
+			results.put({'cpu_s': u1['cpu_s'] - u0['cpu_s'], 'rss_mb': u1['rss_mb']})
+			await asyncio.sleep(0.1)
+			doorbell.close()
+			zmq_ctx.destroy(linger=0)
+	asyncio.run(main())
+
+def consumer(subs: List[Emitter], n: int, ready, done, results):
+	async def main():
+		with AFSharedMemoryManager() as smm:
+			zmq_ctx = azmq.Context()
+			zmq_ctx.MAX_SOCKETS = 4*len(subs) + 16
+			doorbell = Doorbell(zmq_ctx, 'bench_sub')
+			sinks = [Sink(n) for _ in subs]
+			tracer = Tracer() if isinstance(subs[0], TraceReader) else None
+			for sub, sink in zip(subs, sinks):
+				await sub.start(resources(sub, smm, zmq_ctx, doorbell))
+			ready.set()
+			first, last = [None], [None]
+			async def drain(sub: Emitter, sink: Sink):
+				while sink.n < n:
+					try:
+						if await asyncio.wait_for(sub.compute(), timeout=0.5) is False:
+							continue
+					except asyncio.TimeoutError:
+						if done.is_set():
+							break # Remaining messages were coalesced or lost
+						continue
+					last[0] = time.perf_counter()
+					first[0] = first[0] or last[0]
+					if tracer:
+						origin, t_origin, t_emit, t_publish = sub.header
+						tracer.wake(sub.source_id, t_emit, t_publish, sub.t_wake)
+						tracer.consume(sub.source_id, sub.t_wake, clock())
+					await sink.compute((sub.output,))
+			u0 = usage()
+			await asyncio.gather(*(drain(sub, sink) for sub, sink in zip(subs, sinks)))
+			elapsed, u1 = (last[0] or 0) - (first[0] or 0), usage()
+			latencies = np.concatenate([s.latencies[:s.n] for s in sinks])
+			results.put((latencies, max(elapsed, 1e-9), u1['cpu_s'] - u0['cpu_s'], u1['rss_mb'], tracer and tracer.summary()))
+			doorbell.close()
+			zmq_ctx.destroy(linger=0)
+	asyncio.run(main())
+
+def pipe(link: str='unbuffered', width: int=8, publishers: int=1, n: int=20000, period: float=1e-4, trace: bool=False) -> Result:
+	''' `publishers` Stamps in one context, each sending to a Sink in another context over a `link` link
+	(unbuffered, buffered, or ring), `n` times with `period` seconds between rounds (0 to saturate the link).
+	Unbuffered links deliver only the latest record, so `delivered` drops when the consumer falls behind.
+	With `trace`, the links are traced and the per-stage latencies are returned under 'trace'.
+	'''
+	with AFSharedMemoryManager() as smm:
+		links = [make_link(smm, link, stamp_dtype(width), shortuuid.uuid(), trace) for _ in range(publishers)]
+		pubs, subs = [l[0] for l in links], [l[1] for l in links]
+		pub_ready, sub_ready, go, done, pub_results, sub_results = mp.Event(), mp.Event(), mp.Event(), mp.Event(), mp.Queue(), mp.Queue()
+		procs = [
+			mp.Process(target=producer, args=(pubs, width, n, period, pub_ready, go, pub_results)),
+			mp.Process(target=consumer, args=(subs, n, sub_ready, done, sub_results)),
+		]
+		procs[0].start()
+		pub_ready.wait() # Doorbell must bind before the subscriber connects
+		procs[1].start()
+		sub_ready.wait()
+		time.sleep(0.2) # Let subscriptions propagate
+		go.set()
+		prod = pub_results.get()
+		done.set()
+		latencies, elapsed, cpu_s, rss_mb, stages = sub_results.get()
+		for p in procs:
+			p.join()
+	result = summarize(latencies, n * publishers, elapsed, prod['cpu_s'] + cpu_s, prod['rss_mb'] + rss_mb)
+	if stages:
+		result['trace'] = stages
+	return result
+
+''' Registry '''
+
+scenarios = {
+	'chain': chain,
+	'fan': fan,
+	'pipe': pipe,
+}
+
+def suite(quick: bool=False) -> List[Tuple[str, dict]]:
+	''' Default (scenario, parameters) runs '''
+	n = 2000 if quick else 20000
+	runs = [
+		('chain', {'depth': 1, 'n': n}),
+		('chain', {'depth': 8, 'n': n}),
+		('fan', {'fanout': 8, 'n': n // 2}),
+	]
+	for link in ('unbuffered', 'buffered', 'ring'):
+		runs.append(('pipe', {'link': link, 'n': n}))
+	runs.append(('pipe', {'link': 'ring', 'period': 0, 'n': n}))
+	for width in (1 << 10, 1 << 16, 1 << 20):
+		runs.append(('pipe', {'link': 'unbuffered', 'width': width, 'n': n // 10}))
+	for publishers in (10, 100):
+		runs.append(('pipe', {'link': 'unbuffered', 'publishers': publishers, 'n': n // publishers}))
+	return runs
@@ -6,18 +6,33 @@ import zmq
 import zmq.asyncio as azmq
 import multiprocessing as mp
 import ujson
+import cloudpickle as pickle
 import asyncio
 import pdb
 import sys
+import os
+from multiprocessing.connection import Connection
 
 from .utils import *
 from .data.shared import *
 from .nodes.base import *
 from .nodes.interfaces import *
+from .nodes.boundary import FiniteEmitter, Subscriber, RingSubscriber, Publisher, RingPublisher
+from .nodes.utils import detached_copy
 from .network import *
+from .plan import *
+from .trace import Tracer
+from .telemetry import snapshot, pack
+from .affinity import Sched, pin, numa_node
 
 ''' Common types ''' 
 ContextID = NewType('ContextID', str)
+Affinity = Tuple[Set[int], Sched, int] # CPUs, scheduling class & priority of a context's process (see affinity.pin())
+
+class Engine(Enum):
+	''' How a context runs its roots ''' 
+	asyncio = 1 	# Each root runs in a task of its own, woken by the event loop (see ContextWorker.drive())
+	spin = 2 		# Subscribers are polled (burning a core) and run inline; other roots as with Engine.asyncio (see ContextWorker.spin_loop())
 
 ''' Context workers ''' 
 
@@ -29,11 +44,36 @@ class ContextWorker:
 	* Establish IPC w/ host process to receive updates
 	* Initially (when there are 0 nodes to run), simply wait for messages from host
 	* When nodes are received to run, link them appropriately & use the relevant runner (while continuing to listen for host updates)
+	* Send telemetry snapshots to the host every `telemetry_period` seconds (if set; otherwise, keep no per-node counters)
+	* Hand nodes over to other contexts (see Layout.migrate())
+	* Apply transactions from the host as one change to the graph (see apply())
+	* Exit when told to, or give up its context to be recycled, if run by a ContextPool
+	* Poll the links it reads rather than wait for their doorbells, with Engine.spin (see spin_loop())
+
+	Host messages are multipart: the context ID, a JSON header with a list of operations (dicts, as in handle()), and raw frames of
+	pickled nodes, which operations refer to by index under 'payload'. A header with a 'txn' key is a transaction, acknowledged once applied.
 	''' 
-	def __init__(self, id: ContextID):
+	quiesce_poll = 1e-4 # Seconds between checks for no emission in flight
+	offload_threads = None # Worker threads for offloaded computes (see Collector.offload); ThreadPoolExecutor's default if None
+	spin_budget = 1e-2 # Seconds Engine.spin polls without input before blocking
+	spin_max_wait = 1e-3 # Seconds Engine.spin blocks for at most, while reading rings
+
+	def __init__(self, id: ContextID, trace: bool=False, smm: AFSharedMemoryManager=None, engine: Engine=Engine.asyncio, 
+			telemetry_period: float=1.):
+		''' With `smm`, uses that (started) shared memory manager rather than starting one ''' 
 		self.id = id
+		self.smm = smm
+		self.engine = engine
+		self.telemetry_period = telemetry_period
+		self.recycled = False
 		self.nodes: Dict[NodeID, Node] = {}
-		self.emitters: Dict[NodeID, asyncio.Task] = {} # Root nodes in the graph associated with their workers
+		self.emitters: Dict[NodeID, asyncio.Task] = {} # Root nodes in the graph associated with their drivers (see drive())
+		self.polled: Dict[NodeID, Node] = {} # Subscribers run by the spin engine instead
+		self.tracer = Tracer() if trace else None # Latency histograms of traced links and paths
+		self.plan = None
+		self.held: List[NodeID] = None # Emitters to resume once the transaction being applied is, if any
+		self.pool = offload_pool(self.offload_threads)
+		self.compile()
 
 	async def __aenter__(self):
 		self.zmq_ctx = azmq.Context()
@@ -42,24 +82,29 @@ class ContextWorker:
 		self.rx.setsockopt_string(zmq.SUBSCRIBE, str(self.id))
 		self.tx = self.zmq_ctx.socket(zmq.PUSH)
 		self.tx.connect(rx_url)
-		self.smm = AFSharedMemoryManager().__enter__()
-		self.ready = asyncio.Event()
+		if self.smm is None:
+			self.smm = AFSharedMemoryManager().__enter__()
+		self.doorbell = Doorbell(self.zmq_ctx, self.id)
+		self.nudge = asyncio.Event() # Set when the polled subscribers change
 		self.resource_map = {
 			Resource.zmq_ctx: self.zmq_ctx,
 			Resource.mc_url: mc_url_base,
 			Resource.orch_tx_url: tx_url,
 			Resource.orch_rx_url: rx_url,
 			Resource.smm: self.smm,
+			Resource.doorbell: self.doorbell,
 		}
 		return self
 
 	async def __aexit__(self, exc_type, exc_value, tb):
-		await asyncio.wait([
+		await asyncio.gather(*(
 			node.stop() for node in self.nodes.values()
 			if isinstance(node, Resourced)
-		])
+		))
 		for task in self.emitters.values():
 			task.cancel()
+		self.pool.shutdown(wait=False, cancel_futures=True)
+		self.doorbell.close()
 		self.zmq_ctx.destroy()
 		self.smm.__exit__(exc_type, exc_value, tb)
 		return exc_type is None
@@ -67,75 +112,364 @@ class ContextWorker:
 	def get_resources(self, rspec: ResourceSpec):
 		return {r: self.resource_map[r] for r in rspec}
 
-	async def add(self, node: Node):
+	async def add(self, node: Node, paused: bool=False):
+		''' Start a node; a paused Emitter is not run until resume() ''' 
 		assert node.id not in self.nodes
 		if isinstance(node, Resourced):
-			# Initialize with resources
+			# Initialize with resources, noting which attributes they are
+			attrs = set(vars(node))
 			await node.start(self.get_resources(node.rspec)) 
+			node.started_attrs = set(vars(node)) - attrs
 		self.nodes[node.id] = node
-		if isinstance(node, Emitter) and not isinstance(node, Router): 
-			# We have an Emitter node; start a Task for it
-			self.emitters[node.id] = asyncio.create_task(node(), name=node.id)
-			if not self.ready.is_set():
-				self.ready.set()
-
-	async def remove(self, node: NodeID):
-		assert node in self.nodes
-		# First disconnect all neighbors 
-		asyncio.wait([self.disconnect(n, node) for n in self.nodes[node].sources])
-		asyncio.wait([self.disconnect(node, n) for neighbor in self.nodes[node].sinks])
-
-		if node in self.emitters:
-			self.emitters[node].cancel()
-			if len(self.emitters) == 1:
-				self.ready.clear() # Stop running context
-			del self.emitters[node]
-		node.stop() # Kill resources
-		del self.nodes[node]
+		self.compile()
+		if not paused:
+			self.resume(node.id)
+
+	def resume(self, n_id: NodeID):
+		if self.held is not None:
+			self.held.append(n_id)
+			return
+		node = self.nodes[n_id]
+		if self.engine is Engine.spin and isinstance(node, (Subscriber, RingSubscriber)):
+			self.polled[node.id] = node
+			self.nudge.set()
+		elif isinstance(node, Emitter) and not isinstance(node, Collector) and node.id not in self.emitters: 
+			# We have an Emitter node; start its driver
+			self.emitters[node.id] = asyncio.create_task(self.drive(node), name=node.id)
+
+	async def remove(self, n_id: NodeID):
+		assert n_id in self.nodes
+		node = self.take(n_id)
+		if isinstance(node, Resourced):
+			await node.stop() # Kill resources
+
+	def take(self, n_id: NodeID) -> Node:
+		''' Take a node out of the graph, disconnected from its neighbors ''' 
+		node = self.nodes.pop(n_id)
+		node.disconnect(*getattr(node, 'sources', {}).values(), *getattr(node, 'sinks', {}).values())
+		if n_id in self.emitters:
+			self.emitters.pop(n_id).cancel()
+		if self.polled.pop(n_id, None) is not None:
+			self.nudge.set()
+		self.compile()
+		return node
+
+	async def quiesce(self):
+		''' Wait until no emission is in flight. The caller should change the graph before it next awaits. ''' 
+		while self.plan.lineage.in_flight:
+			await asyncio.sleep(self.quiesce_poll)
+
+	async def detach(self, n_id: NodeID) -> Tuple[Node, Dict[NodeID, int]]:
+		''' Take a node out to run elsewhere, between emissions. Returns a copy of it to start there (see detached_copy()), 
+		and for each source, how many of the writes on its link to other contexts the node has seen 
+		(as read by the Subscriber feeding it, or as written by the Publisher of a source in this context).
+		Roots are stopped in their compute, as by remove().
+		''' 
+		await self.quiesce()
+		node = self.nodes[n_id]
+		positions = {}
+		for src in getattr(node, 'sources', {}).values():
+			if isinstance(src, (Subscriber, RingSubscriber)):
+				positions[src.source_id] = src.position
+			else:
+				pub = next((m for m in src.sinks.values() if isinstance(m, (Publisher, RingPublisher)) and m.source_id == src.id), None)
+				if pub is not None:
+					positions[src.id] = pub.position
+		self.take(n_id)
+		if isinstance(node, Resourced):
+			await node.stop()
+		return detached_copy(node), positions
+
+	async def handover(self, src: NodeID, dst: NodeID, child: NodeID):
+		''' Feed `child` from `dst` rather than from subscriber `src`, once neither has writes left to read: `dst` is a subscriber 
+		on the same link, or the source of the link itself. So the child sees each write once.
+		''' 
+		a, b, node = self.nodes[src], self.nodes[dst], self.nodes[child]
+		while a.unread or getattr(b, 'unread', 0) or self.plan.lineage.in_flight:
+			await asyncio.sleep(self.quiesce_poll)
+		a.disconnect(node)
+		b.sends_to(node)
+		self.compile()
+
+	def follow(self, source_id: NodeID, ctx_id: str):
+		''' Listen for the doorbell of a source which moved to context `ctx_id` ''' 
+		for node in self.nodes.values():
+			if isinstance(node, (Subscriber, RingSubscriber)) and node.source_id == source_id:
+				node.follow(ctx_id)
 
 	async def connect(self, n_id_1: NodeID, n_id_2: NodeID):
 		assert all((n_id_1, n_id_2 in self.nodes))
 		self.nodes[n_id_1].sends_to(self.nodes[n_id_2])
+		self.compile()
 
 	async def disconnect(self, n_id_1: NodeID, n_id_2: NodeID):
 		assert all((n_id_1, n_id_2 in self.nodes))
 		self.nodes[n_id_1].disconnect(self.nodes[n_id_2])
+		self.compile()
+
+	def compile(self):
+		''' Rebuild the execution plan after the local graph changes (once a transaction is applied, while applying one) ''' 
+		if self.held is not None:
+			return
+		if self.tracer is None:
+			self.plan = ExecPlan(self.nodes, prev=self.plan, pool=self.pool, telemetry=self.telemetry_period is not None)
+		else:
+			self.plan = TracedExecPlan(self.nodes, self.tracer, prev=self.plan, pool=self.pool)
 
 	async def recv_loop(self):
 		while True:
-			msg = await self.rx.recv()
-			msg = ujson.loads(msg[len(self.id)+1:])
-			# print(f'Context {self.id} got message: {msg}')
-			if 'add' in msg:
-				await self.add(wire_unpickle(msg['add']))
-			if 'remove' in msg:
-				await self.remove(msg['remove'])
-			if 'connect' in msg:
-				await self.connect(msg['connect']['parent'], msg['connect']['child'])
-
-	async def exec_loop(self):
+			frames = await self.rx.recv_multipart()
+			header, payloads = ujson.loads(frames[1]), frames[2:]
+			# print(f'Context {self.id} got message: {header}')
+			if 'txn' in header:
+				error = await self.apply(header['ops'], payloads)
+				await self.tx.send_json({'applied': header['txn'], 'error': error})
+				continue
+			for msg in header['ops']:
+				if await self.handle(msg, payloads):
+					return
+
+	async def apply(self, ops: List[Dict], payloads: List[bytes]) -> str:
+		''' Apply the operations of a transaction as one change to the graph: the plan is compiled once, and the Emitters added or 
+		resumed are started at the end. If an operation fails, the nodes added and the edges changed before it are taken back 
+		(nodes removed are not), nothing is started, and its error is returned.
+		''' 
+		self.held, done, error = [], [], None
+		try:
+			for msg in ops:
+				await self.handle(msg, payloads)
+				done.append(msg)
+		except Exception as e:
+			error = f'{type(e).__name__}: {e}'
+			for msg in reversed(done):
+				if 'add' in msg and msg['add'] in self.nodes:
+					node = self.take(msg['add'])
+					if isinstance(node, Resourced):
+						await node.stop()
+				for op, undo in (('connect', 'disconnect'), ('disconnect', 'sends_to')):
+					if op in msg and all(msg[op][k] in self.nodes for k in ('parent', 'child')):
+						getattr(self.nodes[msg[op]['parent']], undo)(self.nodes[msg[op]['child']])
+			self.held.clear()
+		held, self.held = self.held, None
+		self.compile()
+		for n_id in held:
+			if n_id in self.nodes:
+				self.resume(n_id)
+		return error
+
+	async def handle(self, msg: Dict, payloads: List[bytes]) -> bool:
+		''' Carry out one operation from the host; returns whether it is to exit ''' 
+		if 'add' in msg:
+			await self.add(pickle.loads(payloads[msg['payload']]), paused=msg.get('paused', False))
+		if 'resume' in msg:
+			self.resume(msg['resume'])
+		if 'detach' in msg:
+			node, positions = await self.detach(msg['detach'])
+			await self.tx.send_multipart([ujson.dumps({'detached': node.id, 'positions': positions}).encode(), pickle.dumps(node)])
+		if 'handover' in msg:
+			await self.handover(msg['handover']['from'], msg['handover']['to'], msg['handover']['child'])
+		if 'sync' in msg:
+			await self.tx.send_json({'synced': msg['sync']})
+		if 'follow' in msg:
+			self.follow(msg['follow']['source'], msg['follow']['ctx'])
+		if 'remove' in msg:
+			await self.remove(msg['remove'])
+		if 'connect' in msg:
+			await self.connect(msg['connect']['parent'], msg['connect']['child'])
+		if 'disconnect' in msg:
+			await self.disconnect(msg['disconnect']['parent'], msg['disconnect']['child'])
+		if 'exit' in msg:
+			return True
+		if 'recycle' in msg:
+			self.recycled = True
+			return True
+		if 'trace' in msg:
+			await self.tx.send_json({'trace': self.id, 'report': self.tracer.summary() if self.tracer else None})
+		return False
+
+	async def telemetry_loop(self):
+		while True:
+			await asyncio.sleep(self.telemetry_period)
+			await self.tx.send_multipart(pack(self.id, snapshot(self.plan)))
+
+	async def drive(self, node: Emitter):
+		''' Run emissions of a root, on the latest plan each, until it finishes (if a FiniteEmitter) or its task is cancelled by take().
+		Yields to the event loop after each emission, so that roots whose compute does not suspend take turns with the others. 
+		An emission which raises is reported to the event loop's exception handler, and the root runs on.
+		''' 
+		loop = asyncio.get_running_loop()
+		finite = isinstance(node, FiniteEmitter)
+		while True:
+			try:
+				await self.plan.activate(node.id)
+			except Exception as e:
+				loop.call_exception_handler({'message': f'Emission of {node.id} failed', 'exception': e, 'task': self.emitters.get(node.id)})
+			if finite and node.finished:
+				del self.emitters[node.id]
+				await node.finish()
+				return
+			await asyncio.sleep(0)
+
+	async def spin_loop(self):
+		''' Engine.spin: poll the write counters of the links read by polled subscribers, and run an emission of each one with unread 
+		writes inline (one coroutine, with no task per emission), without waiting for its doorbell. Between rounds, yields to the event 
+		loop (for other roots and host messages), and in rounds without input to other processes too (sched_yield()). After `spin_budget` 
+		seconds without input, blocks (see block()). As in drive(), an emission which raises is reported to the event loop's exception 
+		handler, and polling goes on.
+		''' 
+		loop = asyncio.get_running_loop()
+		idle_since = loop.time()
 		while True:
-			await self.ready.wait() # TODO: can remove this and use dummy task
-			done, pending = await asyncio.wait(self.emitters.values(), return_when=asyncio.FIRST_COMPLETED)
-			for task in done:
-				done_id = task.get_name()
-				self.emitters[done_id] = asyncio.create_task(self.nodes[done_id](), name=done_id)
+			ran = False
+			for n_id, node in list(self.polled.items()):
+				if node.unread > 0 and self.polled.get(n_id) is node: # Not removed meanwhile
+					if isinstance(node, Subscriber):
+						node.event.set() # Its compute() reads without waiting
+					try:
+						await self.plan.activate(n_id)
+					except Exception as e:
+						loop.call_exception_handler({'message': f'Emission of {n_id} failed', 'exception': e, 'task': asyncio.current_task()})
+					ran = True
+			if ran:
+				idle_since = loop.time()
+			elif loop.time() - idle_since > self.spin_budget:
+				await self.block()
+				idle_since = loop.time()
+				continue
+			else:
+				os.sched_yield()
+			await asyncio.sleep(0)
 
-	async def main(self):
+	async def block(self):
+		''' Wait until a polled subscriber's doorbell rings or the polled subscribers change; while some read rings, for up to 
+		`spin_max_wait` seconds (as a ring's doorbell can be missed, see RingSubscriber.sleep()). Doorbells rung for writes already read 
+		are cleared first.
+		''' 
+		self.nudge.clear()
+		events = [self.nudge]
+		for node in self.polled.values():
+			if node.event is not None:
+				node.event.clear()
+				events.append(node.event)
+		rings = [node for node in self.polled.values() if isinstance(node, RingSubscriber)]
+		if not all(node.link_data.sleep() for node in rings): # Written meanwhile
+			return
+		tasks = [asyncio.ensure_future(e.wait()) for e in events]
+		await asyncio.wait(tasks, timeout=self.spin_max_wait if rings else None, return_when=asyncio.FIRST_COMPLETED)
+		for task in tasks:
+			task.cancel()
+
+	async def main(self) -> bool:
+		''' Run until told to exit; returns whether to be recycled ''' 
 		async with self as self:
 			await self.tx.send_json({'ready': self.id}) # Signal readiness to host
 			print(f'Worker {self.id} started')
-			await asyncio.gather(self.exec_loop(), self.recv_loop())
+			loops = ([self.telemetry_loop()] if self.telemetry_period is not None else []) + ([self.spin_loop()] if self.engine is Engine.spin else [])
+			loops = [asyncio.create_task(loop) for loop in loops]
+			await self.recv_loop() # Until told to exit
+			for task in loops:
+				task.cancel()
+		return self.recycled
 
-def ctx_worker(ctx_id: ContextID):
+def ctx_worker(ctx_id: ContextID, trace: bool=False, affinity: Affinity=(None, None, 0), engine: Engine=Engine.asyncio, telemetry_period: float=1.):
 	try:
-		worker = ContextWorker(ctx_id)
+		pin(*affinity)
+		worker = ContextWorker(ctx_id, trace=trace, engine=engine, telemetry_period=telemetry_period)
 		asyncio.run(worker.main())
 	except KeyboardInterrupt:
 		sys.exit(1)
 
+def pooled_worker(conn: Connection):
+	''' Process of a ContextPool: warms up (imports & a shared memory manager), then runs as each context it is handed out as 
+	(a (context ID, trace, affinity, engine, telemetry period) claim received on `conn`), until one exits rather than being recycled, or it receives None.
+	Sends 'warm' on `conn` when warmed up. Recycled processes go back to any CPU, in the default scheduling class.
+	''' 
+	cpus = os.sched_getaffinity(0)
+	try:
+		while True:
+			smm = AFSharedMemoryManager(ctx=mp.get_context('fork')).__enter__() # Not by the forkserver
+			conn.send('warm')
+			claim = conn.recv()
+			if claim is None:
+				smm.__exit__(None, None, None)
+				return
+			ctx_id, trace, affinity, engine, telemetry_period = claim
+			pin(*affinity)
+			if not asyncio.run(ContextWorker(ctx_id, trace=trace, smm=smm, engine=engine, telemetry_period=telemetry_period).main()):
+				return
+			pin(cpus, Sched.other)
+	except KeyboardInterrupt:
+		sys.exit(1)
+
+class ContextPool:
+	''' Context processes started ahead of time, to be handed out by Layout.new_context() and taken back by destroy_context(),
+	so that a layout (or a restarted one) need not start & warm up a process per context. Starts `size` processes from a forkserver 
+	with ndgpy preloaded; more are started as needed, and recycled ones are reused first. close() stops the idle ones.
+	''' 
+	def __init__(self, size: int):
+		self.mp = mp.get_context('forkserver')
+		self.mp.set_forkserver_preload(['ndgpy.context'])
+		self.idle: List[Tuple[mp.Process, Connection]] = []
+		self.taken: Dict[ContextID, Tuple[mp.Process, Connection]] = {}
+		self.warming: Dict[Connection, int] = {} # Warm-ups not yet waited for, per process
+		for _ in range(size):
+			self.spawn()
+
+	def spawn(self):
+		conn, child_conn = self.mp.Pipe()
+		proc = self.mp.Process(target=pooled_worker, args=(child_conn,))
+		proc.start()
+		self.idle.append((proc, conn))
+		self.warming[conn] = 1
+
+	def wait(self):
+		''' Block until the idle processes are warmed up ''' 
+		for proc, conn in self.idle:
+			for _ in range(self.warming.pop(conn, 0)):
+				conn.recv()
+
+	def take(self, ctx_id: ContextID, trace: bool=False, affinity: Affinity=(None, None, 0), engine: Engine=Engine.asyncio, 
+			telemetry_period: float=1.) -> mp.Process:
+		''' Process to run context `ctx_id` ''' 
+		if not self.idle:
+			self.spawn()
+		proc, conn = self.idle.pop()
+		conn.send((ctx_id, trace, affinity, engine, telemetry_period))
+		self.taken[ctx_id] = (proc, conn)
+		return proc
+
+	def put(self, ctx_id: ContextID):
+		''' Take back the process of a context which was told to recycle ''' 
+		proc, conn = self.taken.pop(ctx_id)
+		self.idle.append((proc, conn))
+		self.warming[conn] = self.warming.get(conn, 0) + 1
+
+	def close(self):
+		for proc, conn in self.idle:
+			conn.send(None)
+		for proc, conn in self.idle:
+			proc.join()
+		self.idle = []
+
 class Context:
-	def __init__(self, ctx_id: ContextID=None):
+	def __init__(self, ctx_id: ContextID=None, trace: bool=False, pool: ContextPool=None, cpus: Set[int]=None, sched: Sched=None, priority: int=0,
+			engine: Engine=Engine.asyncio, telemetry_period: float=1.):
+		''' Runs in a new process, or in one from `pool` once started; on `cpus` if given, in scheduling class `sched` if given
+		(with `priority`, for Sched.fifo & Sched.rr), with `engine`, sending telemetry every `telemetry_period` seconds (None for none)
+		''' 
 		self.id = shortuuid.uuid() if ctx_id is None else ctx_id
-		self.proc = mp.Process(target=ctx_worker, args=(self.id,))
-		self.ready = asyncio.Event()
\ No newline at end of file
+		self.trace = trace
+		self.pool = pool
+		self.cpus = None if cpus is None else set(cpus)
+		self.affinity: Affinity = (self.cpus, sched, priority)
+		self.engine = engine
+		self.telemetry_period = telemetry_period
+		self.proc = mp.Process(target=ctx_worker, args=(self.id, trace, self.affinity, engine, telemetry_period)) if pool is None else None
+		self.ready = asyncio.Event()
+		self.subscribed = asyncio.Event()
+
+	def start(self):
+		if self.pool is None:
+			self.proc.start()
+		else:
+			self.proc = self.pool.take(self.id, self.trace, self.affinity, self.engine, self.telemetry_period)
\ No newline at end of file
@@ -1,8 +1,127 @@
 import numpy as np
+import multiprocessing as mp
+import os
+import tempfile
 from .streaming import *
+from .shared import *
 
 ''' Run tests ''' 
-arr = StreamingArray(np.int64, lookback=5)
+arr = StreamingArray(np.float64, buf_size=5)
 for i in range(10):
 	arr.consume(i)
-assert (arr[:] == np.array([9, 8, 7, 6, 5])).all()
\ No newline at end of file
+assert (arr[:] == np.array([9, 8, 7, 6, 5])).all()
+arr.consume(10) # Wraps
+assert arr[0] == 10 and arr[4] == 6 and (arr[1:3] == np.array([9, 8, 7])).all()
+a, b = arr.segments()
+assert len(b) > 0 and (np.concatenate((a, b)) == arr[:]).all() and (arr.read(2, 4) == np.array([8, 7, 6])).all()
+
+ext = StreamingArray(np.float64, buf_size=5)
+ext.extend(np.arange(3.))
+ext.extend(np.arange(3., 11.))
+assert len(ext) == 5 and ext.n_written == 11 and (ext[:] == arr[:]).all()
+
+df = StreamingDataFrame(['x'], np.float64, buf_size=4)
+for i in range(6):
+	df.set('x', 0, i)
+	df.advance()
+assert df.get('x', 1) == 5 and df.get('x', 4) == 2 and df.get('x', 5, default=-1) == -1
+assert np.isnan(df.get('x', 0)) and (df.get_col('x')[:-1] == np.array([2, 3, 4, 5])).all()
+df.extend(np.array([(6,), (7,)], dtype=[('x', np.float64)]))
+assert df.get('x', 1) == 7 and df.get('x', 4) == 4 and df.head_index == 8
+
+''' Seqlock stress test: one process rewrites a wide record while another checks every snapshot is untorn ''' 
+wide_type = np.dtype([(f'f{i}', np.int64) for i in range(512)])
+
+def hammer(ser: SerializedVersionedStruct, n: int):
+	with AFSharedMemoryManager() as smm:
+		s = VersionedSharedStruct.deserialize(smm, ser)
+		row = np.zeros(1, dtype=wide_type)
+		for i in range(n):
+			row.view(np.int64)[:] = i
+			s.set(row[0])
+
+def stream(ser: SerializedArray, n: int):
+	''' Write records numbered 0 to n-1 into a shared streaming array, one at a time and in runs of up to 8 ''' 
+	with AFSharedMemoryManager() as smm:
+		arr = SharedStreamingArray.deserialize(smm, ser)
+		rows = np.zeros(8, dtype=wide_type)
+		i = 0
+		while i < n:
+			k = min(i % 9, n - i)
+			if k == 0:
+				rows[:1].view(np.int64)[:] = i
+				arr.consume(rows[0])
+				i += 1
+			else:
+				rows[:k].view(np.int64).reshape(k, -1)[:] = np.arange(i, i + k)[:, None]
+				arr.extend(rows[:k])
+				i += k
+
+if __name__ == '__main__':
+	''' Arena allocation: aligned blocks in one segment, reused and coalesced once freed ''' 
+	with AFSharedMemoryManager() as smm:
+		s1, s2, s3 = SharedStruct(smm, wide_type), VersionedSharedStruct(smm, wide_type), SharedStreamingArray(smm, wide_type, 10)
+		assert len(smm.arenas) == 1 and all(s.block.offset % smm.alignment == 0 for s in (s1, s2, s3))
+		s1['f0'] = 7
+		assert SharedStruct.deserialize(smm, s1.serialize())['f0'] == 7
+		s1.free(smm)
+		s2.free(smm)
+		big = smm.alloc(s1.block.size + s2.block.size)
+		assert big.offset == s1.block.offset and (big.ndarray(big.size, np.uint8) == 0).all()
+
+	''' SharedArray: attached read-only and zero-copy, from shared memory or a .npy file ''' 
+	with AFSharedMemoryManager() as smm, tempfile.TemporaryDirectory() as tmp:
+		src = np.arange(100.).reshape(50, 2)
+		path = os.path.join(tmp, 'a.npy')
+		np.save(path, src)
+		for arr in (SharedArray.from_pure(smm, src), SharedArray.from_npy(path)):
+			view = deserialize_data(smm, arr.serialize())
+			assert (view[:] == src).all() and len(view) == 50 and not view.numpy().flags.writeable
+
+	''' SharedCredits: the slowest live reader, across processes ''' 
+	with AFSharedMemoryManager() as smm:
+		credits = SharedCredits(smm, 4)
+		assert credits.min(default=9) == 9
+		reader = deserialize_data(smm, credits.serialize())
+		reader.put(1, 5)
+		reader.put(3, 2)
+		assert credits.min(default=9) == 2
+		credits.release(3)
+		assert credits.min(default=9) == 5
+
+	with AFSharedMemoryManager() as smm:
+		s = VersionedSharedStruct(smm, wide_type)
+		s.set(np.zeros(1, dtype=wide_type)[0])
+		writer = mp.Process(target=hammer, args=(s.serialize(), 20000))
+		writer.start()
+		out, last = Struct(wide_type), 0
+		while writer.is_alive():
+			version = s.read(out)
+			vals = out.data.view(np.int64)
+			assert (vals == vals[0]).all(), 'Torn read'
+			assert version >= last
+			last = version
+		writer.join()
+		assert s.version == 20001
+
+	''' Streaming array stress test: one process writes numbered records while another reads them by number, in order, 
+	each record once and untorn, and counting as dropped only those the writer lapped (as Subscriber.read_next() does)
+	''' 
+	with AFSharedMemoryManager() as smm:
+		n = 50000
+		arr = SharedStreamingArray(smm, wide_type, 16)
+		writer = mp.Process(target=stream, args=(arr.serialize(), n))
+		writer.start()
+		rows, n_read, n_dropped = np.zeros(8, dtype=wide_type), 0, 0
+		while writer.is_alive() or n_read < arr.n_written:
+			n_written = arr.n_written
+			first = max(n_read, n_written - arr.buf_size)
+			k = min(n_written - first, len(rows))
+			if k == 0 or not arr.read_seq(first, rows[:k]):
+				continue
+			vals = rows[:k].view(np.int64).reshape(k, -1)
+			assert (vals == np.arange(first, first + k)[:, None]).all(), 'Torn, repeated or out-of-order read'
+			n_dropped += first - n_read
+			n_read = first + k
+		writer.join()
+		assert n_read == n and n_dropped < n
@@ -65,3 +65,79 @@ class Struct:
 		h.update(self.data.view(np.byte).data)
 		h.update(bytes(str(self.data.dtype), 'utf-8')) # Disambiguate by dtype
 		return h.intdigest()
+
+class Batch:
+	''' Fixed-capacity run of records with a fill count `n`. Indexing and fields only cover the filled rows, oldest first. 
+	The rows are either in the batch's own buffer, or (after view()) in an array owned by someone else.
+	''' 
+	def __init__(self, dtype: np.dtype, capacity: int, fill=np.nan):
+		self.buf = np.full(capacity, fill, dtype=dtype) # Own rows
+		self.data = self.buf
+		assert self.names is not None, 'Batch requires structured data types'
+		self.is_item = len(self.names) == 1
+		self.n = 0
+
+	def __getitem__(self, idx):
+		return self.data[:self.n][idx]
+
+	def __setitem__(self, idx, val):
+		self.own()
+		self.data[:self.n][idx] = val
+
+	def __len__(self):
+		return self.n
+
+	def __repr__(self):
+		return self.numpy().__repr__()
+
+	@property
+	def dtype(self):
+		return self.data.dtype
+
+	@property
+	def names(self):
+		return self.data.dtype.names
+
+	@property
+	def capacity(self) -> int:
+		return len(self.buf)
+
+	@property
+	def full(self) -> bool:
+		return self.n == self.capacity
+
+	def numpy(self) -> np.ndarray:
+		return self.data[:self.n]
+
+	def set(self, other: Union['Batch', np.ndarray]):
+		''' Replace contents with the rows of `other` ''' 
+		assert other.dtype == self.dtype
+		rows = other.numpy() if type(other) == Batch else other
+		self.data = self.buf
+		self.data[:len(rows)] = rows
+		self.n = len(rows)
+
+	def view(self, rows: np.ndarray):
+		''' Replace contents with `rows` without copying them. The rows must stay valid while they are in use. ''' 
+		assert rows.dtype == self.dtype and len(rows) <= self.capacity
+		self.data = rows
+		self.n = len(rows)
+
+	def own(self):
+		''' Copy viewed rows into the own buffer, so they can be modified ''' 
+		if self.data is not self.buf:
+			self.buf[:self.n] = self.data[:self.n]
+			self.data = self.buf
+
+	def append(self, row: Union[Struct, np.void]):
+		self.own()
+		self.data[self.n] = row.numpy() if isinstance(row, Struct) else row
+		self.n += 1
+
+	def clear(self):
+		self.data = self.buf
+		self.n = 0
+
+	def item(self) -> np.ndarray:
+		''' Column of a single-field batch, else the filled records ''' 
+		return self.data[self.names[0]][:self.n] if self.is_item else self.numpy()
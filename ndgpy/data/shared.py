@@ -2,35 +2,130 @@
 
 from multiprocessing.shared_memory import SharedMemory, ShareableList
 from multiprocessing.managers import SharedMemoryManager, dispatch
-from typing import Tuple, NewType, Union
+from typing import Tuple, NewType, Union, Dict
+import contextlib
+import bisect
+import os
 
 from ndgpy.utils import *
+from ndgpy.affinity import bind_memory
 from .streaming import *
 from .base import *
 
 ''' Shared memory management ''' 
 
+ShmName = NewType('ShmName', str)
+Handle = Tuple[ShmName, int, int] # (arena, offset, size in bytes)
+
+class Block:
+	''' `size` bytes at `offset` in a shared memory segment ''' 
+	def __init__(self, shm: SharedMemory, offset: int, size: int):
+		self.shm = shm
+		self.offset = offset
+		self.size = size
+
+	@property
+	def buf(self) -> memoryview:
+		''' The whole segment; use with `offset` ''' 
+		return self.shm.buf
+
+	@property
+	def handle(self) -> Handle:
+		return (self.shm.name, self.offset, self.size)
+
+	def ndarray(self, shape, dtype: np.dtype, offset: int=0) -> np.ndarray:
+		''' Array over this block, `offset` bytes in ''' 
+		return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=self.offset + offset)
+
+class Arena:
+	''' First-fit allocator over one segment. Free space is kept zeroed, as a sorted list of [offset, size] holes. ''' 
+	def __init__(self, shm: SharedMemory, node: int=None):
+		self.shm = shm
+		self.node = node # NUMA node the pages are bound to, if any
+		self.holes = [[0, shm.size]]
+
+	def alloc(self, size: int) -> int:
+		''' Offset of a new block of `size` bytes, or None if there is no room ''' 
+		for i, (offset, avail) in enumerate(self.holes):
+			if avail >= size:
+				if avail == size:
+					del self.holes[i]
+				else:
+					self.holes[i] = [offset + size, avail - size]
+				return offset
+
+	def release(self, offset: int, size: int):
+		np.ndarray(size, dtype=np.uint8, buffer=self.shm.buf, offset=offset)[:] = 0
+		i = bisect.bisect(self.holes, [offset, size])
+		self.holes.insert(i, [offset, size])
+		# Coalesce with the following, then preceding hole
+		if i + 1 < len(self.holes) and offset + size == self.holes[i+1][0]:
+			self.holes[i][1] += self.holes.pop(i+1)[1]
+		if i > 0 and self.holes[i-1][0] + self.holes[i-1][1] == offset:
+			self.holes[i-1][1] += self.holes.pop(i)[1]
+
 class AFSharedMemoryManager(SharedMemoryManager):
-	''' Allows tracking shared memory from both server/client perspectives ''' 
+	''' Allows tracking shared memory from both server/client perspectives. 
+	Shared data structures are carved out of a few large arenas with alloc(), rather than getting a segment each,
+	so that large layouts need few segments, manager round trips and mmaps.
+	Blocks allocated within on_node() come from arenas bound to that NUMA node.
+	''' 
+	arena_size = 1 << 24 # 16 MiB; larger blocks get an arena of their own
+	alignment = 64 # Cache line; blocks of different links never share one
+
 	def __init__(self, *args, **kwargs):
 		self.client_shms = dict()
+		self.arenas: Dict[ShmName, Arena] = dict() # Created by this process, which allocates from them
+		self.node: int = None # NUMA node to allocate on, if any
 		super().__init__(*args, **kwargs)
 
+	@contextlib.contextmanager
+	def on_node(self, node: int=None):
+		''' Allocate on NUMA node `node` (anywhere if None) within this block ''' 
+		prev, self.node = self.node, node
+		try:
+			yield self
+		finally:
+			self.node = prev
+
 	def SharedMemory(self, name: str=None, size: int=None):
 		assert name is not None or size is not None
+		if name is not None:
+			if name not in self.client_shms:
+				self.client_shms[name] = SharedMemory(name=name)
+			return self.client_shms[name]
 		with self._Client(self._address, authkey=self._authkey) as conn:
-			if name is not None:
-				shm = SharedMemory(name=name)
-				self.client_shms[name] = shm
-			else:
-				shm = SharedMemory(None, create=True, size=size)
-				try:
-					dispatch(conn, None, 'track_segment', (shm.name,))
-				except BaseException as e:
-					shm.unlink()
-					raise e
+			shm = SharedMemory(None, create=True, size=size)
+			try:
+				dispatch(conn, None, 'track_segment', (shm.name,))
+			except BaseException as e:
+				shm.unlink()
+				raise e
 		return shm
 
+	def alloc(self, size: int) -> Block:
+		''' New zeroed block of at least `size` bytes ''' 
+		size = max(-(-size // self.alignment) * self.alignment, self.alignment)
+		for arena in self.arenas.values():
+			offset = arena.alloc(size) if arena.node == self.node else None
+			if offset is not None:
+				return Block(arena.shm, offset, size)
+		arena = Arena(self.SharedMemory(size=max(self.arena_size, size)), self.node)
+		if self.node is not None:
+			bind_memory(arena.shm.buf, self.node)
+		self.arenas[arena.shm.name] = arena
+		return Block(arena.shm, arena.alloc(size), size)
+
+	def attach(self, handle: Handle) -> Block:
+		''' Block allocated by any process ''' 
+		name, offset, size = handle
+		shm = self.arenas[name].shm if name in self.arenas else self.SharedMemory(name=name)
+		return Block(shm, offset, size)
+
+	def free(self, block: Block):
+		''' Return a block for reuse (allocating process only). Readers in other processes must have stopped using it. ''' 
+		self.arenas[block.shm.name].release(block.offset, block.size)
+
 	def __exit__(self, *args):
 		for shm in self.client_shms.values():
 			shm.close()
@@ -38,83 +133,355 @@ class AFSharedMemoryManager(SharedMemoryManager):
 
 ''' Shared data structures ''' 
 
-ShmName = NewType('ShmName', str)
-SerializedStruct = Tuple[np.dtype, ShmName]
-SerializedArray = Tuple[np.dtype, int, ShmName, SerializedStruct]
-SerializedData = Union[SerializedStruct, SerializedArray]
+SerializedStruct = Tuple[np.dtype, Handle]
+SerializedArray = Tuple[np.dtype, int, Handle, SerializedStruct]
+SerializedVersionedStruct = Tuple[np.dtype, Handle, str]
+SerializedBatch = Tuple[np.dtype, int, Handle, str]
+SerializedRing = Tuple[np.dtype, int, Handle, str]
+SerializedSharedArray = Tuple[np.dtype, Tuple[int], Union[Handle, str], str] # Handle, or path to a .npy file
+SerializedCredits = Tuple[int, Handle, str]
+SerializedData = Union[SerializedStruct, SerializedArray, SerializedVersionedStruct, SerializedBatch, SerializedRing, SerializedSharedArray]
 
-SharedArray = np.ndarray
-def SharedArray(smm: AFSharedMemoryManager, arr: np.ndarray):
-	# TODO
-	pass
+class SharedArray:
+	''' Read-only array, either in shared memory or memory-mapped from a .npy file. 
+	Any process attaches to the same pages (shared memory, or the page cache for files), so large datasets exist once however many contexts read them.
+	''' 
+	def __init__(self, smm: AFSharedMemoryManager, shape: Tuple[int], dtype: np.dtype, handle: Handle=None, path: str=None):
+		''' With neither `handle` nor `path`, allocates a zeroed array which the creating process may fill before sharing ''' 
+		self.path = path
+		if path is not None:
+			self.data = np.load(path, mmap_mode='r')
+			assert self.data.shape == tuple(shape) and self.data.dtype == dtype, 'File does not match'
+		elif handle is None:
+			''' To be used by server process ''' 
+			self.block = smm.alloc(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+			self.data = self.block.ndarray(shape, dtype)
+		else:
+			''' To be used by client processes '''
+			self.block = smm.attach(handle)
+			self.data = self.block.ndarray(shape, dtype)
+			self.data.flags.writeable = False
+
+	def __getitem__(self, idx):
+		return self.data[idx]
+
+	def __len__(self):
+		return len(self.data)
+
+	@property
+	def dtype(self):
+		return self.data.dtype
+
+	@property
+	def shape(self):
+		return self.data.shape
+
+	def numpy(self) -> np.ndarray:
+		return self.data
+
+	def serialize(self) -> SerializedSharedArray:
+		''' Send to another process ''' 
+		src = self.path if self.path is not None else self.block.handle
+		return (wire_pickle(self.dtype), self.shape, src, 'array')
+
+	def free(self, smm: AFSharedMemoryManager):
+		''' Release shared memory for reuse (creating process only) ''' 
+		if self.path is None:
+			smm.free(self.block)
+
+	@staticmethod
+	def deserialize(smm: AFSharedMemoryManager, arg: SerializedSharedArray) -> 'SharedArray':
+		''' Receive from another process ''' 
+		dtype, shape, src = wire_unpickle(arg[0]), arg[1], arg[2]
+		if type(src) == str:
+			return SharedArray(smm, shape, dtype, path=src)
+		return SharedArray(smm, shape, dtype, handle=src)
+
+	@staticmethod
+	def from_pure(smm: AFSharedMemoryManager, arr: np.ndarray) -> 'SharedArray':
+		''' Copy an array into shared memory ''' 
+		s = SharedArray(smm, arr.shape, arr.dtype)
+		s.data[:] = arr
+		return s
+
+	@staticmethod
+	def from_npy(path: str) -> 'SharedArray':
+		''' Memory-map a .npy file, without copying it ''' 
+		data = np.load(path, mmap_mode='r')
+		return SharedArray(None, data.shape, data.dtype, path=os.path.abspath(path))
 
 class SharedStreamingArray(StreamingArray):
-	''' Shared-memory streaming array ''' 
-	def __init__(self, smm: AFSharedMemoryManager, dtype: np.dtype, buf_size: int, shm_name: str=None, metadata=None):
+	''' Shared-memory streaming array. The head is derived from the shared record count, so readers see a consistent head with one load
+	(the writer's own `head` and `laps` are only for consume()).
+	As in SharedRing, the writer claims records (advancing `n_claimed`) before overwriting their slots, and commits them (advancing 
+	`n_written`) after, so that readers copying by sequence number with read_seq() can tell whether they were lapped.
+	''' 
+	def __init__(self, smm: AFSharedMemoryManager, dtype: np.dtype, buf_size: int, handle: Handle=None, metadata=None):
 		self.buf_size = buf_size
-		self.size = buf_size*2
-		if shm_name is None:
+		if handle is None:
 			''' To be used by server process ''' 
-			tmp = np.full(self.size, np.nan, dtype=dtype)
-			self.shm = smm.SharedMemory(size=tmp.nbytes)
-			self.data = np.ndarray(tmp.shape, dtype=dtype, buffer=self.shm.buf)
-			self.data[:] = tmp[:]
-			self.metadata = SharedStruct(smm, dtype=[('head_index', np.int64)])
-			self.metadata['head_index'] = self.size-1
+			self.block = smm.alloc(buf_size * np.dtype(dtype).itemsize) # Zeroed
+			self.data = self.block.ndarray(buf_size, dtype)
+			self.metadata = SharedStruct(smm, dtype=[('n_written', np.int64), ('n_claimed', np.int64)])
+			self.metadata['n_written'] = 0
+			self.metadata['n_claimed'] = 0
 		else:
 			''' To be used by client processes '''
 			assert metadata is not None
-			self.shm = smm.SharedMemory(name=shm_name)
-			self.data = np.ndarray(self.size, dtype=dtype, buffer=self.shm.buf)
+			self.block = smm.attach(handle)
+			self.data = self.block.ndarray(buf_size, dtype)
 			self.metadata = metadata
+		StreamingArray.n_written.fset(self, self.n_written) # Head and laps, as a writer after one in another process (a Publisher which moved, say)
 
 	@property
-	def head_index(self):
-		return self.metadata['head_index']
+	def head_index(self) -> int:
+		return -self.n_written % self.buf_size
 
-	@head_index.setter
-	def head_index(self, val):
-		self.metadata['head_index'] = val
+	@property
+	def n_written(self) -> int:
+		''' Total records consumed since creation ''' 
+		return int(self.metadata['n_written'])
+
+	@n_written.setter
+	def n_written(self, val: int):
+		self.metadata['n_written'] = val
+
+	@property
+	def n_claimed(self) -> int:
+		''' Total records whose slots the writer has begun to overwrite ''' 
+		return int(self.metadata['n_claimed'])
+
+	def consume(self, v: Union[Struct, np.void]):
+		n = self.n_written
+		self.metadata['n_claimed'] = n + 1
+		super().consume(v)
+		self.n_written = n + 1
+
+	def extend(self, arr: np.ndarray):
+		self.metadata['n_claimed'] = self.n_written + len(arr)
+		super().extend(arr)
+		StreamingArray.n_written.fset(self, self.n_written)
+
+	def read_seq(self, seq: int, out: np.ndarray) -> bool:
+		''' Copy the records numbered `seq` onwards (counting from 0 since creation) into `out`, oldest first, one per row. 
+		Returns whether none of them was claimed for overwriting while they were copied (readers only).
+		''' 
+		k = len(out)
+		i = (-seq - k) % self.buf_size # Slot of the newest; older ones follow, wrapping around
+		first = min(k, self.buf_size - i)
+		out[k-first:] = self.data[i:i+first][::-1]
+		out[:k-first] = self.data[:k-first][::-1]
+		return self.n_claimed - seq <= self.buf_size
 
 	def serialize(self) -> SerializedArray:
 		''' Send to another process ''' 
-		return (wire_pickle(self.dtype), self.buf_size, self.shm.name, self.metadata.serialize())
+		return (wire_pickle(self.dtype), self.buf_size, self.block.handle, self.metadata.serialize())
+
+	def free(self, smm: AFSharedMemoryManager):
+		''' Release shared memory for reuse (creating process only) ''' 
+		smm.free(self.block)
+		self.metadata.free(smm)
 
 	@staticmethod
 	def deserialize(smm: AFSharedMemoryManager, arg: SerializedArray) -> 'SharedStreamingArray':
 		''' Receive from another process ''' 
 		return SharedStreamingArray(
-			smm, wire_unpickle(arg[0]), arg[1], shm_name=arg[2], metadata=SharedStruct.deserialize(smm, arg[3])
+			smm, wire_unpickle(arg[0]), arg[1], handle=arg[2], metadata=SharedStruct.deserialize(smm, arg[3])
 		)
 
 
 class SharedStreamingDataFrame(StreamingDataFrame):
 	pass
 
+class SharedRing:
+	''' Single-producer / multi-consumer ring of records in shared memory. 
+	The header holds the producer's sequence counters; record `seq` lives in slot `seq % capacity`.
+	The producer claims records (advancing `claim_seq`) before overwriting their slots, and commits them (advancing `write_seq`) after.
+	Each consumer keeps its own cursor, so every consumer sees every record in order without blocking the producer. 
+	A consumer which falls more than `capacity` records behind is lapped, and skips ahead to the oldest live record.
+	A consumer about to wait for a signal rather than poll marks the ring with sleep(); the producer checks with wake() after writing.
+	Relies on aligned 8-byte stores being atomic and stores not being reordered (true on x86).
+	''' 
+	header_size = 64 # One cache line, in bytes
+	write_seq, claim_seq, sleeping = 0, 1, 2 # Header word offsets
+
+	def __init__(self, smm: AFSharedMemoryManager, dtype: np.dtype, capacity: int, handle: Handle=None):
+		assert capacity > 0
+		dtype = np.dtype(dtype)
+		self.capacity = capacity
+		if handle is None:
+			''' To be used by server process ''' 
+			self.block = smm.alloc(SharedRing.header_size + capacity*dtype.itemsize)
+		else:
+			''' To be used by client processes '''
+			self.block = smm.attach(handle)
+		self.header = self.block.ndarray(SharedRing.header_size // 8, np.int64).data # memoryview: faster scalar access than np.ndarray
+		self.data = self.block.ndarray(capacity, dtype, SharedRing.header_size)
+		if handle is None:
+			self.header[SharedRing.write_seq] = 0
+			self.header[SharedRing.claim_seq] = 0
+			self.header[SharedRing.sleeping] = 0
+		self.cursor = self.head # Consumers only see records written after they attach
+		self.n_dropped = 0 # Records lost to being lapped by the producer
+
+	@property
+	def head(self) -> int:
+		''' Sequence number of the next record to be written ''' 
+		return self.header[SharedRing.write_seq]
+
+	@property
+	def dtype(self):
+		return self.data.dtype
+
+	@property
+	def pending(self) -> int:
+		''' Number of records this consumer has yet to read ''' 
+		return min(self.head - self.cursor, self.capacity)
+
+	def push(self, v: Union[Struct, np.void]):
+		''' Write one record (producer only) ''' 
+		seq = self.head
+		self.header[SharedRing.claim_seq] = seq + 1
+		self.data[seq % self.capacity] = v if type(v) == np.void else v.numpy()
+		self.header[SharedRing.write_seq] = seq + 1 # Publish only after the slot is written
+
+	def push_many(self, rows: np.ndarray):
+		''' Write records in order, with at most two slice assignments (producer only) ''' 
+		seq, k = self.head, len(rows)
+		if k > self.capacity: # Only the newest records fit
+			seq, rows = seq + k - self.capacity, rows[k - self.capacity:]
+		self.header[SharedRing.claim_seq] = seq + len(rows)
+		i = seq % self.capacity
+		first = min(len(rows), self.capacity - i)
+		self.data[i:i+first] = rows[:first]
+		self.data[:len(rows)-first] = rows[first:]
+		self.header[SharedRing.write_seq] = seq + len(rows)
+
+	def sleep(self) -> bool:
+		''' Mark that a consumer waits for a signal; returns whether there is still nothing to read (consumer only) ''' 
+		self.header[SharedRing.sleeping] = 1
+		return self.head == self.cursor
+
+	def wake(self) -> bool:
+		''' Whether a consumer waits for a signal since the last call (producer only) ''' 
+		if self.header[SharedRing.sleeping]:
+			self.header[SharedRing.sleeping] = 0
+			return True
+		return False
+
+	def skip_lapped(self, head: int):
+		if head - self.cursor > self.capacity:
+			self.n_dropped += head - self.capacity - self.cursor
+			self.cursor = head - self.capacity
+
+	def pop(self, out: Struct) -> bool:
+		''' Copy the next unread record into `out` (consumer only). Returns False if there is nothing to read. ''' 
+		while True:
+			head = self.head
+			if self.cursor == head:
+				return False
+			self.skip_lapped(head)
+			out.data[0] = self.data[self.cursor % self.capacity]
+			if self.header[SharedRing.claim_seq] - self.cursor <= self.capacity:
+				# Slot was not claimed for overwriting while we copied it
+				self.cursor += 1
+				return True
+
+	def pop_many(self, out: Batch) -> int:
+		''' Copy up to `out.capacity` unread records into `out` (consumer only). Returns the number read. ''' 
+		while True:
+			head = self.head
+			self.skip_lapped(head)
+			k = min(head - self.cursor, out.capacity)
+			i = self.cursor % self.capacity
+			first = min(k, self.capacity - i)
+			out.data[:first] = self.data[i:i+first]
+			out.data[first:k] = self.data[:k-first]
+			if self.header[SharedRing.claim_seq] - self.cursor <= self.capacity:
+				self.cursor += k
+				out.n = k
+				return k
+
+	def serialize(self) -> SerializedRing:
+		''' Send to another process ''' 
+		return (wire_pickle(self.dtype), self.capacity, self.block.handle, 'ring')
+
+	def free(self, smm: AFSharedMemoryManager):
+		''' Release shared memory for reuse (creating process only) ''' 
+		smm.free(self.block)
+
+	@staticmethod
+	def deserialize(smm: AFSharedMemoryManager, arg: SerializedRing) -> 'SharedRing':
+		''' Receive from another process ''' 
+		return SharedRing(smm, wire_unpickle(arg[0]), arg[1], handle=arg[2])
+
+class SharedCredits:
+	''' Read positions of the readers of a link (the writes each has read), for its writer to hold back from overwriting unread records.
+	Each of the `readers` slots has a cache line to itself, as readers in different processes update them; unused slots hold -1.
+	''' 
+	stride = 8 # Slot spacing, in int64 words
+
+	def __init__(self, smm: AFSharedMemoryManager, readers: int, handle: Handle=None):
+		self.readers = readers
+		if handle is None:
+			self.block = smm.alloc(readers * SharedCredits.stride * 8)
+		else:
+			self.block = smm.attach(handle)
+		self.slots = self.block.ndarray(readers * SharedCredits.stride, np.int64)[::SharedCredits.stride]
+		self.words = self.block.ndarray(readers * SharedCredits.stride, np.int64).data # memoryview: faster scalar access than np.ndarray
+		if handle is None:
+			self.slots[:] = -1
+
+	def put(self, slot: int, position: int):
+		self.words[slot * SharedCredits.stride] = position
+
+	def release(self, slot: int):
+		self.put(slot, -1)
+
+	def min(self, default: int) -> int:
+		''' Position of the slowest reader, or `default` if there are none ''' 
+		live = self.slots[self.slots >= 0]
+		return int(live.min()) if len(live) else default
+
+	def serialize(self) -> SerializedCredits:
+		return (self.readers, self.block.handle, 'credits')
+
+	def free(self, smm: AFSharedMemoryManager):
+		smm.free(self.block)
+
+	@staticmethod
+	def deserialize(smm: AFSharedMemoryManager, arg: SerializedCredits) -> 'SharedCredits':
+		return SharedCredits(smm, arg[0], handle=arg[1])
+
 class SharedStruct(Struct):
-	def __init__(self, smm: AFSharedMemoryManager, dtype: np.dtype, shm_name: str=None):
+	def __init__(self, smm: AFSharedMemoryManager, dtype: np.dtype, handle: Handle=None):
 		# self.version = 0
-		if shm_name is None:
+		if handle is None:
 			''' To be used by server process ''' 
 			tmp = np.full(1, np.nan, dtype=dtype)
-			self.shm = smm.SharedMemory(size=tmp.nbytes)
-			self.data = np.ndarray(tmp.shape, dtype=dtype, buffer=self.shm.buf)
+			self.block = smm.alloc(tmp.nbytes)
+			self.data = self.block.ndarray(tmp.shape, dtype)
 			self.data[:] = tmp[:]
 		else:
 			''' To be used by client processes '''
-			self.shm = smm.SharedMemory(name=shm_name)
-			self.data = np.ndarray((1,), dtype=dtype, buffer=self.shm.buf)
+			self.block = smm.attach(handle)
+			self.data = self.block.ndarray((1,), dtype)
 
-	# def __setitem__(self):
-	# 	pass # TODO update version
+	def read(self, out: Struct):
+		''' Copy the current record into `out`. May observe a concurrent write partially; see VersionedSharedStruct. ''' 
+		out.data[0] = self.data[0]
 
 	def serialize(self) -> SerializedStruct:
 		''' Send to another process ''' 
-		return (wire_pickle(self.dtype), self.shm.name)
+		return (wire_pickle(self.dtype), self.block.handle)
+
+	def free(self, smm: AFSharedMemoryManager):
+		''' Release shared memory for reuse (creating process only) ''' 
+		smm.free(self.block)
 
 	def to_pure(self) -> Struct:
 		s = Struct(self.dtype)
-		s.set(self)
+		self.read(s)
 		return s
 
 	def copy(self, smm: AFSharedMemoryManager) -> 'SharedStruct':
@@ -124,7 +491,7 @@ class SharedStruct(Struct):
 	@staticmethod
 	def deserialize(smm: AFSharedMemoryManager, arg: SerializedStruct) -> 'SharedStruct':
 		''' Receive from another process ''' 
-		return SharedStruct(smm, wire_unpickle(arg[0]), shm_name=arg[1])
+		return SharedStruct(smm, wire_unpickle(arg[0]), handle=arg[1])
 
 	@staticmethod
 	def from_pure(smm: AFSharedMemoryManager, struct: Struct) -> 'SharedStruct':
@@ -133,15 +500,143 @@ class SharedStruct(Struct):
 		s.set(struct)
 		return s
 
+class VersionedSharedStruct(SharedStruct):
+	''' SharedStruct guarded by a sequence lock, so readers in other processes never observe a torn record. 
+	The writer makes the sequence counter odd while it writes and even once done; it never waits on readers.
+	Readers retry `read()` until they copy the record with the same even counter before and after.
+	Only one process may write. Same memory-ordering assumptions as SharedRing.
+	''' 
+	header_size = 8 # Sequence counter, in bytes
+
+	def __init__(self, smm: AFSharedMemoryManager, dtype: np.dtype, handle: Handle=None):
+		dtype = np.dtype(dtype)
+		if handle is None:
+			''' To be used by server process ''' 
+			self.block = smm.alloc(VersionedSharedStruct.header_size + dtype.itemsize)
+		else:
+			''' To be used by client processes '''
+			self.block = smm.attach(handle)
+		self.seq = self.block.ndarray(1, np.int64).data # memoryview: faster scalar access than np.ndarray
+		self.data = self.block.ndarray((1,), dtype, VersionedSharedStruct.header_size)
+		if handle is None:
+			self.seq[0] = 0
+			self.data[:] = np.full(1, np.nan, dtype=dtype)
+		self.n_retries = 0 # Reads which raced with a write
+
+	@property
+	def version(self) -> int:
+		''' Number of completed writes ''' 
+		return self.seq[0] // 2
+
+	def __setitem__(self, idx, val):
+		seq = self.seq[0]
+		self.seq[0] = seq + 1
+		self.data[0].__setitem__(idx, val)
+		self.seq[0] = seq + 2
+
+	def set(self, other: Union[Struct, np.void]):
+		seq = self.seq[0]
+		self.seq[0] = seq + 1
+		super().set(other)
+		self.seq[0] = seq + 2
+
+	def merge(self, other: Union[Struct, np.void]):
+		seq = self.seq[0]
+		self.seq[0] = seq + 1
+		self.data[0][other.dtype.names] = other[:]
+		self.seq[0] = seq + 2
+
+	def read(self, out: Struct) -> int:
+		''' Copy a consistent snapshot of the record into `out`. Returns its version. ''' 
+		while True:
+			seq = self.seq[0]
+			if seq & 1 == 0:
+				out.data[0] = self.data[0]
+				if self.seq[0] == seq:
+					return seq // 2
+			self.n_retries += 1
+
+	def serialize(self) -> SerializedVersionedStruct:
+		''' Send to another process ''' 
+		return (wire_pickle(self.dtype), self.block.handle, 'versioned')
+
+	def copy(self, smm: AFSharedMemoryManager) -> 'VersionedSharedStruct':
+		''' Create a non-linked copy of self ''' 
+		return VersionedSharedStruct.from_pure(smm, self.to_pure())
+
+	@staticmethod
+	def deserialize(smm: AFSharedMemoryManager, arg: SerializedVersionedStruct) -> 'VersionedSharedStruct':
+		''' Receive from another process ''' 
+		return VersionedSharedStruct(smm, wire_unpickle(arg[0]), handle=arg[1])
+
+	@staticmethod
+	def from_pure(smm: AFSharedMemoryManager, struct: Struct) -> 'VersionedSharedStruct':
+		''' Construct a shareable Struct from a pure one ''' 
+		s = VersionedSharedStruct(smm, struct.dtype)
+		s.set(struct)
+		return s
+
+
+
+class SharedBatch(VersionedSharedStruct):
+	''' Seqlock-protected Batch in shared memory, for unbuffered links from batched Emitters ''' 
+	def __init__(self, smm: AFSharedMemoryManager, dtype: np.dtype, capacity: int, handle: Handle=None):
+		self.capacity = capacity
+		super().__init__(smm, [('n', np.int64), ('rows', dtype, (capacity,))], handle=handle)
+		self.rows = self.data['rows'][0]
+		if handle is None:
+			self.data['n'] = 0
+
+	@property
+	def dtype(self):
+		''' Type of each row ''' 
+		return self.rows.dtype
+
+	def set(self, other: Batch):
+		seq = self.seq[0]
+		self.seq[0] = seq + 1
+		self.rows[:other.n] = other.numpy()
+		self.data['n'] = other.n
+		self.seq[0] = seq + 2
 
+	def read(self, out: Batch) -> int:
+		''' Copy a consistent snapshot of the rows into `out`. Returns its version. ''' 
+		while True:
+			seq = self.seq[0]
+			if seq & 1 == 0:
+				n = int(self.data['n'][0])
+				out.data[:n] = self.rows[:n]
+				if self.seq[0] == seq:
+					out.n = n
+					return seq // 2
+			self.n_retries += 1
+
+	def serialize(self) -> SerializedBatch:
+		''' Send to another process ''' 
+		return (wire_pickle(self.dtype), self.capacity, self.block.handle, 'batch')
+
+	@staticmethod
+	def deserialize(smm: AFSharedMemoryManager, arg: SerializedBatch) -> 'SharedBatch':
+		''' Receive from another process ''' 
+		return SharedBatch(smm, wire_unpickle(arg[0]), arg[1], handle=arg[2])
 
 ''' Utility methods ''' 
 
-SharedData = Union[SharedStruct, SharedStreamingArray]
+SharedData = Union[SharedStruct, VersionedSharedStruct, SharedBatch, SharedStreamingArray, SharedRing, SharedArray, SharedCredits]
 
 def deserialize_data(smm: AFSharedMemoryManager, ser_data: SerializedData):
 	# TODO very brittle
-	if len(ser_data) == 2: 
+	if ser_data[-1] == 'ring':
+		return SharedRing.deserialize(smm, ser_data)
+	elif ser_data[-1] == 'credits':
+		return SharedCredits.deserialize(smm, ser_data)
+	elif ser_data[-1] == 'versioned':
+		return VersionedSharedStruct.deserialize(smm, ser_data)
+	elif ser_data[-1] == 'batch':
+		return SharedBatch.deserialize(smm, ser_data)
+	elif ser_data[-1] == 'array':
+		return SharedArray.deserialize(smm, ser_data)
+	elif len(ser_data) == 2: 
 		return SharedStruct.deserialize(smm, ser_data)
 	else:
 		return SharedStreamingArray.deserialize(smm, ser_data)
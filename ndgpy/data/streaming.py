@@ -1,29 +1,30 @@
 ''' Data structures ''' 
 
-from typing import Union
+from typing import Union, Tuple
 import numpy as np
 
 from .base import Struct
 
 class StreamingDataFrame:
 	''' Streaming pd.DataFrame-like API with history. For use with numerical data types only. 
+	Rows live in a circular buffer of `buf_size + 1` slots: the head, and up to `buf_size` rows behind it.
 	TODO: fix this to use StreamingArray and allow per-column dtypes
 	''' 
 	def __init__(self, columns: list, dtype: np.dtype, buf_size = 100):
 		self.buf_size = buf_size 
-		self.size = buf_size*2
-		self.head_index = 0
+		self.slots = buf_size + 1
+		self.head_index = 0 # Rows advanced since creation
 		self.columns = dict(zip(columns, range(len(columns))))
-		self.data = np.empty((len(columns), self.size), dtype=dtype)
+		self.data = np.empty((len(columns), self.slots), dtype=dtype)
 		self.data[:] = np.nan
 
 	def set(self, k: str, i: int, v: float):
-		if self.head_index >= i:
-			self.data[self.columns[k], self.head_index-i] = v
+		if self.head_index >= i and i <= self.buf_size:
+			self.data[self.columns[k], (self.head_index-i) % self.slots] = v
 
 	def get(self, k: str, i: int, default=0):
-		if self.head_index >= i:
-			return self.data[self.columns[k], self.head_index-i]
+		if self.head_index >= i and i <= self.buf_size:
+			return self.data[self.columns[k], (self.head_index-i) % self.slots]
 		else:
 			return default
 
@@ -34,65 +35,126 @@ class StreamingDataFrame:
 		return np.imag(self.get(k, i, default))
 
 	def get_col(self, k: str):
-		return self.data[self.columns[k], :self.head_index+1]
+		''' Column, oldest first. A view unless the kept rows wrap around the buffer ''' 
+		col = self.data[self.columns[k]]
+		h = self.head_index % self.slots
+		start = h - self.length
+		if start >= 0:
+			return col[start:h+1]
+		return np.concatenate((col[start:], col[:h+1]))
 
 	def advance(self):
 		self.head_index += 1
-		if self.head_index == self.size:
-			self.data[:, 0:self.buf_size] = self.data[:, self.buf_size:]
-			self.data[:, self.buf_size:] = np.nan
-			self.head_index = self.buf_size
+		self.data[:, self.head_index % self.slots] = np.nan
+
+	def extend(self, rows: np.ndarray):
+		''' Set and advance past rows of structured array `rows` (oldest first, with a field per column) in one assignment per column ''' 
+		m = len(rows)
+		k = min(m, self.buf_size) # Rows still kept afterwards
+		idx = np.arange(self.head_index + m - k, self.head_index + m) % self.slots
+		for name, col in self.columns.items():
+			self.data[col, idx] = rows[name][m-k:]
+		self.head_index += m
+		self.data[:, self.head_index % self.slots] = np.nan
 
 	@property
 	def length(self):
-		return self.head_index
+		return min(self.head_index, self.buf_size)
 
 
 class StreamingArray:
-	''' Streaming np.array-like API with history. 1-dimensional representation. For use with numerical data types only. ''' 
+	''' Streaming np.array-like API with history. 1-dimensional representation. For use with numerical data types only. 
+	Records live in a circular buffer of `buf_size`, written backwards so that index `i` (newest first) is at `(head_index + i) % buf_size`;
+	consume() is O(1), and slices are views unless they wrap around the end of the buffer. consume() only steps back the slot of the newest 
+	record (`head`), with a compare rather than a modulo, and counts the laps of the buffer on wrapping; n_written is derived from both.
+	''' 
 	def __init__(self, dtype: np.dtype, buf_size: int):
 		self.buf_size = buf_size 
-		self.size = buf_size*2
-		self.head_index = self.size-1
-		self.data = np.full(self.size, np.nan, dtype=dtype)
+		self.head = 0 # Slot of the newest record, i.e. -n_written % buf_size
+		self.laps = 0 # Wraps of the head from slot 0 to the end
+		self.data = np.zeros(buf_size, dtype=dtype) # Unwritten records are never exposed
 
 	def consume(self, v: Union[Struct, np.void]):
 		''' Consume new data and advance head pointer ''' 
-		self.head_index -= 1
-		if self.head_index == -1:
-			self.data[self.buf_size:] = self.data[:self.buf_size]
-			self.data[:self.buf_size] = np.nan
-			self.head_index = self.buf_size - 1
-		if type(v) == np.void:
-			self.data[self.head_index] = v 
-		else:
-			self.data[self.head_index] = v.numpy()
+		i = self.head - 1
+		if i < 0:
+			i = self.buf_size - 1
+			self.laps += 1
+		self.data[i] = v if type(v) is np.void or not isinstance(v, Struct) else v.numpy() # Rows first, as isinstance() costs more
+		self.head = i
+
+	@property
+	def n_written(self) -> int:
+		''' Records consumed since creation ''' 
+		return self.laps * self.buf_size - self.head
+
+	@n_written.setter
+	def n_written(self, n: int):
+		self.head = -n % self.buf_size
+		self.laps = (n + self.head) // self.buf_size
+
+	def extend(self, arr: np.ndarray):
+		''' Consume records `arr` (oldest first) with at most two slice assignments ''' 
+		n, m = self.n_written, len(arr)
+		rev = arr[:-self.buf_size-1:-1] # Newest first; older records would be overwritten anyway
+		h = -(n + m) % self.buf_size # Head after
+		k = min(len(rev), self.buf_size - h)
+		self.data[h:h+k] = rev[:k]
+		self.data[:len(rev)-k] = rev[k:]
+		self.n_written = n + m
+
+	@property
+	def head_index(self) -> int:
+		return self.head
+
+	def bounds(self, start: int, stop: int):
+		if start is None: start = 0
+		if stop is None: stop = self.length-1
+		assert start >= 0 and stop >= 0 and stop >= start, 'Cannot use negative slice values in StreamingArray'
+		assert start <= self.length-1 and stop <= self.length-1, 'Slice out of bounds'
+		return start, stop
+
+	def segments(self, start: int=None, stop: int=None) -> Tuple[np.ndarray, np.ndarray]:
+		''' Records `start` to `stop` (inclusive, newest first) as two views; the second is empty unless the range wraps ''' 
+		start, stop = self.bounds(start, stop)
+		i, j = self.head_index + start, self.head_index + stop + 1
+		if j <= self.buf_size:
+			return self.data[i:j], self.data[:0]
+		if i >= self.buf_size:
+			return self.data[i-self.buf_size:j-self.buf_size], self.data[:0]
+		return self.data[i:], self.data[:j-self.buf_size]
+
+	def read(self, start: int=None, stop: int=None, out: np.ndarray=None) -> np.ndarray:
+		''' Copy records `start` to `stop` (inclusive, newest first) into the front of `out` (or a reused scratch buffer), and return that part.
+		The scratch buffer is overwritten by the next read().
+		''' 
+		a, b = self.segments(start, stop)
+		if out is None:
+			if not hasattr(self, 'scratch'):
+				self.scratch = np.empty(self.buf_size, dtype=self.dtype)
+			out = self.scratch
+		out[:len(a)] = a
+		out[len(a):len(a)+len(b)] = b
+		return out[:len(a)+len(b)]
 
 	def __getitem__(self, slice):
 		if type(slice) == int:
 			assert slice >= 0, 'Cannot use negative index in StreamingArray'
 			assert slice <= self.length-1, 'Slice out of bounds'
-			return self.data[self.head_index+slice]
+			return self.data[(self.head_index+slice) % self.buf_size]
 		else:
-			start, stop = slice.start, slice.stop 
-			if start is None: start = 0
-			if stop is None: stop = self.head_index
-			assert start >= 0 and stop >= 0 and stop >= start, 'Cannot use negative slice values in StreamingArray'
-			assert start <= self.length-1 and stop <= self.length-1, 'Slice out of bounds'
-			return self.data[self.head_index+start:self.head_index+stop+1:slice.step]
+			a, b = self.segments(slice.start, slice.stop)
+			if len(b) == 0:
+				return a[::slice.step]
+			return np.concatenate((a, b))[::slice.step]
 
 	def __len__(self):
 		return self.length
 
 	@property
 	def length(self):
-		return self.size - self.head_index - 1
-
-	@property
-	def will_reshuffle(self):
-		return self.head_index == 0
+		return min(self.n_written, self.buf_size)
 
 	@property
 	def dtype(self):
 		return self.data.dtype
-	
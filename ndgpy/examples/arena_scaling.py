@@ -0,0 +1,63 @@
+''' Time to create (in the layout process) and attach (in a context process) the shared memory of N unbuffered links,
+and the number of /dev/shm segments used: one segment per struct (previous scheme) vs. arenas.
+
+Run `python -m ndgpy.examples.arena_scaling`
+'''
+
+import numpy as np
+import multiprocessing as mp
+import os
+import time
+from multiprocessing.shared_memory import SharedMemory
+
+from ndgpy.data import *
+
+dtype = np.dtype([('t', np.float64), ('x', np.float64), ('y', np.float64), ('z', np.float64)])
+
+class SegmentPerBlock(AFSharedMemoryManager):
+	''' Previous scheme: a tracked segment per allocation, attached with a manager connection each time '''
+	def alloc(self, size: int) -> Block:
+		return Block(self.SharedMemory(size=size), 0, size)
+
+	def attach(self, handle: Handle) -> Block:
+		name, offset, size = handle
+		with self._Client(self._address, authkey=self._authkey):
+			shm = SharedMemory(name=name)
+		self.client_shms[name + str(len(self.client_shms))] = shm
+		return Block(shm, offset, size)
+
+def n_segments() -> int:
+	return len(os.listdir('/dev/shm'))
+
+def attach_all(manager: type, sers: list, results):
+	with manager() as smm:
+		t0 = time.perf_counter()
+		links = [deserialize_data(smm, ser) for ser in sers]
+		results.put(time.perf_counter() - t0)
+		del links
+
+def run(manager: type, n: int) -> str:
+	before = n_segments()
+	with manager() as smm:
+		t0 = time.perf_counter()
+		links = []
+		try:
+			for _ in range(n):
+				links.append(VersionedSharedStruct(smm, dtype))
+		except OSError as e: # Each segment holds open file descriptors
+			return f'{manager.__name__:>21} n={n:<6}: failed after {len(links)} links ({e.strerror})'
+		sers = [l.serialize() for l in links]
+		t_create = time.perf_counter() - t0
+		segments = n_segments() - before
+		results = mp.Queue()
+		p = mp.Process(target=attach_all, args=(manager, sers, results))
+		p.start()
+		t_attach = results.get()
+		p.join()
+		del links
+	return f'{manager.__name__:>21} n={n:<6}: create {t_create*1e3:>7.0f} ms, attach {t_attach*1e3:>7.0f} ms, {segments:>6} segments'
+
+if __name__ == '__main__':
+	for n in (1000, 10000):
+		for manager in (SegmentPerBlock, AFSharedMemoryManager):
+			print(run(manager, n))
@@ -0,0 +1,58 @@
+''' Rows/sec of a sensor feed through Lambda -> Integrator -> Publisher, one row per activation vs. micro-batches
+
+Run `python -m ndgpy.examples.batch_throughput`
+'''
+
+import numpy as np
+import asyncio
+import time
+import zmq.asyncio as azmq
+
+from ndgpy.data import *
+from ndgpy.network import *
+from ndgpy.nodes.numeric import *
+from ndgpy.plan import ExecPlan
+
+class Sensor(Emitter):
+	def __init__(self, batch: int=None):
+		super().__init__(np.dtype([('f0', np.float64)]), batch=batch)
+
+	async def compute(self):
+		if self.batch_size is None:
+			self.output['f0'] = np.random.uniform()
+		else:
+			self.output.n = self.batch_size
+			self.output['f0'] = np.random.uniform(size=self.batch_size)
+
+async def rate(batch: int, smm: AFSharedMemoryManager, doorbell: Doorbell, n_rows: int=200000) -> float:
+	sensor, double, integ = Sensor(batch), Lambda(lambda x: 2*x, batch=batch), Integrator(batch=batch)
+	if batch is None:
+		link = SharedStreamingArray(smm, sensor.dtype, 1024)
+	else:
+		link = SharedBatch(smm, sensor.dtype, batch)
+	pub = Publisher(sensor.id, link.serialize())
+	await pub.start({Resource.smm: smm, Resource.doorbell: doorbell})
+	sensor.sends_to(double)
+	double.sends_to(integ)
+	integ.sends_to(pub)
+	plan = ExecPlan({n.id: n for n in (sensor, double, integ, pub)})
+	n_activations = n_rows // (batch or 1)
+	t0 = time.perf_counter()
+	for _ in range(n_activations):
+		await plan.activate(sensor.id)
+	return n_activations * (batch or 1) / (time.perf_counter() - t0)
+
+async def main():
+	with AFSharedMemoryManager() as smm:
+		zmq_ctx = azmq.Context()
+		doorbell = Doorbell(zmq_ctx, 'bench')
+		base = await rate(None, smm, doorbell)
+		print(f'row mode: {base:.0f} rows/sec')
+		for batch in (16, 256, 4096):
+			r = await rate(batch, smm, doorbell)
+			print(f'batch {batch:>5}: {r:.0f} rows/sec ({r / base:.0f}x)')
+		doorbell.close()
+		zmq_ctx.destroy(linger=0)
+
+if __name__ == '__main__':
+	asyncio.run(main())
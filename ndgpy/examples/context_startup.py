@@ -0,0 +1,64 @@
+''' Time to first message for layouts of 1 to 64 contexts: from the first new_context() until every context has answered a message.
+Contexts are started as new processes, or taken from a ContextPool warmed up beforehand; the layout is then destroyed (see
+Layout.destroy_context()), which recycles pooled processes, and restarted on the same pool. Also reports how long the pool took to warm up.
+
+Run `python -m ndgpy.examples.context_startup [max contexts]`
+'''
+
+import asyncio
+import multiprocessing as mp
+import sys
+import time
+
+from ndgpy.layout import Layout
+from ndgpy.context import ContextPool
+
+class Startup(Layout):
+	def __init__(self, n: int, pool: ContextPool, results: list):
+		super().__init__()
+		self.n = n
+		self.pool = pool
+		self.results = results
+
+	async def setup(self):
+		t0 = time.perf_counter()
+		ctx_ids = [self.new_context() for _ in range(self.n)]
+		await asyncio.gather(*(self.sync(ctx_id) for ctx_id in ctx_ids))
+		self.results.append(time.perf_counter() - t0)
+		for ctx_id in ctx_ids:
+			await self.destroy_context(ctx_id)
+		raise SystemExit
+
+def first_message(n: int, pool: ContextPool=None) -> float:
+	results = []
+	try:
+		Startup(n, pool, results).start()
+	except SystemExit:
+		pass
+	return results[0]
+
+def bench(n: int, results):
+	spawned = first_message(n)
+	t0 = time.perf_counter()
+	pool = ContextPool(n)
+	pool.wait()
+	warm = time.perf_counter() - t0
+	pooled = first_message(n, pool)
+	pool.wait() # Recycled
+	restarted = first_message(n, pool)
+	pool.wait()
+	pool.close()
+	results.put((spawned, warm, pooled, restarted))
+
+if __name__ == '__main__':
+	max_n = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+	n = 1
+	while n <= max_n:
+		results = mp.Queue()
+		proc = mp.Process(target=bench, args=(n, results))
+		proc.start()
+		spawned, warm, pooled, restarted = results.get()
+		proc.join()
+		print(f'{n:3d} contexts: {spawned * 1e3:7.1f} ms spawned; pooled {pooled * 1e3:6.1f} ms, restarted {restarted * 1e3:6.1f} ms '
+			f'(warm-up {warm * 1e3:7.1f} ms)')
+		n *= 4
@@ -0,0 +1,105 @@
+''' Time to deploy layouts of 100 to 5000 nodes onto 4 contexts, sending one message per operation or one transaction per context
+(see Layout.transaction()). Nodes are chains of `depth` Relays behind an idle root, within one context each. Deployment is timed from
+the first add() until every context has applied it all. Also reports the cost per node of the control messages' encoding: the former
+latin1 text of the pickle in JSON, against the raw pickle frame.
+One message per operation takes time quadratic in the size of a context (each one recompiles its plan), so is only run up to 
+`per_op_max` nodes.
+
+Run `python -m ndgpy.examples.deploy_time [max nodes]`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import cloudpickle as pickle
+import ujson
+import sys
+import time
+
+from ndgpy.layout import Layout, ContextID
+from ndgpy.utils import wire_pickle, wire_unpickle
+from ndgpy.bench.scenarios import Relay
+from ndgpy.nodes.numeric import *
+
+n_contexts = 4
+depth = 10
+per_op_max = 1000
+dtype = np.dtype([('f0', np.float64)])
+
+class Idle(Emitter):
+	''' Never emits '''
+	def __init__(self):
+		super().__init__(dtype)
+
+	async def compute(self):
+		await asyncio.sleep(3600)
+
+class Deploy(Layout):
+	def __init__(self, n: int, batched: bool, results):
+		super().__init__()
+		self.n = n
+		self.batched = batched
+		self.results = results
+
+	async def setup(self):
+		ctx_ids = [self.new_context() for _ in range(n_contexts)]
+		for ctx_id in ctx_ids:
+			await self.sync(ctx_id) # Started
+		t0 = time.perf_counter()
+		if self.batched:
+			async with self.transaction():
+				await self.build(ctx_ids)
+		else:
+			await self.build(ctx_ids)
+		for ctx_id in ctx_ids:
+			await self.sync(ctx_id)
+		self.results.put(time.perf_counter() - t0)
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'exit': True})
+		for ctx in self.contexts.values():
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+		raise SystemExit
+
+	async def build(self, ctx_ids: List[ContextID]):
+		for c in range(self.n // depth):
+			ctx_id = ctx_ids[c % len(ctx_ids)]
+			chain = [Idle()] + [Relay(dtype) for _ in range(depth - 1)]
+			for node in chain:
+				await self.add(node, ctx_id)
+			for a, b in zip(chain, chain[1:]):
+				await self.connect(a.id, b.id)
+
+def run(n: int, batched: bool) -> float:
+	results = mp.Queue()
+	proc = mp.Process(target=Deploy(n, batched, results).start)
+	proc.start()
+	elapsed = results.get()
+	proc.join()
+	return elapsed
+
+def encoding(n: int=2000) -> Tuple[float, float]:
+	''' Microseconds per node to encode & decode an add() message, the former way and the raw way '''
+	node = Relay(dtype)
+	t0 = time.perf_counter()
+	for _ in range(n):
+		wire_unpickle(ujson.loads(ujson.dumps({'add': wire_pickle(node)}))['add'])
+	t1 = time.perf_counter()
+	for _ in range(n):
+		ujson.loads(ujson.dumps({'ops': [{'add': node.id, 'payload': 0}]}))
+		pickle.loads(pickle.dumps(node))
+	t2 = time.perf_counter()
+	return (t1 - t0) / n * 1e6, (t2 - t1) / n * 1e6
+
+if __name__ == '__main__':
+	max_n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+	old, new = encoding()
+	print(f'encoding per node: {old:.1f} us as latin1 in JSON, {new:.1f} us as a raw frame')
+	for n in (100, 1000, 5000):
+		if n > max_n:
+			break
+		batched = run(n, True)
+		if n > per_op_max:
+			print(f'{n:5d} nodes: {batched:6.2f} s in a transaction')
+			continue
+		per_op = run(n, False)
+		print(f'{n:5d} nodes: {batched:6.2f} s in a transaction, {per_op:6.2f} s one message per operation ({per_op / batched:.1f}x)')
@@ -0,0 +1,117 @@
+''' Wakeup latency and file-descriptor count vs. number of published nodes:
+one PUB/SUB socket pair per published node (previous Publisher/Subscriber design) vs. one Doorbell per context.
+
+Run `python -m ndgpy.examples.doorbell_scaling`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import os
+import time
+import zmq
+import zmq.asyncio as azmq
+from multiprocessing.shared_memory import SharedMemory
+
+from ndgpy.network import *
+
+rounds = 20
+
+def n_fds() -> int:
+	return len(os.listdir('/proc/self/fd'))
+
+def producer(scheme: str, n: int, shm_name: str, ready, go, fds):
+	async def main():
+		shm = SharedMemory(name=shm_name)
+		stamps = np.ndarray(n, dtype=np.int64, buffer=shm.buf)
+		zmq_ctx = azmq.Context()
+		zmq_ctx.MAX_SOCKETS = 2*n + 16
+		if scheme == 'socket':
+			socks = []
+			for i in range(n):
+				socks.append(zmq_ctx.socket(zmq.PUB))
+				socks[-1].bind(f'{mc_url_base}bench_{i}')
+		else:
+			doorbell = Doorbell(zmq_ctx, 'bench_pub')
+		fds.put(n_fds())
+		ready.set()
+		go.wait()
+		for _ in range(rounds):
+			for i in range(n):
+				stamps[i] = time.monotonic_ns()
+				if scheme == 'socket':
+					await socks[i].send(b'')
+				else:
+					doorbell.ring(str(i))
+			await asyncio.sleep(0.02)
+		zmq_ctx.destroy(linger=0)
+		del stamps
+		shm.close()
+	asyncio.run(main())
+
+def consumer(scheme: str, n: int, shm_name: str, ready, fds, results):
+	async def main():
+		shm = SharedMemory(name=shm_name)
+		stamps = np.ndarray(n, dtype=np.int64, buffer=shm.buf)
+		zmq_ctx = azmq.Context()
+		zmq_ctx.MAX_SOCKETS = 2*n + 16
+		latencies = []
+		if scheme == 'socket':
+			socks = []
+			for i in range(n):
+				socks.append(zmq_ctx.socket(zmq.SUB))
+				socks[-1].connect(f'{mc_url_base}bench_{i}')
+				socks[-1].setsockopt(zmq.SUBSCRIBE, b'')
+			async def wait(i):
+				await socks[i].recv()
+		else:
+			doorbell = Doorbell(zmq_ctx, 'bench_sub')
+			events = [doorbell.listen('bench_pub', str(i)) for i in range(n)]
+			async def wait(i):
+				await events[i].wait()
+				events[i].clear()
+		async def listener(i):
+			while True:
+				await wait(i)
+				latencies.append(time.monotonic_ns() - stamps[i])
+		tasks = [asyncio.create_task(listener(i)) for i in range(n)]
+		fds.put(n_fds())
+		ready.set()
+		t0 = time.monotonic()
+		while len(latencies) < rounds*n and time.monotonic() - t0 < 10:
+			await asyncio.sleep(0.1)
+		for task in tasks:
+			task.cancel()
+		results.put(np.array(latencies))
+		zmq_ctx.destroy(linger=0)
+		del stamps
+		shm.close()
+	asyncio.run(main())
+
+def run(scheme: str, n: int) -> str:
+	shm = SharedMemory(create=True, size=8*n)
+	pub_ready, sub_ready, go, fds, results = mp.Event(), mp.Event(), mp.Event(), mp.Queue(), mp.Queue()
+	procs = [
+		mp.Process(target=producer, args=(scheme, n, shm.name, pub_ready, go, fds)),
+		mp.Process(target=consumer, args=(scheme, n, shm.name, sub_ready, fds, results)),
+	]
+	procs[0].start()
+	pub_ready.wait()
+	procs[1].start()
+	sub_ready.wait()
+	time.sleep(0.5) # Let subscriptions propagate
+	go.set()
+	latencies = results.get()
+	n_fds = fds.get() + fds.get()
+	for p in procs:
+		p.join()
+	shm.unlink()
+	return (
+		f'{scheme:>8} n={n:<5}: {n_fds:>5} fds, {len(latencies) / (rounds*n):>6.1%} woken, '
+		f'latency p50 {np.percentile(latencies, 50) / 1e3:.0f} us, p99 {np.percentile(latencies, 99) / 1e3:.0f} us'
+	)
+
+if __name__ == '__main__':
+	for n in (10, 100, 1000):
+		for scheme in ('socket', 'doorbell'):
+			print(run(scheme, n))
@@ -0,0 +1,59 @@
+''' Overhead per emission of running roots, for 1 to 100 roots in one context which do no work: each compute just yields once to the
+event loop, as `Noise(delta=0.)` does. Reports the emissions per second of all roots together, and the microseconds each took.
+
+Run `python -m ndgpy.examples.emitter_overhead`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+
+from ndgpy.layout import Layout
+from ndgpy.nodes.numeric import *
+
+measure_time = 4.
+
+class Yield(Emitter):
+	''' Emits as fast as it is run '''
+	def __init__(self):
+		super().__init__(np.dtype([('f0', np.float64)]))
+
+	async def compute(self):
+		await asyncio.sleep(0)
+
+class Roots(Layout):
+	def __init__(self, n: int, results):
+		super().__init__()
+		self.n = n
+		self.results = results
+
+	async def setup(self):
+		ctx = self.new_context()
+		for _ in range(self.n):
+			await self.add(Yield(), ctx)
+
+	async def run(self):
+		await asyncio.sleep(1.5)
+		n0 = self.emissions()
+		await asyncio.sleep(measure_time)
+		self.results.put((self.emissions() - n0) / measure_time)
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'exit': True})
+		for ctx in self.contexts.values():
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+		raise SystemExit
+
+	def emissions(self) -> int:
+		return sum(r['activations'] for r in self.stats())
+
+def run(n: int):
+	results = mp.Queue()
+	proc = mp.Process(target=Roots(n, results).start)
+	proc.start()
+	rate = results.get()
+	proc.join()
+	print(f'{n:4d} roots: {rate:8.0f} emissions/sec, {1e6 / rate:5.2f} us per emission')
+
+if __name__ == '__main__':
+	for n in (1, 10, 100):
+		run(n)
@@ -0,0 +1,33 @@
+''' Rows/sec ingesting 10k-row batches into a SharedStreamingArray (as a buffered Writer does): consume() per row vs. extend()
+
+Run `python -m ndgpy.examples.extend_throughput`
+'''
+
+import numpy as np
+import time
+
+from ndgpy.data import *
+
+dtype = np.dtype([('t', np.float64), ('x', np.float64), ('y', np.float64), ('z', np.float64)])
+batch, n_batches = 10000, 20
+
+def rate(arr: StreamingArray, bulk: bool) -> float:
+	rows = np.zeros(batch, dtype=dtype)
+	t0 = time.perf_counter()
+	for _ in range(n_batches):
+		if bulk:
+			arr.extend(rows)
+		else:
+			for row in rows:
+				arr.consume(row)
+	return batch * n_batches / (time.perf_counter() - t0)
+
+if __name__ == '__main__':
+	with AFSharedMemoryManager() as smm:
+		for buf_size in (1000, 100000):
+			for name, make in (
+				('StreamingArray', lambda: StreamingArray(dtype, buf_size)), 
+				('SharedStreamingArray', lambda: SharedStreamingArray(smm, dtype, buf_size)),
+			):
+				rows, bulk = rate(make(), False), rate(make(), True)
+				print(f'{name:>20} buf_size={buf_size:<7}: consume {rows:>10.0f} rows/sec, extend {bulk:>11.0f} rows/sec ({bulk / rows:.0f}x)')
@@ -0,0 +1,130 @@
+''' Samples/sec of the filters in nodes/filters.py (one record per activation, and in Batches) vs. naive per-sample Python
+which recomputes over a deque of the window, with the ratio of each to naive. Also checks all three agree.
+One record per activation costs at least a call of an async compute (about 0.5us here); filters doing less work than that per
+sample (EWMA, Downsample) are slower than a bare Python closure per record, and only worth it in Batches.
+
+Run `python -m ndgpy.examples.filter_cost`
+'''
+
+import numpy as np
+import asyncio
+import time
+from collections import deque
+
+from ndgpy.nodes.filters import *
+
+n_samples = 20000
+batch = 1024
+n, alpha, taps, factor = 64, 0.05, np.hanning(16), 8
+b, a = [0.2, 0.3, 0.2], [1., -0.5, 0.2]
+
+def naive_mean():
+	w = deque(maxlen=n)
+	def f(x):
+		w.append(x)
+		return sum(w) / len(w)
+	return f
+
+def naive_var():
+	w = deque(maxlen=n)
+	def f(x):
+		w.append(x)
+		mu = sum(w) / len(w)
+		return sum((v - mu)**2 for v in w) / len(w)
+	return f
+
+def naive_ewma():
+	y = [None]
+	def f(x):
+		y[0] = x if y[0] is None else y[0] + alpha * (x - y[0])
+		return y[0]
+	return f
+
+def naive_fir():
+	w = deque([0.] * len(taps), maxlen=len(taps))
+	def f(x):
+		w.appendleft(x)
+		return sum(t * v for t, v in zip(taps, w))
+	return f
+
+def naive_iir():
+	xs, ys = deque([0.] * len(b), maxlen=len(b)), deque([0.] * (len(a) - 1), maxlen=len(a) - 1)
+	def f(x):
+		xs.appendleft(x)
+		y = sum(c * v for c, v in zip(b, xs)) - sum(c * v for c, v in zip(a[1:], ys))
+		ys.appendleft(y)
+		return y
+	return f
+
+def naive_downsample():
+	block = []
+	def f(x):
+		block.append(x)
+		if len(block) == factor:
+			y = sum(block) / factor
+			block.clear()
+			return y
+	return f
+
+cases = {
+	'RollingMean': (naive_mean, lambda **kw: RollingMean(n, **kw)),
+	'RollingVariance': (naive_var, lambda **kw: RollingVariance(n, **kw)),
+	'EWMA': (naive_ewma, lambda **kw: EWMA(alpha, **kw)),
+	'FIR': (naive_fir, lambda **kw: FIR(taps, **kw)),
+	'IIR': (naive_iir, lambda **kw: IIR(b, a, **kw)),
+	'Downsample': (naive_downsample, lambda **kw: Downsample(factor, **kw)),
+}
+
+def speedup(t_naive: float, t: float) -> str:
+	''' Rate relative to naive; under 1x is a slowdown ''' 
+	r = t_naive / t
+	return f'{r:.0f}x' if r >= 10 else f'{r:.2f}x'
+
+async def run_rows(node: Filter, xs: np.ndarray) -> list:
+	value, out = Struct([('f0', np.float64)]), []
+	x_view, y_view = value.data['f0'], node.output.data['f0'] # As Filter.compute, to time the filter rather than Struct access
+	for x in xs.tolist():
+		x_view[0] = x
+		if await node.compute(value) is not False:
+			out.append(y_view.item(0))
+	return out
+
+async def run_batches(node: Filter, xs: np.ndarray) -> list:
+	value, out = Batch([('f0', np.float64)], batch), []
+	for i in range(0, len(xs), batch):
+		value.n = len(xs[i:i+batch])
+		value['f0'] = xs[i:i+batch]
+		if await node.compute(value) is not False:
+			out.extend(node.output['f0'])
+	return out
+
+async def main():
+	xs = np.cumsum(np.random.normal(size=n_samples)) + 1e3
+	for name, (naive, node) in cases.items():
+		f = naive()
+		t0 = time.perf_counter()
+		expected = [y for y in map(f, xs) if y is not None]
+		t_naive = time.perf_counter() - t0
+		t0 = time.perf_counter()
+		rows = await run_rows(node(), xs)
+		t_rows = time.perf_counter() - t0
+		t0 = time.perf_counter()
+		batches = await run_batches(node(batch=batch), xs)
+		t_batches = time.perf_counter() - t0
+		assert np.allclose(rows, expected, rtol=1e-6, atol=1e-6), f'{name}: row mode mismatch'
+		assert np.allclose(batches, expected, rtol=1e-6, atol=1e-6), f'{name}: batch mode mismatch'
+		print(
+			f'{name:>16}: naive {n_samples / t_naive:>9.0f}/sec, '
+			f'rows {n_samples / t_rows:>9.0f}/sec ({speedup(t_naive, t_rows)}), batches {n_samples / t_batches:>10.0f}/sec ({speedup(t_naive, t_batches)})'
+		)
+	fft, value = WindowedFFT(n, hop=n), Struct([('f0', np.float64)])
+	t0 = time.perf_counter()
+	for x in xs:
+		value['f0'] = x
+		await fft.compute(value)
+	end = n_samples // n * n # Last emission
+	assert np.allclose(fft.output['f0'], np.abs(np.fft.rfft(xs[end-n:end] * np.hanning(n)))), 'WindowedFFT mismatch'
+	print(f'{"WindowedFFT":>16}: rows {n_samples / (time.perf_counter() - t0):>9.0f}/sec (n={n}, hop={n})')
+
+if __name__ == '__main__':
+	asyncio.run(main())
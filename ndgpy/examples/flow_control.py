@@ -0,0 +1,105 @@
+''' Flow control policies under a 10x rate mismatch across contexts.
+A producer emits 10x faster than a consumer in another context takes records (it waits `service_time` per record), over a ring or a
+buffered link of `window` records. For each policy (see Flow), reports the producer's and the consumer's rates, the records dropped
+(by the writer or the reader), and the latency from emission to consumption.
+
+Run `python -m ndgpy.examples.flow_control`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import time
+
+from ndgpy.layout import Layout
+from ndgpy.nodes.boundary import Flow
+from ndgpy.nodes.numeric import *
+
+service_time = 1e-3
+mismatch = 10
+window = 64
+measure_time = 4.
+record_dtype = np.dtype([('k', np.int64), ('t', np.int64)])
+
+class Tick(Emitter):
+	''' Emits a counter & its emission time every `period` seconds on schedule '''
+	def __init__(self, period: float):
+		self.period = period
+		self.next = None
+		self.k = 0
+		super().__init__(record_dtype)
+
+	async def compute(self):
+		t = time.monotonic()
+		self.next = t if self.next is None else self.next + self.period
+		if self.next > t:
+			await asyncio.sleep(self.next - t)
+		self.output['k'] = self.k
+		self.output['t'] = time.monotonic_ns()
+		self.k += 1
+
+class Consumer(Collector, Resourced):
+	''' Records the latency of each input into a shared array, then takes `service_time` '''
+	def __init__(self, latencies: SerializedData):
+		self.latencies = latencies
+		super().__init__()
+
+	@property
+	def rspec(self):
+		return {Resource.smm}
+
+	async def start(self, res: Resources):
+		await Resourced.start(self, res)
+		self.shared = deserialize_data(res[Resource.smm], self.latencies)
+
+	async def compute(self, values):
+		self.shared.consume(time.monotonic_ns() - values[0]['t'])
+		await asyncio.sleep(service_time)
+
+class Mismatch(Layout):
+	def __init__(self, kind: str, flow: Flow, results):
+		super().__init__()
+		self.kind = kind
+		self.flow = flow
+		self.results = results
+
+	async def setup(self):
+		a, b = self.new_context(), self.new_context()
+		self.latencies = SharedStreamingArray(self.smm, np.int64, 1 << 16)
+		self.tick, self.consumer = Tick(service_time / mismatch), Consumer(self.latencies.serialize())
+		await self.add(self.tick, a)
+		await self.add(self.consumer, b)
+		size = {'ring_size': window} if self.kind == 'ring' else {'buffer_size': window}
+		await self.connect(self.tick.id, self.consumer.id, flow=self.flow, **size)
+
+	async def run(self):
+		await asyncio.sleep(1.5)
+		n0 = self.latencies.n_written
+		await asyncio.sleep(measure_time)
+		n = self.latencies.n_written - n0
+		lat = self.latencies[0:min(n, self.latencies.buf_size)-1] / 1e6
+		stats = self.stats()
+		rate = lambda n_id: next((r['rate'] for r in stats if r['id'] == n_id), np.nan)
+		dropped = sum(r['dropped'] for r in stats if r['type'].endswith(('Publisher', 'Subscriber')))
+		self.results.put((rate(self.tick.id), n / measure_time, dropped, np.median(lat), np.percentile(lat, 99)))
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'exit': True})
+		for ctx in self.contexts.values():
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+		raise SystemExit
+
+def run(kind: str, flow: Flow):
+	results = mp.Queue()
+	proc = mp.Process(target=Mismatch(kind, flow, results).start)
+	proc.start()
+	produced, consumed, dropped, p50, p99 = results.get()
+	proc.join()
+	print(
+		f'{kind:>8} {flow.name:>12}: produced {produced:6.0f}/sec, consumed {consumed:5.0f}/sec, {dropped:7d} dropped, '
+		f'latency {p50:7.1f} ms median, {p99:7.1f} ms p99'
+	)
+
+if __name__ == '__main__':
+	for kind in ('ring', 'buffered'):
+		for flow in Flow:
+			run(kind, flow)
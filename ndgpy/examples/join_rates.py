@@ -0,0 +1,80 @@
+''' Join policies under a 100x rate mismatch (see Join).
+A fast ticker feeds a join next to it, along with a slow ticker (a parameter stream, say) in another context. Both emit their scheduled
+time; an aligned join matches them within half a fast period. For each policy, reports the rates of the fast ticker and of the join.
+With Join.all the join runs at the slow rate, and with Join.any / Join.trigger at the fast one.
+
+Run `python -m ndgpy.examples.join_rates`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import time
+
+from ndgpy.layout import Layout
+from ndgpy.nodes.numeric import *
+
+fast_period = 1e-3
+slow_period = 0.1
+measure_time = 4.
+
+class Tick(Emitter):
+	''' Emits its scheduled time every `period` seconds on schedule '''
+	def __init__(self, period: float):
+		self.period = period
+		self.next = None
+		super().__init__(np.dtype([('t', np.float64)]))
+
+	async def compute(self):
+		t = time.monotonic()
+		self.next = t if self.next is None else self.next + self.period
+		if self.next > t:
+			await asyncio.sleep(self.next - t)
+		self.output['t'] = self.next
+
+class Count(Collector):
+	async def compute(self, values):
+		pass
+
+class Joined(Layout):
+	def __init__(self, join: Join, results):
+		super().__init__()
+		self.join = join
+		self.results = results
+
+	async def setup(self):
+		a, b = self.new_context(), self.new_context()
+		self.fast, slow, self.count = Tick(fast_period), Tick(slow_period), Count()
+		self.count.set_join(self.join, trigger=self.fast.id, field='t', tolerance=fast_period / 2)
+		await self.add(self.fast, a)
+		await self.add(self.count, a)
+		await self.add(slow, b)
+		await self.connect(self.fast.id, self.count.id)
+		await self.connect(slow.id, self.count.id)
+
+	async def run(self):
+		await asyncio.sleep(1.5)
+		n0 = self.activations()
+		await asyncio.sleep(measure_time)
+		n = self.activations()
+		self.results.put(tuple((n[k] - n0[k]) / measure_time for k in (self.fast.id, self.count.id)))
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'exit': True})
+		for ctx in self.contexts.values():
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+		raise SystemExit
+
+	def activations(self) -> Dict[NodeID, int]:
+		return {r['id']: r['activations'] for r in self.stats()}
+
+def run(join: Join):
+	results = mp.Queue()
+	proc = mp.Process(target=Joined(join, results).start)
+	proc.start()
+	fast, joined = results.get()
+	proc.join()
+	print(f'{join.name:>8}: fast {fast:5.0f}/sec, join {joined:5.0f}/sec')
+
+if __name__ == '__main__':
+	for join in Join:
+		run(join)
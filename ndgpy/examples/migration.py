@@ -0,0 +1,160 @@
+''' Live migration of a running node between contexts, and rebalancing from telemetry.
+
+1. A 2 kHz counter feeds a rolling mean over ring links, which feeds a checker. The mean is moved around three contexts
+(between the one the counter and checker run in, where its edges are local, and two others) while running. The checker counts
+the outputs which do not follow on from the last one: messages lost or repeated, or windows broken by losing the mean's history.
+Reports those with the pause of each move.
+
+2. A ticker feeds two heavy nodes in one context, next to an idle one. With `rebalance_period` set, the Layout moves one of them
+over once the busy context runs above capacity. Reports the CPU use of each context, and where the heavy nodes ended up.
+
+Run `python -m ndgpy.examples.migration`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import time
+
+from ndgpy.layout import Layout
+from ndgpy.nodes.numeric import *
+
+class Tick(Emitter):
+	''' Emits a counter every `period` seconds on schedule '''
+	def __init__(self, period: float):
+		self.period = period
+		self.next = None
+		self.k = 0
+		super().__init__(np.dtype([('f0', np.float64)]))
+
+	async def compute(self):
+		t = time.monotonic()
+		self.next = t if self.next is None else self.next + self.period
+		if self.next > t:
+			await asyncio.sleep(self.next - t)
+		self.output['f0'] = self.k
+		self.k += 1
+
+class Mean(Router):
+	''' Mean of the last `n` inputs, kept in a StreamingArray ''' 
+	def __init__(self, n: int):
+		self.window = StreamingArray(np.float64, n)
+		super().__init__(np.dtype([('f0', np.float64)]))
+
+	async def compute(self, values):
+		self.window.consume(values[0]['f0'])
+		if len(self.window) < self.window.buf_size:
+			return False
+		self.output['f0'] = self.window[:].mean()
+
+class Check(Collector, Resourced):
+	''' Counts inputs, and those which are not the last one plus 1, into a shared record '''
+	def __init__(self, counts: SerializedData):
+		self.counts = counts
+		self.last = None
+		super().__init__()
+
+	@property
+	def rspec(self):
+		return {Resource.smm}
+
+	async def start(self, res: Resources):
+		await Resourced.start(self, res)
+		self.shared = deserialize_data(res[Resource.smm], self.counts)
+
+	async def compute(self, values):
+		x = values[0]['f0']
+		if self.last is not None and abs(x - self.last - 1) > 1e-6:
+			self.shared['breaks'] += 1
+		self.shared['received'] += 1
+		self.last = x
+
+counts_dtype = np.dtype([('received', np.int64), ('breaks', np.int64)])
+
+class Moves(Layout):
+	def __init__(self, results, moves: int=12):
+		super().__init__()
+		self.results = results
+		self.moves = moves
+
+	async def setup(self):
+		home, a, b = self.new_context(), self.new_context(), self.new_context()
+		self.route = [home, a, b]
+		self.counts = SharedStruct(self.smm, counts_dtype)
+		self.counts['received'], self.counts['breaks'] = 0, 0
+		tick, self.mean, check = Tick(5e-4), Mean(8), Check(self.counts.serialize())
+		await self.add(tick, home)
+		await self.add(check, home)
+		await self.add(self.mean, a)
+		await self.connect(tick.id, self.mean.id, ring_size=4096)
+		await self.connect(self.mean.id, check.id, ring_size=4096)
+
+	async def run(self):
+		await asyncio.sleep(1)
+		pauses = []
+		for i in range(self.moves):
+			dst = self.route[(i + 2) % len(self.route)] # a -> home -> b -> a -> ...
+			pauses.append(await self.migrate(self.mean.id, dst))
+			await asyncio.sleep(0.3)
+		await asyncio.sleep(1)
+		self.results.put((int(self.counts['received']), int(self.counts['breaks']), pauses))
+		await stop(self)
+
+def heavy(x: float) -> float:
+	return float(np.sort(np.random.uniform(size=50000))[0] + x)
+
+class Count(Collector):
+	async def compute(self, values):
+		pass
+
+class Rebalanced(Layout):
+	rebalance_period = 3.
+
+	def __init__(self, results):
+		super().__init__()
+		self.results = results
+
+	async def setup(self):
+		busy, idle = self.new_context(), self.new_context()
+		tick = Tick(2e-3)
+		self.heavy = [Lambda(heavy), Lambda(heavy)]
+		for node in [tick, *self.heavy]:
+			await self.add(node, busy)
+		for h in self.heavy:
+			count = Count()
+			await self.add(count, busy)
+			await self.connect(tick.id, h.id)
+			await self.connect(h.id, count.id)
+		await self.add(Count(), idle)
+
+	async def run(self):
+		await asyncio.sleep(2.5)
+		before = [self.telemetry.cpu(c) for c in self.contexts]
+		await asyncio.sleep(3 * self.rebalance_period)
+		after = [self.telemetry.cpu(c) for c in self.contexts]
+		placed = [list(self.contexts).index(self.addrs[h.id]) for h in self.heavy]
+		self.results.put((before, after, placed))
+		await stop(self)
+
+async def stop(layout: Layout):
+	for ctx_id in layout.contexts:
+		await layout.notify(ctx_id, {'exit': True})
+	for ctx in layout.contexts.values():
+		await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+	raise SystemExit
+
+def run(layout: Layout, results):
+	proc = mp.Process(target=layout.start)
+	proc.start()
+	out = results.get()
+	proc.join()
+	return out
+
+if __name__ == '__main__':
+	results = mp.Queue()
+	received, breaks, pauses = run(Moves(results), results)
+	pauses = np.array(pauses) * 1e3
+	print(f'moves: {len(pauses)}, pause {np.median(pauses):.1f} ms median, {pauses.max():.1f} ms max; {received} received, {breaks} breaks')
+	before, after, placed = run(Rebalanced(results), results)
+	cpu = lambda cs: ', '.join(f'{c:.0%}' for c in cs)
+	print(f'rebalance: context CPU {cpu(before)} before, {cpu(after)} after; heavy nodes in contexts {placed}')
@@ -0,0 +1,119 @@
+''' An I/O emitter next to a heavy linear algebra node in the same context, with and without offloading (see Collector.offload).
+The emitter waits `period` seconds for each record, as if reading from a device; the heavy node solves a `size` x `size` system on
+every input from a slower ticker. Without offloading, each solve blocks the event loop and the emitter with it. Offloaded, the solve
+runs in a worker thread and releases the GIL, so the emitter keeps its rate. Reports the rates of both, and of the emitter alone.
+Checks first that an offloaded compute sees its inputs as they were when it started, while its sources emit again.
+
+Run `python -m ndgpy.examples.offload`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import time
+
+from ndgpy.layout import Layout
+from ndgpy.nodes.numeric import *
+from ndgpy.plan import ExecPlan
+
+period = 1e-3
+size = 1000
+measure_time = 4.
+
+class Device(Emitter):
+	''' Emits a counter after waiting `period` seconds '''
+	def __init__(self, period: float):
+		self.period = period
+		self.k = 0
+		super().__init__(np.dtype([('f0', np.float64)]))
+
+	async def compute(self):
+		await asyncio.sleep(self.period)
+		self.output['f0'] = self.k
+		self.k += 1
+
+class Solve(Router):
+	''' Solves a random `size` x `size` system on each input, and emits the norm of the solution '''
+	def __init__(self):
+		super().__init__(np.dtype([('f0', np.float64)]))
+		self.a = np.random.uniform(size=(size, size)) + size * np.eye(size)
+
+	def compute(self, values):
+		self.output['f0'] = np.linalg.norm(np.linalg.solve(self.a, np.random.uniform(size=(size, 8))))
+
+class OffloadedSolve(Solve):
+	offload = True
+
+class Count(Collector):
+	async def compute(self, values):
+		pass
+
+class Reread(Router):
+	''' Reads its inputs again after a while, and counts those which changed in between '''
+	offload = True
+
+	def __init__(self):
+		super().__init__(np.dtype([('f0', np.float64)]))
+		self.changed = 0
+
+	def compute(self, values):
+		before = [v['f0'] for v in values]
+		time.sleep(1e-3)
+		self.changed += before != [v['f0'] for v in values]
+
+async def check_inputs(n: int=200):
+	slow, fast, reread = Device(2e-3), Device(0), Reread()
+	reread.set_join(Join.any)
+	reread.receives_from(slow, fast)
+	plan = ExecPlan({m.id: m for m in (slow, fast, reread)})
+	async def drive(root: Emitter):
+		for _ in range(n):
+			await plan.activate(root.id)
+			await asyncio.sleep(0)
+	await asyncio.gather(drive(slow), drive(fast))
+	assert fast.k == n and reread.changed == 0, f'{reread.changed} offloaded computes saw their inputs change'
+
+class Alongside(Layout):
+	def __init__(self, mode: str, results):
+		super().__init__()
+		self.mode = mode
+		self.results = results
+
+	async def setup(self):
+		ctx = self.new_context()
+		tick_period = 1e3 if self.mode == 'alone' else 0.02
+		self.device, tick, self.solve = Device(period), Device(tick_period), OffloadedSolve() if self.mode == 'offloaded' else Solve()
+		for node in (self.device, tick, self.solve):
+			await self.add(node, ctx)
+		for src, dst in ((self.device, Count()), (self.solve, Count())):
+			await self.add(dst, ctx)
+			await self.connect(src.id, dst.id)
+		await self.connect(tick.id, self.solve.id)
+
+	async def run(self):
+		await asyncio.sleep(1.5)
+		n0 = self.activations()
+		await asyncio.sleep(measure_time)
+		n = self.activations()
+		self.results.put(tuple((n[k] - n0[k]) / measure_time for k in (self.device.id, self.solve.id)))
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'exit': True})
+		for ctx in self.contexts.values():
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+		raise SystemExit
+
+	def activations(self) -> Dict[NodeID, int]:
+		return {r['id']: r['activations'] for r in self.stats()}
+
+def run(mode: str):
+	results = mp.Queue()
+	proc = mp.Process(target=Alongside(mode, results).start)
+	proc.start()
+	device, solves = results.get()
+	proc.join()
+	print(f'{mode:>9}: device {device:5.0f}/sec (of {1 / period:.0f}), solves {solves:5.1f}/sec')
+
+if __name__ == '__main__':
+	asyncio.run(check_inputs())
+	for mode in ('alone', 'inline', 'offloaded'):
+		run(mode)
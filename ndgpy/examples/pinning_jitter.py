@@ -0,0 +1,105 @@
+''' Round-trip jitter of a ping-pong across two contexts, unpinned, pinned (see Layout.pin_contexts) and pinned in real-time scheduling
+(Sched.fifo), next to busy processes loading every CPU. A 1 kHz ticker in one context stamps the time; a relay in the other sends the
+stamp back, and a recorder next to the ticker takes the round trip. Reports its p50, p99 & p999.
+On a machine with fewer cores than contexts, pinned contexts share a core, so only the real-time class keeps the load off them.
+Real-time scheduling needs root or CAP_SYS_NICE; otherwise contexts run in the default class, with a warning.
+
+Run `python -m ndgpy.examples.pinning_jitter`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+from ndgpy.layout import Layout
+from ndgpy.affinity import Sched
+from ndgpy.nodes.numeric import *
+
+period = 1e-3
+n_samples = 5000
+dtype = np.dtype([('t', np.int64)])
+
+class Ping(Emitter):
+	''' Emits the time every `period` seconds '''
+	def __init__(self):
+		super().__init__(dtype)
+
+	async def compute(self):
+		await asyncio.sleep(period)
+		self.output['t'] = time.monotonic_ns()
+
+class Pong(Router):
+	''' Sends the stamp back '''
+	def __init__(self):
+		super().__init__(dtype)
+
+	def compute(self, values):
+		self.output['t'] = values[0]['t']
+
+class Record(Collector):
+	''' Takes the round trip of `n` stamps, then saves them to `path` '''
+	def __init__(self, n: int, path: str):
+		super().__init__()
+		self.rtts = np.zeros(n, dtype=np.int64)
+		self.k = 0
+		self.path = path
+
+	async def compute(self, values):
+		if self.k < len(self.rtts):
+			self.rtts[self.k] = time.monotonic_ns() - values[0]['t']
+			self.k += 1
+			if self.k == len(self.rtts):
+				np.save(self.path + '.tmp.npy', self.rtts)
+				os.replace(self.path + '.tmp.npy', self.path)
+
+def busy():
+	while True:
+		pass
+
+class PingPong(Layout):
+	def __init__(self, pinned: bool, sched: Sched, path: str):
+		super().__init__()
+		self.pin_contexts = pinned
+		self.sched = sched
+		self.path = path
+
+	async def setup(self):
+		a, b = self.new_context(sched=self.sched, priority=50), self.new_context(sched=self.sched, priority=50)
+		ping, pong, record = Ping(), Pong(), Record(n_samples, self.path)
+		await self.add(ping, a)
+		await self.add(record, a)
+		await self.add(pong, b)
+		await self.connect(ping.id, pong.id)
+		await self.connect(pong.id, record.id)
+
+	async def run(self):
+		while not os.path.exists(self.path):
+			await asyncio.sleep(0.1)
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'exit': True})
+		for ctx in self.contexts.values():
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+		raise SystemExit
+
+def run(name: str, pinned: bool, sched: Sched=None):
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, 'rtts.npy')
+		proc = mp.Process(target=PingPong(pinned, sched, path).start)
+		proc.start()
+		proc.join()
+		rtts = np.load(path)[n_samples // 10:] / 1e3 # Past warm-up
+	p50, p99, p999 = np.percentile(rtts, [50, 99, 99.9])
+	print(f'{name:>14}: round trip p50 {p50:7.1f} us, p99 {p99:7.1f} us, p999 {p999:7.1f} us, max {rtts.max():8.1f} us')
+
+if __name__ == '__main__':
+	load = [mp.Process(target=busy, daemon=True) for _ in os.sched_getaffinity(0)]
+	for p in load:
+		p.start()
+	run('unpinned', False)
+	run('pinned', True)
+	run('pinned, fifo', True, Sched.fifo)
+	for p in load:
+		p.terminate()
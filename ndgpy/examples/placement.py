@@ -0,0 +1,92 @@
+''' Automatic placement vs. round-robin placement of the same graph onto the same number of CPUs.
+A 1 kHz ticker feeds two CPU-heavy Lambdas and a chain of four cheap ones, each ending in a counter.
+Round-robin splits the chain across contexts and may pair the heavy nodes; automatic placement should keep the chain together
+and give each heavy node room. Reports the delivered rate at each counter and the message rate crossing contexts, from telemetry.
+
+Run `python -m ndgpy.examples.placement [cpus]`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import sys
+import time
+
+from ndgpy.layout import Layout
+from ndgpy.nodes.numeric import *
+
+measure_time = 5.
+
+class Tick(Emitter):
+	''' Emits every `period` seconds on schedule, catching up if the downstream computes delayed it ''' 
+	def __init__(self, period: float):
+		self.period = period
+		self.next = None
+		super().__init__(np.dtype([('f0', np.float64)]))
+
+	async def compute(self):
+		t = time.monotonic()
+		self.next = t if self.next is None else self.next + self.period
+		if self.next > t:
+			await asyncio.sleep(self.next - t)
+		self.output['f0'] = np.random.uniform()
+
+def heavy(x: float) -> float:
+	return float(np.sort(np.random.uniform(size=50000))[0] + x)
+
+class Count(Collector):
+	async def compute(self, values):
+		pass
+
+class Graph(Layout):
+	def __init__(self, placement: str, cpus: int, results):
+		super().__init__()
+		self.placement = placement
+		self.cpus = cpus
+		self.results = results
+
+	async def setup(self):
+		tick = Tick(1e-3)
+		h1, h2, counts = Lambda(heavy), Lambda(heavy), [Count() for _ in range(3)]
+		chain = [Lambda(lambda x: x + 1) for _ in range(4)]
+		nodes = [tick, h1, h2, *chain, *counts]
+		edges = [(tick, h1), (tick, h2), (h1, counts[0]), (h2, counts[1]), (tick, chain[0])]
+		edges += list(zip(chain, chain[1:])) + [(chain[-1], counts[2])]
+		self.counts = counts
+		if self.placement == 'round-robin':
+			ctx_ids = [self.new_context() for _ in range(self.cpus)]
+			for i, node in enumerate(nodes):
+				await self.add(node, ctx_ids[i % len(ctx_ids)])
+		else:
+			for node in nodes:
+				await self.add(node)
+		for a, b in edges:
+			await self.connect(a.id, b.id)
+
+	async def run(self):
+		await asyncio.sleep(measure_time)
+		stats = self.stats()
+		delivered = [next((r['rate'] for r in stats if r['id'] == c.id), np.nan) for c in self.counts]
+		crossing = sum(r['rate'] for r in stats if r['type'] in ('Publisher', 'RingPublisher'))
+		self.results.put((len(self.contexts), delivered, crossing))
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'exit': True})
+		for ctx in self.contexts.values():
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+		raise SystemExit
+
+def run(placement: str, cpus: int):
+	results = mp.Queue()
+	proc = mp.Process(target=Graph(placement, cpus, results).start)
+	proc.start()
+	contexts, delivered, crossing = results.get()
+	proc.join()
+	print(
+		f'{placement:>12}: {contexts} contexts, delivered heavy {delivered[0]:.0f}, {delivered[1]:.0f}/sec, '
+		f'chain {delivered[2]:.0f}/sec; {crossing:.0f} messages/sec across contexts'
+	)
+
+if __name__ == '__main__':
+	cpus = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+	for placement in ('round-robin', 'auto'):
+		run(placement, cpus)
@@ -0,0 +1,97 @@
+''' Messages/sec of in-context graphs: recursive asyncio.gather propagation vs. a compiled ExecPlan.
+Checks first that both compute the sink as many times, including on a join fed through a node with its own __call__ (OPAQUE, see ndgpy.plan).
+
+Run `python -m ndgpy.examples.plan_throughput`
+'''
+
+import numpy as np
+import asyncio
+import time
+
+from ndgpy.nodes.numeric import *
+from ndgpy.plan import ExecPlan
+
+class Counter(Emitter):
+	''' Emitter which never waits, to measure framework overhead only '''
+	def __init__(self):
+		super().__init__(np.dtype([('f0', np.float64)]))
+		self.output['f0'] = 0
+
+	async def compute(self):
+		self.output['f0'] += 1
+
+class Count(Collector):
+	def __init__(self):
+		super().__init__()
+		self.ctr = 0
+
+	async def compute(self, values):
+		self.ctr += 1
+
+class Relay(Pipe):
+	def __init__(self):
+		super().__init__(np.dtype([('f0', np.float64)]))
+
+	async def compute(self, value):
+		self.output['f0'] = value['f0']
+
+class OpaqueRelay(Relay):
+	''' Relay which propagates by itself, as Merge does '''
+	async def __call__(self, src_id: NodeID):
+		await super().__call__(src_id)
+
+def throughput_graph():
+	''' Graph of examples/throughput.py, in one context '''
+	p1, p2, p3, p4 = Counter(), Counter(), Lambda(lambda x, y: x * y), Count()
+	p1.sends_to(p3)
+	p2.sends_to(p3)
+	p3.sends_to(p4)
+	return [p1, p2], [p1, p2, p3, p4], p4
+
+def dense_graph(width: int=8, depth: int=4):
+	''' Emitter -> `depth` fully connected layers of `width` Lambdas -> Collector '''
+	src, sink = Counter(), Count()
+	nodes, prev = [src, sink], [src]
+	for _ in range(depth):
+		layer = [Lambda(lambda *xs: sum(xs)) for _ in range(width)]
+		for m in layer:
+			m.receives_from(*prev)
+		nodes += layer
+		prev = layer
+	sink.receives_from(*prev)
+	return [src], nodes, sink
+
+def opaque_graph():
+	''' Emitter -> {Relay, OpaqueRelay} -> Lambda -> Collector '''
+	src, a, b, join, sink = Counter(), Relay(), OpaqueRelay(), Lambda(lambda x, y: x + y), Count()
+	src.sends_to(a, b)
+	join.receives_from(a, b)
+	join.sends_to(sink)
+	return [src], [src, a, b, join, sink], sink
+
+async def rate(roots, activate, sink, n: int) -> float:
+	t0 = time.perf_counter()
+	for _ in range(n):
+		for r in roots:
+			await activate(r)
+	return sink.ctr / (time.perf_counter() - t0)
+
+async def main():
+	for graph in (throughput_graph, dense_graph, opaque_graph):
+		roots, nodes, sink = graph()
+		await rate(roots, lambda r: r(), sink, 100)
+		expected = sink.ctr
+		roots, nodes, sink = graph()
+		plan = ExecPlan({m.id: m for m in nodes})
+		await rate(roots, lambda r: plan.activate(r.id), sink, 100)
+		assert sink.ctr == expected > 0, f'{graph.__name__}: sink computed {expected} times recursively, {sink.ctr} times by the plan'
+	for name, graph, n in (('throughput.py', throughput_graph, 20000), ('dense 8x4', dense_graph, 2000)):
+		roots, nodes, sink = graph()
+		recursive = await rate(roots, lambda r: r(), sink, n)
+		roots, nodes, sink = graph()
+		plan = ExecPlan({m.id: m for m in nodes})
+		planned = await rate(roots, lambda r: plan.activate(r.id), sink, n)
+		print(f'{name:>14}: recursive {recursive:.0f} msg/sec, plan {planned:.0f} msg/sec ({planned / recursive:.1f}x)')
+
+if __name__ == '__main__':
+	asyncio.run(main())
@@ -0,0 +1,58 @@
+''' Rows/sec replaying a SharedArray through ArraySource -> Integrator -> sink, by chunk size (None: one row per activation)
+
+Run `python -m ndgpy.examples.replay_throughput`
+'''
+
+import numpy as np
+import asyncio
+import time
+import zmq.asyncio as azmq
+
+from ndgpy.data import *
+from ndgpy.network import *
+from ndgpy.nodes.numeric import *
+from ndgpy.plan import ExecPlan
+
+n_rows = 1 << 22
+
+class Count(SingleCollector):
+	def __init__(self):
+		super().__init__()
+		self.n = 0
+
+	@property
+	def accepts_batches(self):
+		return True
+
+	async def compute(self, value):
+		self.n += len(value) if type(value) == Batch else 1
+
+async def rate(arr: SharedArray, res: Resources, chunk_size: int, zero_copy: bool) -> float:
+	src, integ, sink = ArraySource(arr, chunk_size=chunk_size, zero_copy=zero_copy), Integrator(batch=chunk_size), Count()
+	await src.start(res)
+	src.sends_to(integ)
+	integ.sends_to(sink)
+	src.n = min(len(arr), 20000 * (chunk_size or 1)) # Keep small chunk sizes short
+	plan = ExecPlan({n.id: n for n in (src, integ, sink)})
+	t0 = time.perf_counter()
+	while not src.finished:
+		await plan.activate(src.id)
+	elapsed = time.perf_counter() - t0
+	assert sink.n == src.n and np.isclose(integ.output['f0'][-1] if chunk_size else integ.output['f0'], arr[:src.n]['f0'].sum())
+	src.sock.close()
+	return sink.n / elapsed
+
+async def main():
+	with AFSharedMemoryManager() as smm:
+		zmq_ctx = azmq.Context()
+		arr = SharedArray(smm, (n_rows,), np.dtype([('f0', np.float64)]))
+		arr.data['f0'] = np.random.uniform(size=n_rows)
+		res = {Resource.smm: smm, Resource.zmq_ctx: zmq_ctx, Resource.mc_url: mc_url_base}
+		print(f'{"rows":>10}: {await rate(arr, res, None, False):>11.0f} rows/sec')
+		for chunk_size in (1, 16, 256, 4096, 65536):
+			copied, viewed = await rate(arr, res, chunk_size, False), await rate(arr, res, chunk_size, True)
+			print(f'chunk {chunk_size:>5}: {copied:>11.0f} rows/sec, zero-copy {viewed:>11.0f} rows/sec')
+		zmq_ctx.destroy(linger=0)
+
+if __name__ == '__main__':
+	asyncio.run(main())
@@ -0,0 +1,114 @@
+''' Throughput of a CPU-bound Lambda replicated over 1, 2, 4, ... contexts (see Layout.replicate()).
+A ticker emits a counter faster than one replica can keep up with; each replica busy-waits `cost` seconds per record. The replicas' outputs
+are merged in input order into a checker, which counts them and any which are not after the last one. Reports the delivered rate, its
+speedup over one replica, and the out-of-order count (which should be 0). Records the replicas cannot keep up with are lost to their ring links.
+
+Run `python -m ndgpy.examples.replica_scaling [max replicas]`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import sys
+import os
+import time
+
+from ndgpy.layout import Layout
+from ndgpy.nodes.numeric import *
+
+cost = 1e-3
+measure_time = 4.
+
+class Tick(Emitter):
+	''' Emits a counter every `period` seconds on schedule '''
+	def __init__(self, period: float):
+		self.period = period
+		self.next = None
+		self.k = 0
+		super().__init__(np.dtype([('f0', np.float64)]))
+
+	async def compute(self):
+		t = time.monotonic()
+		self.next = t if self.next is None else self.next + self.period
+		if self.next > t:
+			await asyncio.sleep(self.next - t)
+		self.output['f0'] = self.k
+		self.k += 1
+
+def busy(x: float) -> float:
+	t = time.perf_counter() + cost
+	while time.perf_counter() < t:
+		pass
+	return x
+
+class Check(Collector, Resourced):
+	''' Counts inputs, and those not greater than the last one, into a shared record '''
+	def __init__(self, counts: SerializedData):
+		self.counts = counts
+		self.last = -1
+		super().__init__()
+
+	@property
+	def rspec(self):
+		return {Resource.smm}
+
+	async def start(self, res: Resources):
+		await Resourced.start(self, res)
+		self.shared = deserialize_data(res[Resource.smm], self.counts)
+
+	async def compute(self, values):
+		x = values[0]['f0']
+		if x <= self.last:
+			self.shared['unordered'] += 1
+		self.shared['received'] += 1
+		self.last = x
+
+counts_dtype = np.dtype([('received', np.int64), ('unordered', np.int64)])
+
+class Replicated(Layout):
+	def __init__(self, n: int, rate: float, results):
+		super().__init__()
+		self.n = n
+		self.rate = rate
+		self.results = results
+
+	async def setup(self):
+		home = self.new_context()
+		self.counts = SharedStruct(self.smm, counts_dtype)
+		self.counts['received'], self.counts['unordered'] = 0, 0
+		tick, check = Tick(1 / self.rate), Check(self.counts.serialize())
+		await self.add(tick, home)
+		await self.add(check, home)
+		merge_id = await self.replicate(tick.id, Lambda(busy), self.n, ordered=True)
+		await self.connect(merge_id, check.id)
+
+	async def run(self):
+		await asyncio.sleep(1)
+		n0 = int(self.counts['received'])
+		await asyncio.sleep(measure_time)
+		self.results.put(((int(self.counts['received']) - n0) / measure_time, int(self.counts['unordered'])))
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'exit': True})
+		for ctx in self.contexts.values():
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+		raise SystemExit
+
+def run(n: int, rate: float):
+	results = mp.Queue()
+	proc = mp.Process(target=Replicated(n, rate, results).start)
+	proc.start()
+	out = results.get()
+	proc.join()
+	return out
+
+if __name__ == '__main__':
+	max_n = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+	print(f'{len(os.sched_getaffinity(0))} CPUs')
+	rate = 1.25 * max_n / cost
+	base = None
+	n = 1
+	while n <= max_n:
+		delivered, unordered = run(n, rate)
+		base = delivered if base is None else base
+		print(f'{n} replicas: {delivered:.0f}/sec delivered ({delivered / base:.2f}x), {unordered} out of order')
+		n *= 2
@@ -0,0 +1,118 @@
+''' Latency & throughput of cross-context links, as Layout.connect() builds them: signalled by doorbells (unbuffered links, or buffered
+ones), vs. SharedRing (`ring_size`).
+Latency is taken on unbuffered vs. ring links, with a record every 100 us. Throughput is taken with the producer writing as fast as
+it can, over links with Flow.block (buffered vs. ring, of 4096 records each), so that every record is delivered and counted.
+
+Run `python -m ndgpy.examples.ring_latency`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import shortuuid
+import time
+import zmq.asyncio as azmq
+
+from ndgpy.data import *
+from ndgpy.network import *
+from ndgpy.nodes.base import *
+from ndgpy.nodes.boundary import *
+from ndgpy.nodes.interfaces import *
+
+stamp_type = np.dtype([('seq', np.int64), ('t', np.int64)])
+window = 4096
+
+def resources(node: Resourced, smm: AFSharedMemoryManager, zmq_ctx, doorbell: Doorbell) -> Resources:
+	res = {Resource.smm: smm, Resource.zmq_ctx: zmq_ctx, Resource.doorbell: doorbell}
+	return {r: res[r] for r in node.rspec}
+
+def producer(pub: Writer, n: int, period: float, ready, go):
+	async def main():
+		with AFSharedMemoryManager() as smm:
+			zmq_ctx = azmq.Context()
+			doorbell = Doorbell(zmq_ctx, 'bench_pub')
+			await pub.start(resources(pub, smm, zmq_ctx, doorbell))
+			value = Struct(stamp_type)
+			ready.set()
+			go.wait()
+			for i in range(n):
+				value['seq'] = i
+				value['t'] = time.monotonic_ns()
+				await pub.compute(value)
+				await asyncio.sleep(period) # Also lets the doorbell flush
+			await asyncio.sleep(0.1)
+			doorbell.close()
+			zmq_ctx.destroy(linger=0)
+	asyncio.run(main())
+
+def consumer(sub: Emitter, n: int, ready, results):
+	async def main():
+		with AFSharedMemoryManager() as smm:
+			zmq_ctx = azmq.Context()
+			doorbell = Doorbell(zmq_ctx, 'bench_sub')
+			await sub.start(resources(sub, smm, zmq_ctx, doorbell))
+			latencies, seen = np.zeros(n, dtype=np.int64), set()
+			ready.set()
+			t0 = t = None
+			while len(seen) < n:
+				try:
+					if await asyncio.wait_for(sub.compute(), timeout=1.0) is False:
+						continue
+				except asyncio.TimeoutError:
+					break # Remaining messages were lost
+				t = time.monotonic_ns()
+				t0 = t if t0 is None else t0
+				seq = int(sub.output['seq'])
+				if seq not in seen:
+					latencies[len(seen)] = t - sub.output['t']
+					seen.add(seq)
+			results.put((latencies[:len(seen)], max(t - t0, 1) / 1e9))
+			doorbell.close()
+			zmq_ctx.destroy(linger=0)
+	asyncio.run(main())
+
+def link(smm: AFSharedMemoryManager, transport: str, flow: Flow=None) -> Tuple[Writer, Emitter]:
+	''' Publisher & subscriber of a link, as Layout.publisher() & Layout.subscriber() make them '''
+	source_id = shortuuid.uuid()
+	credits = None if flow is None else SharedCredits(smm, 1).serialize()
+	options = {} if flow is None else {'flow': flow, 'credits': credits, 'slot': 0}
+	if transport == 'ring':
+		data = SharedRing(smm, stamp_type, window).serialize()
+		pub = RingPublisher(source_id, data) if flow is None else CreditedRingPublisher(source_id, data, credits=credits, flow=flow)
+		return pub, RingSubscriber(source_id, data, 'bench_pub', **options)
+	data = (VersionedSharedStruct(smm, stamp_type) if flow is None else SharedStreamingArray(smm, stamp_type, window)).serialize()
+	pub = Publisher(source_id, data) if flow is None else CreditedPublisher(source_id, data, credits=credits, flow=flow)
+	return pub, Subscriber(source_id, data, 'bench_pub', **options)
+
+def run(transport: str, n: int, period: float, flow: Flow=None) -> dict:
+	with AFSharedMemoryManager() as smm:
+		pub, sub = link(smm, transport, flow)
+		pub_ready, sub_ready, go, results = mp.Event(), mp.Event(), mp.Event(), mp.Queue()
+		procs = [
+			mp.Process(target=producer, args=(pub, n, period, pub_ready, go)),
+			mp.Process(target=consumer, args=(sub, n, sub_ready, results)),
+		]
+		procs[0].start()
+		pub_ready.wait() # Publisher must bind before the subscriber connects
+		procs[1].start()
+		sub_ready.wait()
+		time.sleep(0.2) # Let the subscription propagate
+		go.set()
+		latencies, elapsed = results.get()
+		for p in procs:
+			p.join()
+	return {
+		'received': len(latencies) / n,
+		'rate': len(latencies) / elapsed,
+		'p50_us': np.percentile(latencies, 50) / 1e3,
+		'p99_us': np.percentile(latencies, 99) / 1e3,
+	}
+
+if __name__ == '__main__':
+	for transport in ('doorbell', 'ring'):
+		lat = run(transport, 5000, 1e-4)
+		thr = run(transport, 50000, 0, flow=Flow.block)
+		print(
+			f'{transport:>8}: latency p50 {lat["p50_us"]:.1f} us, p99 {lat["p99_us"]:.1f} us | '
+			f'throughput {thr["rate"]:.0f} msg/sec, {100*thr["received"]:.1f}% delivered'
+		)
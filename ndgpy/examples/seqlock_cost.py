@@ -0,0 +1,24 @@
+''' Read/write cost of VersionedSharedStruct vs. SharedStruct, for narrow and wide records
+
+Run `python -m ndgpy.examples.seqlock_cost`
+'''
+
+import numpy as np
+import timeit
+
+from ndgpy.data import *
+
+def cost(cls, dtype: np.dtype, smm: AFSharedMemoryManager, n: int=100000):
+	s = cls(smm, dtype)
+	row, out = np.zeros(1, dtype=dtype)[0], Struct(dtype)
+	write = timeit.timeit(lambda: s.set(row), number=n) / n
+	read = timeit.timeit(lambda: s.read(out), number=n) / n
+	return write * 1e9, read * 1e9
+
+if __name__ == '__main__':
+	with AFSharedMemoryManager() as smm:
+		for width in (1, 16, 512):
+			dtype = np.dtype([(f'f{i}', np.float64) for i in range(width)])
+			for cls in (SharedStruct, VersionedSharedStruct):
+				write, read = cost(cls, dtype, smm)
+				print(f'{cls.__name__:>21} ({dtype.itemsize:>4} B): write {write:.0f} ns, read {read:.0f} ns')
@@ -0,0 +1,66 @@
+''' Resident memory of contexts reading the same large SharedArray: each of 4 processes attaches and reads every row,
+then reports RSS (pages mapped) and PSS (pages divided by the processes sharing them). If only one copy exists, total PSS is about one array
+(less the share held by the creating process, for shared memory).
+
+Run `python -m ndgpy.examples.shared_array_memory [size in GB, default 2]`
+'''
+
+import numpy as np
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+
+from ndgpy.data import *
+
+n_procs = 4
+
+def memory() -> dict:
+	''' RSS and PSS of this process, in MB '''
+	with open('/proc/self/smaps_rollup') as f:
+		fields = dict(line.split(':', 1) for line in f if line.startswith(('Rss', 'Pss:')))
+	return {k: int(v.split()[0]) / 1024 for k, v in fields.items()}
+
+def reader(ser: SerializedSharedArray, ready, go, results):
+	with AFSharedMemoryManager() as smm:
+		arr = deserialize_data(smm, ser)
+		total = 0.
+		for i in range(0, len(arr), 1 << 20): # Touch every page
+			total += arr[i:i + (1 << 20)]['x'].sum()
+		ready.set()
+		go.wait() # Measure while all readers are attached
+		results.put(memory())
+		del arr
+
+def run(name: str, ser: SerializedSharedArray, gb: float):
+	ready, go, results = [mp.Event() for _ in range(n_procs)], mp.Event(), mp.Queue()
+	procs = [mp.Process(target=reader, args=(ser, ready[i], go, results)) for i in range(n_procs)]
+	for p in procs:
+		p.start()
+	for e in ready:
+		e.wait()
+	go.set()
+	mems = [results.get() for _ in procs]
+	for p in procs:
+		p.join()
+	rss, pss = sum(m['Rss'] for m in mems), sum(m['Pss'] for m in mems)
+	print(f'{name:>13}: {n_procs} readers of {gb:.1f} GB, total RSS {rss / 1024:.2f} GB, total PSS {pss / 1024:.2f} GB')
+
+def fill(data: np.ndarray):
+	for i in range(0, len(data), 1 << 20):
+		data[i:i + (1 << 20)]['x'] = np.arange(i, min(i + (1 << 20), len(data)))
+
+if __name__ == '__main__':
+	gb = float(sys.argv[1]) if len(sys.argv) > 1 else 2.
+	dtype = np.dtype([('x', np.float64)])
+	n = int(gb * (1 << 30)) // dtype.itemsize
+	with AFSharedMemoryManager() as smm:
+		arr = SharedArray(smm, (n,), dtype)
+		fill(arr.data)
+		run('shared memory', arr.serialize(), gb)
+		arr.free(smm)
+		del arr
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, 'data.npy')
+		fill(np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n,)))
+		run('.npy mmap', SharedArray.from_npy(path).serialize(), gb)
@@ -0,0 +1,96 @@
+''' Round-trip latency of a ping-pong across two contexts, run by the asyncio engine or the spin engine (see Engine), over plain links
+(signalled by doorbells) and over rings. A ticker in one context stamps the time every `period` seconds; a relay in the other sends
+the stamp back, and a recorder next to the ticker takes the round trip. Reports its p50, p99 & p999.
+The spin engine burns the cores of both contexts; on a machine with fewer cores than that, they take turns (see ContextWorker.spin_loop()).
+
+Run `python -m ndgpy.examples.spin_latency`
+'''
+
+import numpy as np
+import asyncio
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+from ndgpy.layout import Layout
+from ndgpy.context import Engine
+from ndgpy.nodes.numeric import *
+
+period = 1e-3
+n_samples = 3000
+dtype = np.dtype([('t', np.int64)])
+
+class Ping(Emitter):
+	''' Emits the time every `period` seconds '''
+	def __init__(self):
+		super().__init__(dtype)
+
+	async def compute(self):
+		await asyncio.sleep(period)
+		self.output['t'] = time.monotonic_ns()
+
+class Pong(Router):
+	''' Sends the stamp back '''
+	def __init__(self):
+		super().__init__(dtype)
+
+	def compute(self, values):
+		self.output['t'] = values[0]['t']
+
+class Record(Collector):
+	''' Takes the round trip of `n` stamps, then saves them to `path` '''
+	def __init__(self, n: int, path: str):
+		super().__init__()
+		self.rtts = np.zeros(n, dtype=np.int64)
+		self.k = 0
+		self.path = path
+
+	async def compute(self, values):
+		if self.k < len(self.rtts):
+			self.rtts[self.k] = time.monotonic_ns() - values[0]['t']
+			self.k += 1
+			if self.k == len(self.rtts):
+				np.save(self.path + '.tmp.npy', self.rtts)
+				os.replace(self.path + '.tmp.npy', self.path)
+
+class PingPong(Layout):
+	def __init__(self, engine: Engine, ring_size: int, path: str):
+		super().__init__()
+		self.engine = engine
+		self.ring_size = ring_size
+		self.path = path
+
+	async def setup(self):
+		a, b = self.new_context(), self.new_context()
+		ping, pong, record = Ping(), Pong(), Record(n_samples, self.path)
+		await self.add(ping, a)
+		await self.add(record, a)
+		await self.add(pong, b)
+		await self.connect(ping.id, pong.id, ring_size=self.ring_size)
+		await self.connect(pong.id, record.id, ring_size=self.ring_size)
+
+	async def run(self):
+		while not os.path.exists(self.path):
+			await asyncio.sleep(0.1)
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'exit': True})
+		for ctx in self.contexts.values():
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
+		raise SystemExit
+
+def run(engine: Engine, ring_size: int=None):
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, 'rtts.npy')
+		proc = mp.Process(target=PingPong(engine, ring_size, path).start)
+		proc.start()
+		proc.join()
+		rtts = np.load(path)[n_samples // 10:] / 1e3 # Past warm-up
+	p50, p99, p999 = np.percentile(rtts, [50, 99, 99.9])
+	link = 'plain' if ring_size is None else 'ring'
+	print(f'{engine.name:>7}, {link:>5} links: round trip p50 {p50:7.1f} us, p99 {p99:7.1f} us, p999 {p999:7.1f} us')
+
+if __name__ == '__main__':
+	for ring_size in (None, 64):
+		for engine in Engine:
+			run(engine, ring_size)
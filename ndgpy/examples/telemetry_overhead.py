@@ -0,0 +1,27 @@
+''' Cost of the per-node telemetry counters: messages/sec of the benchmark's chain and fan scenarios (see ndgpy.bench), run by the
+ExecPlan with and without telemetry. The Relays do next to no work, so this is the worst case: the cost is per node activation,
+and does not grow with the work of the nodes or with the cost of links between contexts. Runs are kept short and repeated many times,
+so that the best of each is one the machine did not interrupt.
+
+Run `python -m ndgpy.examples.telemetry_overhead`
+'''
+
+from ndgpy.bench.scenarios import chain, fan
+
+def best_rates(scenario, params: dict, repeats: int) -> dict:
+	''' Best rate of `repeats` runs with telemetry on and off, interleaved so that both see the same machine '''
+	best = {True: 0, False: 0}
+	for _ in range(repeats):
+		for telemetry in best:
+			best[telemetry] = max(best[telemetry], scenario(**params, telemetry=telemetry)['rate'])
+	return best
+
+if __name__ == '__main__':
+	for name, scenario, params in (
+		('chain 1', chain, {'depth': 1, 'n': 2000}),
+		('chain 8', chain, {'depth': 8, 'n': 1000}),
+		('fan 8', fan, {'fanout': 8, 'n': 1000}),
+	):
+		best = best_rates(scenario, params, 100)
+		on, off = best[True], best[False]
+		print(f'{name}: {off:>8.0f} msg/sec without telemetry, {on:>8.0f} msg/sec with ({on / off - 1:+.1%})')
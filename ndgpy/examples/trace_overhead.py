@@ -0,0 +1,26 @@
+''' Cost of latency tracing: the benchmark chain (in one context) and pipe (across two) scenarios, untraced and traced.
+Also prints the per-stage breakdown of a traced pipe.
+
+Run `python -m ndgpy.examples.trace_overhead`
+'''
+
+from ndgpy.bench import *
+
+runs = [
+	('chain', chain, {'depth': 1, 'n': 20000}),
+	('chain', chain, {'depth': 8, 'n': 20000}),
+	('pipe', pipe, {'link': 'unbuffered', 'n': 10000}),
+	('pipe', pipe, {'link': 'ring', 'n': 10000}),
+]
+
+if __name__ == '__main__':
+	for name, scenario, params in runs:
+		off, on = scenario(**params), scenario(trace=True, **params)
+		label = name + ''.join(f' {k}={v}' for k, v in params.items() if k != 'n')
+		print(
+			f'{label:<22}: rate {off["rate"]:>8.0f} -> {on["rate"]:>8.0f}/sec ({on["rate"] / off["rate"] - 1:+.1%}), '
+			f'p50 {off["p50_us"]:>6.1f} -> {on["p50_us"]:>6.1f} us, '
+			f'cpu {off["cpu_us_per_msg"]:>6.2f} -> {on["cpu_us_per_msg"]:>6.2f} us/msg'
+		)
+		for stage in on.get('trace', {}).get('edges', []):
+			print(f'{"":<24}{stage["stage"]:<14}: p50 {stage["p50_us"]:>7.1f} us, p99 {stage["p99_us"]:>7.1f} us, mean {stage["mean_us"]:>7.1f} us')
@@ -8,16 +8,26 @@ import zmq.asyncio as azmq
 import aiozmq
 import multiprocessing as mp
 import ujson
+import cloudpickle as pickle
+import contextlib
 import asyncio
+import os
 import pdb
 import sys
+import time
 
 from .utils import *
 from .data.shared import *
 from .nodes.base import *
 from .nodes.boundary import *
+from .nodes.utils import copy_node
+from .nodes.dispatch import Dispatcher, Lane, Untag, Tag, Merge, log_dtype
 from .context import *
 from .network import *
+from .trace import traced_dtype, named
+from .telemetry import Telemetry
+from .placement import partition, best_move
+from .affinity import Sched, physical_cores, numa_node
 
 
 ''' Common types ''' 
@@ -33,7 +43,37 @@ class Layout(ABC):
 
 	Duties:
 	* expose an Layout API 
+
+	Set `trace` to create contexts and cross-context links with latency tracing (see ndgpy.trace); request_traces() collects the
+	histograms of each context into `traces`.
+
+	Per-node telemetry from every context is collected in `telemetry` (see stats() and hot_nodes()), and republished on 
+	`telemetry_url` for monitors such as `python -m ndgpy.top`. Set `telemetry_period` to None to run contexts without it, for
+	graphs of nodes which do so little work that the counters show (rebalancing then has nothing to go by).
+
+	Nodes added without a context are placed automatically once setup() returns (see place()). Running nodes can be moved 
+	between contexts with migrate(); set `rebalance_period` to do so from telemetry (see rebalance()). A Router can be run
+	as several replicas in parallel with replicate().
+
+	Changes to the graph made inside `async with layout.transaction()` are sent to each context in one message, and applied there 
+	at once (see ContextWorker.apply()).
+
+	Contexts can be pinned to CPUs and given a scheduling class (see new_context()); set `pin_contexts` to pin each to a physical
+	core of its own. Shared memory of a link from a pinned context is allocated on its NUMA node.
 	''' 
+	trace = False
+	cpus: int = None 			# CPUs to place contexts onto; by default, those this process may run on
+	calibration_time = 3. 		# Seconds to measure unplaced nodes for
+	link_cost = 40e-6 			# CPU seconds per message over a link between contexts, for placement
+	capacity = 0.8 				# Fraction of a core to load each context with, for placement
+	rebalance_period: float = None 	# Seconds between rebalancing moves, if set
+	max_readers = 16 			# Subscribers to a link with credits (see Flow), at most
+	ring_spin = 0 				# Rounds of the event loop ring subscribers poll an empty ring for, before waiting for its doorbell
+	pool: ContextPool = None 	# Pool to take context processes from, if set; destroy_context() gives them back
+	pin_contexts = False 		# Pin contexts created without CPUs to the least used physical core, one per core while there are enough
+	engine = Engine.asyncio 	# Engine of contexts created without one (see Engine)
+	telemetry_period = 1. 		# Seconds between telemetry snapshots of each context; None to keep no per-node counters
+
 	def __init__(self):
 		''' Subclasses should in general override setup() rather than __init__() '''
 		self.contexts: Dict[ContextID, Context] = {}
@@ -41,14 +81,25 @@ class Layout(ABC):
 		self.addrs: Dict[NodeID, ContextID] = {}
 		self.publications: Dict[NodeID, Publication] = {}	# Tracking published nodes (key is publisher ID)
 		self.subscriptions: Dict[Subscription, NodeID] = {}	# Tracking subscribed nodes (key contains publisher ID)
+		self.traces: Dict[ContextID, Dict] = {} 			# Latest trace report per context
+		self.telemetry = Telemetry()
+		self.unplaced: Dict[NodeID, Node] = {} 				# Nodes awaiting placement
+		self.deferred: List[Tuple[NodeID, NodeID, Dict]] = [] 	# Connections awaiting placement (parent, child, link options)
+		self.link_options: Dict[Tuple[NodeID, NodeID], Dict] = {} 	# Link options given to connect(), per edge
+		self.flows: Dict[NodeID, Tuple[Flow, SharedCredits]] = {} 	# Flow control of published nodes, with credits if the writer uses them
+		self.readers: Dict[NodeID, List[NodeID]] = {} 		# Subscribers by credit slot (None if free), per published node with flow control
+		self.replies: Dict[str, asyncio.Future] = {} 		# Awaited replies from contexts, by key (see request())
+		self.txn: Dict[ContextID, Tuple[List[Dict], List[bytes]]] = None 	# Operations & payloads held per context, in a transaction
 
 	def __enter__(self):
 		# Initialize sockets & shared mem
 		self.zmq_ctx = azmq.Context()
-		self.tx = self.zmq_ctx.socket(zmq.PUB)
+		self.tx = self.zmq_ctx.socket(zmq.XPUB) # Sees contexts subscribe
 		self.tx.bind(tx_url)
 		self.rx = self.zmq_ctx.socket(zmq.PULL)
 		self.rx.bind(rx_url)
+		self.monitor = self.zmq_ctx.socket(zmq.PUB)
+		self.monitor.bind(telemetry_url)
 		self.smm = AFSharedMemoryManager().__enter__()
 		return self
 
@@ -61,60 +112,125 @@ class Layout(ABC):
 	''' Public methods ''' 
 
 	# TODO: convert to private method?
-	def new_context(self) -> ContextID:
-		''' Allocates a new execution context ''' 
-		ctx = Context()
+	def new_context(self, cpus: Set[int]=None, sched: Sched=None, priority: int=0, engine: Engine=None) -> ContextID:
+		''' Allocates a new execution context, run on `cpus` and in scheduling class `sched` (with `priority`) if given, 
+		with `engine` (by default, `self.engine`) 
+		''' 
+		if cpus is None and self.pin_contexts:
+			cpus = self.free_core()
+		engine = self.engine if engine is None else engine
+		ctx = Context(trace=self.trace, pool=self.pool, cpus=cpus, sched=sched, priority=priority, engine=engine, 
+			telemetry_period=self.telemetry_period)
 		self.contexts[ctx.id] = ctx
-		ctx.proc.start()
+		ctx.start()
 		return ctx.id
 
 	def get_avail_cpus(self) -> int:
-		# TODO: return n cpus based on how many context workers in use
-		pass
+		''' CPUs not yet used by a context ''' 
+		cpus = len(os.sched_getaffinity(0)) if self.cpus is None else self.cpus
+		return max(cpus - len(self.contexts), 0)
+
+	def free_core(self) -> Set[int]:
+		''' CPUs of the physical core which the fewest contexts are pinned to ''' 
+		pinned = [ctx.cpus for ctx in self.contexts.values()]
+		return set(min(physical_cores(), key=lambda core: pinned.count(set(core))))
+
+	async def request_traces(self):
+		''' Ask every context for its trace report; reports arrive in `traces` ''' 
+		for ctx_id in self.contexts:
+			await self.notify(ctx_id, {'trace': True})
+
+	def stats(self, n_id: NodeID=None) -> Union[List[Dict], Dict]:
+		''' Telemetry statistics of every node (see Telemetry.nodes()), or of node `n_id` ''' 
+		rows = self.telemetry.nodes()
+		if n_id is None:
+			return rows
+		return next((r for r in rows if r['id'] == n_id), None)
+
+	def hot_nodes(self, n: int=10, key: str='load') -> List[Dict]:
+		''' The `n` nodes with the highest `key` statistic; by default, the estimated fraction of a core they use ''' 
+		return self.telemetry.top(n, key)
 
 	async def clear_context(self, ctx_id: ContextID):
+		''' Remove the nodes of a context, with their links ''' 
 		assert ctx_id in self.contexts
-		await asyncio.wait([self.remove(n) for n in self.nodes.keys() if self.addrs[n] == ctx_id])
+		internal = self.internal_nodes() # Go with the links
+		for n_id in [n for n, c in self.addrs.items() if c == ctx_id and n not in internal]:
+			if n_id in self.nodes:
+				await self.remove(n_id)
 
 	# TODO: convert to private method?
 	async def destroy_context(self, ctx_id: ContextID): 
-		# TODO: fix this. context should be told to destroy self, not preemptively stopped. (use signals?)
+		''' Remove the nodes of a context, and tell it to exit; if its process is from the pool, it is recycled instead ''' 
 		await self.clear_context(ctx_id)
-		self.contexts[ctx_id].stop()
+		ctx = self.contexts[ctx_id]
+		if ctx.pool is not None:
+			await self.notify(ctx_id, {'recycle': True})
+			ctx.pool.put(ctx_id)
+		else:
+			await self.notify(ctx_id, {'exit': True})
+			await asyncio.get_running_loop().run_in_executor(None, ctx.proc.join)
 		del self.contexts[ctx_id]
+		self.telemetry.snapshots.pop(ctx_id, None)
 
 	# TODO: convert to private method?
-	async def add(self, node: Node, ctx_id: ContextID):
-		''' Adds a node to the appropriate execution context & starts running it ''' 
+	async def add(self, node: Node, ctx_id: ContextID=None, paused: bool=False):
+		''' Adds a node to the appropriate execution context & starts running it. 
+		Without `ctx_id`, the node is started once placed (see place()). A `paused` Emitter is not run until resume().
+		''' 
+		assert node.id not in self.nodes and node.id not in self.unplaced, 'Cannot add an already added node' # TODO: convert to warning?
+		if ctx_id is None:
+			self.unplaced[node.id] = node
+			return
 		assert ctx_id in self.contexts
-		assert node.id not in self.nodes, 'Cannot add an already added node' # TODO: convert to warning?
 		self.nodes[node.id] = node
 		self.addrs[node.id] = ctx_id
-		await self.notify(ctx_id, {'add': wire_pickle(node)})
+		await self.notify(ctx_id, {'add': node.id, 'paused': paused}, pickle.dumps(node))
+
+	async def resume(self, n_id: NodeID):
+		await self.notify(self.addrs[n_id], {'resume': n_id})
 
 	async def remove(self, n_id: NodeID):
 		assert n_id in self.nodes
 		# First disconnect all neighbors (will automatically un-publish if necessary)
-		await asyncio.wait(
-			[self.disconnect(neighbor, n_id) for neighbor in self.nodes[n_id].sources] + 
-			[self.disconnect(neighbor, n_id) for neighbor in self.nodes[n_id].sinks]
-		)
+		node = self.nodes[n_id]
+		for neighbor in list(getattr(node, 'sources', {})):
+			if neighbor in getattr(node, 'sources', {}): # Not already gone with a link
+				await self.disconnect(neighbor, n_id)
+		for neighbor in list(getattr(node, 'sinks', {})):
+			if neighbor in getattr(node, 'sinks', {}):
+				await self.disconnect(n_id, neighbor)
 		await self.notify(self.addrs[n_id], {'remove': n_id})
+		if getattr(node, 'credits', None) is not None and isinstance(node, (Subscriber, RingSubscriber)):
+			await self.sync(self.addrs[n_id]) # Stopped, so its credit slot is released
+			self.readers[node.source_id][node.slot] = None
 		del self.nodes[n_id]
 		del self.addrs[n_id]
 
 	# TODO: convert to private method?
-	async def connect(self, n_id_1: NodeID, n_id_2: NodeID, buffer_size=None):
-		''' Connects two nodes which are runnning. Double-calls are idempotent ''' 
+	async def connect(self, n_id_1: NodeID, n_id_2: NodeID, buffer_size=None, ring_size=None, flow: Flow=None):
+		''' Connects two nodes which are runnning. Double-calls are idempotent 
+		Links across contexts are unbuffered by default. Set `buffer_size` to keep a history on the link,
+		or `ring_size` to deliver every message in order over a shared ring (no IPC signal) instead.
+		Set `flow` for what happens when the source outpaces a subscriber (see Flow); by default, unbuffered and buffered links 
+		conflate, and rings drop the oldest records.
+		Connections to nodes awaiting placement are made once they are placed.
+		''' 
+		options = {'buffer_size': buffer_size, 'ring_size': ring_size, 'flow': flow}
+		if n_id_1 in self.unplaced or n_id_2 in self.unplaced:
+			self.deferred.append((n_id_1, n_id_2, options))
+			return
 		assert all((n_id_1, n_id_2 in self.nodes))
 		self.nodes[n_id_1].sends_to(self.nodes[n_id_2]) # Store link locally
+		if any(v is not None for v in options.values()):
+			self.link_options[(n_id_1, n_id_2)] = options
 		ctx1, ctx2 = self.addrs[n_id_1], self.addrs[n_id_2]
 		if ctx1 == ctx2:
 			# The nodes are running on the same execution context
 			await self.notify(ctx1, {'connect': {'parent': n_id_1, 'child': n_id_2}})
 		else:
 			# The nodes are running on different execution contexts; establish a shared memory link
-			await self.link(n_id_1, n_id_2, buffer_size=buffer_size)
+			await self.link(n_id_1, n_id_2, **options)
 
 	async def create_edges(self, node: Node):
 		''' Create edges to other nodes which are already present. '''
@@ -130,6 +246,7 @@ class Layout(ABC):
 		''' n_id_1 is parent, n_id_2 is child '''
 		assert all((n_id_1, n_id_2 in self.nodes))
 		self.nodes[n_id_1].disconnect(self.nodes[n_id_2]) # Update link locally
+		self.link_options.pop((n_id_1, n_id_2), None)
 		ctx1, ctx2 = self.addrs[n_id_1], self.addrs[n_id_2]
 		if ctx1 == ctx2:
 			# The nodes are running on the same execution context
@@ -156,6 +273,226 @@ class Layout(ABC):
 		''' Method run after self.setup(). Any (asynchronous) long-running ops go in this method. ''' 
 		pass
 
+	async def replicate(self, src_id: NodeID, node: Router, n: int, ctx_ids: List[ContextID]=None, key: str=None, ordered: bool=False, 
+			ring_size: int=4096, flow: Flow=None, merge_ctx: ContextID=None) -> NodeID:
+		''' Run single-input Router `node` fed by node `src_id` as `n` replicas (it and copies of it, see copy_node()), one in each of 
+		`ctx_ids` (by default, new contexts). A Dispatcher in the context of `src_id` sends each input to one replica, in turn or by 
+		field `key` (see Dispatcher), over a ring link of `ring_size` records with `flow` control; a Merge in `merge_ctx` (by default, that of `src_id`)
+		emits their outputs, in input order if `ordered` (see Merge). Returns the ID of the Merge, to connect downstream nodes to.
+		Replicas do not share state, so a stateful Router should be partitioned by `key`. 
+		'''
+		assert isinstance(node, Router) and node.batch_size is None, 'Only Routers of single records can be replicated'
+		ctx_ids = [self.new_context() for _ in range(n)] if ctx_ids is None else ctx_ids
+		assert len(ctx_ids) == n
+		src, home = self.nodes[src_id], self.addrs[src_id]
+		merge_ctx = home if merge_ctx is None else merge_ctx
+		log = SharedRing(self.smm, log_dtype, 2 * n * ring_size) if ordered else None # Not lapped unless the links to and from replicas are
+		log_ser = None if log is None else log.serialize()
+		dispatcher = Dispatcher(src.dtype, key=key, log=log_ser)
+		await self.add(dispatcher, home)
+		outs = []
+		for i, ctx_id in enumerate(ctx_ids):
+			replica = node if i == 0 else copy_node(node, self.smm)
+			lane = Lane(dispatcher.dtype)
+			await self.add(lane, home)
+			await self.connect(dispatcher.id, lane.id)
+			await self.add(replica, ctx_id)
+			if ordered:
+				untag, tag = Untag(src.dtype), Tag(replica.dtype)
+				await self.add(untag, ctx_id)
+				await self.add(tag, ctx_id)
+				await self.connect(lane.id, untag.id, ring_size=ring_size, flow=flow)
+				await self.connect(untag.id, replica.id)
+				await self.connect(lane.id, tag.id) # Numbered input first
+				await self.connect(replica.id, tag.id)
+				outs.append(tag.id)
+			else:
+				await self.connect(lane.id, replica.id, ring_size=ring_size, flow=flow)
+				outs.append(replica.id)
+		merge = Merge(node.dtype, outs, log=log_ser)
+		await self.add(merge, merge_ctx)
+		for out in outs:
+			await self.connect(out, merge.id, ring_size=ring_size, flow=flow)
+		await asyncio.gather(*(self.sync(c) for c in set(ctx_ids) | {merge_ctx})) # Subscribers started, so none miss the first inputs
+		await self.connect(src_id, dispatcher.id)
+		return merge.id
+
+	async def migrate(self, n_id: NodeID, ctx_id: ContextID) -> float:
+		''' Move a running node to another context, with its state. Returns how long the node was paused for, in seconds.
+		The node is taken out of its context between emissions (see ContextWorker.detach()), and resumed in the new one once its links 
+		are in place. Links from other contexts are read on from where the node stopped, so no message is lost on ring or buffered links; 
+		edges which become local switch over once their links are read out. Its publication stays, so its subscribers are undisturbed.
+		State is carried over by pickling (StreamingArray history included; shared memory, such as the parameters of Parametrized nodes, 
+		by handle), except for the attributes set by its start(), which runs again. Edges which become links use their connect() options.
+		''' 
+		assert n_id in self.nodes and ctx_id in self.contexts
+		old = self.addrs[n_id]
+		if old == ctx_id:
+			return 0.
+		node = self.nodes[n_id]
+		internal = self.internal_nodes()
+		ins = [u for u in getattr(node, 'sources', {}) if u not in internal]
+		outs = [v for v in getattr(node, 'sinks', {}) if v not in internal]
+		for u in ins: # Sources which will reach the node over a link; published ahead, to keep what it misses while moving
+			if self.addrs[u] == old:
+				await self.publish(u, **self.link_options.get((u, n_id), {}))
+
+		t0 = time.perf_counter()
+		msg = await self.request(old, {'detach': n_id}, n_id)
+		for sub_id in [s for s in getattr(node, 'sources', {}) if s in internal]: # Retire its old subscribers & publisher
+			sub = self.nodes[sub_id]
+			sub.disconnect(node)
+			if not sub.sinks:
+				await self.remove(sub_id)
+				del self.subscriptions[(sub.source_id, old)]
+		if n_id in self.publications:
+			pub_id, data = self.publications[n_id]
+			node.disconnect(self.nodes[pub_id])
+			await self.remove(pub_id)
+
+		self.addrs[n_id] = ctx_id
+		await self.notify(ctx_id, {'add': n_id, 'paused': True}, msg['node'])
+		if n_id in self.publications: # Publish to the same link from the new context
+			pub = self.publisher(n_id, data)
+			await self.add(pub, ctx_id)
+			await self.connect(n_id, pub.id)
+			self.publications[n_id] = (pub.id, data)
+			for src, sub_ctx in list(self.subscriptions):
+				if src == n_id:
+					await self.notify(sub_ctx, {'follow': {'source': n_id, 'ctx': ctx_id}})
+		handovers = []
+		for v in outs:
+			if self.addrs[v] == old: # Was local
+				await self.link(n_id, v, **self.link_options.get((n_id, v), {}))
+			elif self.addrs[v] == ctx_id: # Becomes local
+				handovers.append((self.subscriptions[(n_id, ctx_id)], n_id, v))
+		for u in ins: # Read on from where the node stopped
+			sub = self.subscriber(u, ctx_id, resume_at=msg['positions'].get(u))
+			await self.add(sub, ctx_id, paused=True)
+			await self.connect(sub.id, n_id)
+			await self.resume(sub.id)
+			if self.addrs[u] == ctx_id: # Becomes local
+				handovers.append((sub.id, u, n_id))
+			elif (u, ctx_id) in self.subscriptions: # Shares the subscription of other nodes there
+				handovers.append((sub.id, self.subscriptions[(u, ctx_id)], n_id))
+			else:
+				self.subscriptions[(u, ctx_id)] = sub.id
+		await self.resume(n_id)
+		pause = time.perf_counter() - t0
+
+		for sub_id, dst_id, child_id in handovers:
+			await self.handover(sub_id, dst_id, child_id)
+		for m_id in ins + [n_id]:
+			await self.prune(m_id)
+		for c in (old, ctx_id): # Rates of either span the move
+			self.telemetry.snapshots.pop(c, None)
+		return pause
+
+	async def rebalance(self) -> bool:
+		''' Move one node out of the busiest context, if it uses more than `capacity` of a core and the move lowers the load above 
+		capacity summed over contexts (see ndgpy.placement). Loads are from telemetry, with the CPU time of each context not spent 
+		in the computes of its nodes attributed to them by rate (see Telemetry.loads()). Returns whether a node was moved.
+		''' 
+		ctx_ids = list(self.contexts)
+		if len(ctx_ids) < 2 or not all(len(self.telemetry.snapshots.get(c, ())) > 1 for c in ctx_ids):
+			return False # Rates need two snapshots
+		internal = self.internal_nodes()
+		loads, rates = {}, {}
+		for c in ctx_ids:
+			l, r = self.telemetry.loads(c, [n_id for n_id, a in self.addrs.items() if a == c and n_id not in internal])
+			loads.update(l)
+			rates.update(r)
+		cpu = {c: self.telemetry.cpu(c) for c in ctx_ids}
+		hot = max(ctx_ids, key=cpu.get)
+		if not cpu[hot] > self.capacity:
+			return False
+		index = {c: i for i, c in enumerate(ctx_ids)}
+		assign = {n_id: index[self.addrs[n_id]] for n_id in loads}
+		edges = [(u, v, rates[u]) for u in loads for v in getattr(self.nodes[u], 'sinks', {}) if v in loads]
+		candidates = [n_id for n_id in loads if self.addrs[n_id] == hot]
+		move = best_move(assign, loads, edges, len(ctx_ids), self.link_cost, self.capacity, candidates)
+		if move is None:
+			return False
+		await self.migrate(move[0], ctx_ids[move[1]])
+		return True
+
+	async def rebalance_loop(self):
+		while True:
+			await asyncio.sleep(self.rebalance_period)
+			await self.rebalance()
+
+	async def place(self):
+		''' Start the nodes added without a context. 
+		They are first run together in a calibration context for `calibration_time` seconds, to measure the load of each node
+		and the message rate of each edge between them. CPU time of the calibration context not spent in computes (the framework's
+		share, including waiting on the event loop) is attributed to the nodes in proportion to their activation rates, so a 
+		calibration which saturates its core shows as such. They are then partitioned onto new contexts, at most one per available CPU,
+		keeping each context under `capacity` and cutting as little message rate as possible (see ndgpy.placement).
+		Calibration runs the nodes for real, from copies of their initial state. Edges to already placed nodes are not measured.
+		Roots which wait for their downstream computes between emissions (rather than emitting on a schedule) emit slower when 
+		sharing one core, so their load is underestimated.
+		''' 
+		nodes, deferred = self.unplaced, self.deferred
+		self.unplaced, self.deferred = {}, []
+		if not nodes:
+			return
+		loads, rates = await self.calibrate(nodes, deferred)
+		edges = [(a, b, rates[a]) for a, b, _ in deferred if a in nodes and b in nodes]
+		assign = partition(list(nodes), loads, edges, max(self.get_avail_cpus(), 1), self.link_cost, self.capacity)
+		ctx_ids = [self.new_context() for _ in range(max(assign.values()) + 1)]
+		async with self.transaction():
+			for n_id, node in nodes.items():
+				await self.add(node, ctx_ids[assign[n_id]])
+			for a, b, options in deferred:
+				await self.connect(a, b, **options)
+
+	async def calibrate(self, nodes: Dict[NodeID, Node], edges: List[Tuple[NodeID, NodeID, Dict]]) -> Tuple[Dict[NodeID, float], Dict[NodeID, float]]:
+		''' Run copies of `nodes` in one temporary context; returns the load (fraction of a core) and emission rate of each ''' 
+		ctx = Context(trace=self.trace, pool=self.pool) # With telemetry, to measure
+		self.contexts[ctx.id] = ctx
+		ctx.start()
+		for node in nodes.values():
+			await self.notify(ctx.id, {'add': node.id}, pickle.dumps(node))
+		for a, b, _ in edges:
+			if a in nodes and b in nodes:
+				await self.notify(ctx.id, {'connect': {'parent': a, 'child': b}})
+		await asyncio.sleep(self.calibration_time)
+		while len(self.telemetry.snapshots.get(ctx.id, ())) < 2: # Rates need two
+			await asyncio.sleep(0.1)
+		loads, rates = self.telemetry.loads(ctx.id, list(nodes))
+		await self.destroy_context(ctx.id) # Its nodes are not in the graph
+		return loads, rates
+
+	@contextlib.asynccontextmanager
+	async def transaction(self):
+		''' Hold the messages to contexts sent inside (by add(), connect(), etc.) to send them as one message per context, applied there
+		as one change to the graph; then wait until every context has applied its own. Raises if one failed (see ContextWorker.apply()).
+		Messages to a context are sent early if a reply is needed from it (see request()). Nested transactions join the outer one.
+		''' 
+		if self.txn is not None:
+			yield
+			return
+		self.txn = {}
+		try:
+			yield
+		finally:
+			txn, self.txn = self.txn, None
+			await self.commit(txn)
+
+	async def commit(self, txn: Dict[ContextID, Tuple[List[Dict], List[bytes]]]):
+		replies = {}
+		for ctx_id, (ops, payloads) in txn.items():
+			key = shortuuid.uuid()
+			replies[ctx_id] = self.replies[key] = asyncio.get_running_loop().create_future()
+			await self.send(ctx_id, {'ops': ops, 'txn': key}, *payloads)
+		errors = []
+		for ctx_id, reply in replies.items():
+			msg = await reply
+			if msg['error'] is not None:
+				errors.append(f'context {ctx_id}: {msg["error"]}')
+		if errors:
+			raise RuntimeError('Transaction failed in ' + '; '.join(errors))
+
 	def start(self):
 		try:
 			asyncio.run(self.main())
@@ -164,22 +501,10 @@ class Layout(ABC):
 
 	''' Private methods ''' 
 
-	async def link(self, n_id_1: NodeID, n_id_2: NodeID, buffer_size=None):
-		''' Like self.connect(), but across execution contexts ''' 
-		# Establish the publisher
+	async def link(self, n_id_1: NodeID, n_id_2: NodeID, buffer_size=None, ring_size=None, flow: Flow=None):
+		''' Like self.connect(), but across execution contexts. The link type is fixed by the first link from a node. ''' 
 		assert all((n_id_1, n_id_2 in self.nodes))
-		if n_id_1 not in self.publications:
-			node = self.nodes[n_id_1]
-			if buffer_size is None: # Link is not buffered
-				data = SharedStruct(self.smm, node.dtype)
-			else:
-				assert buffer_size > 0
-				data = SharedStreamingArray(self.smm, node.dtype, buffer_size)
-			# Add publisher process attached to source
-			pub = Publisher(n_id_1, data.serialize())
-			await self.add(pub, self.addrs[n_id_1])
-			await self.connect(n_id_1, pub.id)
-			self.publications[n_id_1] = (pub.id, data)
+		await self.publish(n_id_1, buffer_size=buffer_size, ring_size=ring_size, flow=flow)
 
 		# Establish the subscriber
 		ctx_id = self.addrs[n_id_2]
@@ -189,37 +514,168 @@ class Layout(ABC):
 			await self.connect(self.subscriptions[sub_key], n_id_2)
 		# Else create a subscription
 		else:
-			sub = Subscriber(n_id_1, self.publications[n_id_1][1].serialize())
-			await self.add(sub, self.addrs[n_id_2])
+			sub = self.subscriber(n_id_1, ctx_id)
+			await self.add(sub, ctx_id, paused=True) # Until connected, so it drops nothing
 			await self.connect(sub.id, n_id_2)
+			await self.resume(sub.id)
 			self.subscriptions[sub_key] = sub.id
 
+	async def publish(self, n_id: NodeID, buffer_size=None, ring_size=None, flow: Flow=None):
+		''' Establish the publisher of a node to other contexts, if there is none ''' 
+		assert buffer_size is None or ring_size is None, 'Link can be buffered or a ring, not both'
+		if n_id in self.publications:
+			return
+		with self.smm.on_node(numa_node(self.contexts[self.addrs[n_id]].cpus)): # The writer's
+			if flow is not None:
+				credits = SharedCredits(self.smm, self.max_readers) if flow in (Flow.block, Flow.drop_newest) else None
+				self.flows[n_id] = (flow, credits)
+				if credits is not None:
+					self.readers[n_id] = [None] * self.max_readers
+			node = self.nodes[n_id]
+			dtype = traced_dtype(node.dtype) if self.trace else node.dtype
+			if ring_size is not None:
+				assert ring_size > 0
+				data = SharedRing(self.smm, dtype, ring_size)
+			elif buffer_size is None and node.batch_size is not None: # Link carries whole batches
+				data = SharedBatch(self.smm, dtype, node.batch_size)
+			elif buffer_size is None: # Link is not buffered
+				data = VersionedSharedStruct(self.smm, dtype)
+			else:
+				assert buffer_size > 0
+				data = SharedStreamingArray(self.smm, dtype, buffer_size)
+		# Add publisher process attached to source
+		pub = self.publisher(n_id, data)
+		await self.add(pub, self.addrs[n_id])
+		await self.connect(n_id, pub.id)
+		self.publications[n_id] = (pub.id, data)
+
+	def publisher(self, n_id: NodeID, data: SharedData) -> Node:
+		flow, credits = self.flows.get(n_id, (None, None))
+		ring = type(data) == SharedRing
+		if credits is not None:
+			cls = {(False, False): CreditedPublisher, (False, True): CreditedRingPublisher, 
+				(True, False): TracedCreditedPublisher, (True, True): TracedCreditedRingPublisher}[(self.trace, ring)]
+			return cls(n_id, data.serialize(), credits=credits.serialize(), flow=flow)
+		if ring:
+			return (TracedRingPublisher if self.trace else RingPublisher)(n_id, data.serialize())
+		return (TracedPublisher if self.trace else Publisher)(n_id, data.serialize())
+
+	def subscriber(self, n_id: NodeID, ctx_id: ContextID, resume_at: int=None) -> Node:
+		''' Subscriber to the publication of a node, to run in context `ctx_id`. On a link with credits, it takes a free slot, 
+		holding the writes from `resume_at` on from then.
+		''' 
+		data, batch = self.publications[n_id][1], self.nodes[n_id].batch_size
+		flow, credits = self.flows.get(n_id, (None, None))
+		options = {'batch': batch, 'resume_at': resume_at, 'flow': flow}
+		if credits is not None:
+			slot = self.readers[n_id].index(None) # Raises if out of slots
+			if resume_at is not None:
+				credits.put(slot, resume_at)
+			options.update(credits=credits.serialize(), slot=slot)
+		if type(data) == SharedRing:
+			sub = (TracedRingSubscriber if self.trace else RingSubscriber)(n_id, data.serialize(), self.addrs[n_id], spin=self.ring_spin, **options)
+		else:
+			sub = (TracedSubscriber if self.trace else Subscriber)(n_id, data.serialize(), self.addrs[n_id], **options)
+		if credits is not None:
+			self.readers[n_id][slot] = sub.id
+		return sub
+
 	async def unlink(self, n_id_1: NodeID, n_id_2: NodeID):
 		assert all((n_id_1, n_id_2 in self.nodes))
 		assert n_id_1 in self.publications
-		pub_id = self.publications[n_id_1][0]
 		sub_id = self.subscriptions[(n_id_1, self.addrs[n_id_2])]
 		await self.disconnect(sub_id, n_id_2)
 		if len(self.nodes[sub_id].sinks) == 0:
 		# Subscriber has no children, get rid of it
 			await self.remove(sub_id)
 			del self.subscriptions[(n_id_1, self.addrs[n_id_2])]
-		if not any(sub[0] == n_id_1 for sub in self.subscriptions):
-		# Publisher has no subscribers, get rid of it
-			await self.remove(pub_id)
-			del self.publications[n_id_1]
+		await self.prune(n_id_1)
+
+	async def prune(self, n_id: NodeID):
+		''' Get rid of the publisher of a node, if it has no subscribers ''' 
+		if n_id in self.publications and not any(sub[0] == n_id for sub in self.subscriptions):
+			await self.remove(self.publications[n_id][0])
+			await asyncio.gather(*(self.sync(ctx_id) for ctx_id in self.contexts)) # Subscribers removed, & done reading
+			self.publications[n_id][1].free(self.smm) # Link memory is reused by later links
+			del self.publications[n_id]
+			_, credits = self.flows.pop(n_id, (None, None))
+			if credits is not None:
+				credits.free(self.smm)
+			self.readers.pop(n_id, None)
+
+	async def handover(self, sub_id: NodeID, dst_id: NodeID, child_id: NodeID):
+		''' Feed a node from `dst_id` rather than subscriber `sub_id`, in their context (see ContextWorker.handover()) ''' 
+		sub = self.nodes[sub_id]
+		await self.notify(self.addrs[sub_id], {'handover': {'from': sub_id, 'to': dst_id, 'child': child_id}})
+		sub.disconnect(self.nodes[child_id])
+		self.nodes[dst_id].sends_to(self.nodes[child_id])
+		if not sub.sinks:
+			await self.remove(sub_id)
+			self.subscriptions = {key: s_id for key, s_id in self.subscriptions.items() if s_id != sub_id}
 
+	def internal_nodes(self) -> Set[NodeID]:
+		''' Publishers & subscribers of links ''' 
+		return set(self.subscriptions.values()) | {pub_id for pub_id, _ in self.publications.values()}
 
-	async def notify(self, ctx_id: ContextID, msg: Dict):
-		await self.contexts[ctx_id].ready.wait() # Wait for context to be ready
-		await self.tx.send_string(ctx_id + ' ' + ujson.dumps(msg))
+
+	async def request(self, ctx_id: ContextID, msg: Dict, key: str) -> Dict:
+		''' Send a message to a context, and wait for its reply tagged with `key` ''' 
+		if self.txn is not None and ctx_id in self.txn: # Send the held messages ahead
+			await self.commit({ctx_id: self.txn.pop(ctx_id)})
+		reply = self.replies[key] = asyncio.get_running_loop().create_future()
+		await self.send(ctx_id, {'ops': [msg]})
+		return await reply
+
+	async def sync(self, ctx_id: ContextID):
+		''' Wait until a context has handled the messages sent to it so far ''' 
+		key = shortuuid.uuid()
+		await self.request(ctx_id, {'sync': key}, key)
+
+	async def notify(self, ctx_id: ContextID, msg: Dict, payload: bytes=None):
+		''' Send an operation to a context, with a raw `payload` frame (such as a pickled node) if given; held in a transaction ''' 
+		ops, payloads = self.txn.setdefault(ctx_id, ([], [])) if self.txn is not None else ([], [])
+		if payload is not None:
+			msg = {**msg, 'payload': len(payloads)}
+			payloads.append(payload)
+		ops.append(msg)
+		if self.txn is None:
+			await self.send(ctx_id, {'ops': ops}, *payloads)
+
+	async def send(self, ctx_id: ContextID, header: Dict, *payloads: bytes):
+		''' Send a message to a context: a header of operations, and their payloads (see ContextWorker) ''' 
+		ctx = self.contexts[ctx_id]
+		await ctx.ready.wait() # Wait for context to be ready
+		await ctx.subscribed.wait() # & to receive what is sent
+		await self.tx.send_multipart([ctx_id.encode(), ujson.dumps(header).encode(), *payloads])
 
 	async def recv_loop(self):
 		while True:
-			msg = await self.rx.recv_json()
+			frames = await self.rx.recv_multipart()
+			if frames[0] == b'telemetry':
+				self.telemetry.update(frames)
+				await self.monitor.send_multipart(frames)
+				continue
+			msg = ujson.loads(frames[0])
 			# print(f'Host got message: {msg}')
 			if 'ready' in msg:
 				self.contexts[msg['ready']].ready.set() # Set worker readiness
+			if 'trace' in msg:
+				self.traces[msg['trace']] = msg['report'] and named(msg['report'], self.addrs)
+			if 'detached' in msg:
+				msg['node'] = frames[1]
+				self.replies.pop(msg['detached']).set_result(msg)
+			if 'synced' in msg:
+				self.replies.pop(msg['synced']).set_result(msg)
+			if 'applied' in msg:
+				self.replies.pop(msg['applied']).set_result(msg)
+
+	async def subscription_loop(self):
+		''' Note when contexts have subscribed to their messages; until then, messages to them would be dropped ''' 
+		while True:
+			frame = await self.tx.recv()
+			ctx_id = frame[1:].decode()
+			if frame[0] == 1 and ctx_id in self.contexts:
+				self.contexts[ctx_id].subscribed.set()
 
 	async def main(self):
 		''' Call when nodes have been initialized from the script (nodes may continue to be added by messaging the host)
@@ -229,8 +685,12 @@ class Layout(ABC):
 			print('Layout started')
 			async def run():
 				await self.setup()
+				await self.place()
+				if self.rebalance_period is not None:
+					self.rebalancer = asyncio.create_task(self.rebalance_loop())
 				await self.run()
 			await asyncio.gather(
 				self.recv_loop(), 
+				self.subscription_loop(),
 				run(),
 			)
@@ -1,3 +1,70 @@
+import zmq
+import asyncio
+from typing import Dict, List
+
 tx_url = 'ipc:///tmp/ndgpy_orch_tx' 	# For context-level broadcasting
 rx_url = 'ipc:///tmp/ndgpy_orch_rx' 	# For context-host telemetry
-mc_url_base = 'ipc:///tmp/ndgpy_mc_' 	# For process-process multicast
\ No newline at end of file
+mc_url_base = 'ipc:///tmp/ndgpy_mc_' 	# For process-process multicast
+telemetry_url = 'ipc:///tmp/ndgpy_telemetry' 	# Host republishes context telemetry here, for monitors
+
+class Doorbell:
+	''' Readiness notifications between contexts, multiplexed over one PUB socket per context.
+	Local Publishers ring() with the ID of the node they published; IDs rung during one event loop iteration are sent together in a single message.
+	Each context pair shares one SUB socket, whose reader drains every queued message and wakes the local listeners of each ID once.
+	'''
+	def __init__(self, zmq_ctx, ctx_id: str):
+		self.zmq_ctx = zmq_ctx
+		self.pub = zmq_ctx.socket(zmq.PUB)
+		self.pub.bind(mc_url_base + ctx_id)
+		self.pending: List[bytes] = [] # IDs rung since the last flush
+		self.subs: Dict[str, asyncio.Task] = {} # Reader per remote context
+		self.listeners: Dict[str, Dict[bytes, List[asyncio.Event]]] = {} # Remote context -> node ID -> events
+
+	def ring(self, node_id: str):
+		if not self.pending:
+			self.flush_handle = asyncio.get_running_loop().call_soon(self.flush)
+		self.pending.append(node_id.encode())
+
+	def flush(self):
+		self.pub.send_multipart(self.pending) # PUB never blocks
+		self.pending = []
+
+	def listen(self, ctx_id: str, node_id: str) -> asyncio.Event:
+		''' Returns an event set whenever `node_id` (running in context `ctx_id`) rings '''
+		if ctx_id not in self.subs:
+			sock = self.zmq_ctx.socket(zmq.SUB)
+			sock.connect(mc_url_base + ctx_id)
+			sock.setsockopt(zmq.SUBSCRIBE, b'')
+			self.listeners[ctx_id] = {}
+			self.subs[ctx_id] = asyncio.create_task(self.recv_loop(sock, self.listeners[ctx_id]))
+		event = asyncio.Event()
+		self.listeners[ctx_id].setdefault(node_id.encode(), []).append(event)
+		return event
+
+	def unlisten(self, ctx_id: str, node_id: str, event: asyncio.Event):
+		listeners = self.listeners[ctx_id]
+		listeners[node_id.encode()].remove(event)
+		if not listeners[node_id.encode()]:
+			del listeners[node_id.encode()]
+		if not listeners:
+			self.subs.pop(ctx_id).cancel()
+			del self.listeners[ctx_id]
+
+	async def recv_loop(self, sock, listeners: Dict[bytes, List[asyncio.Event]]):
+		try:
+			while True:
+				ready = set(await sock.recv_multipart())
+				while sock.getsockopt(zmq.EVENTS) & zmq.POLLIN: # Batch up everything already queued
+					ready.update(await sock.recv_multipart())
+				for node_id in ready:
+					for event in listeners.get(node_id, ()):
+						event.set()
+		finally:
+			sock.close(linger=0)
+
+	def close(self):
+		if self.pending:
+			self.flush_handle.cancel()
+		for task in self.subs.values():
+			task.cancel()
+		self.pub.close(linger=0)
@@ -8,6 +8,10 @@ import zmq
 import zmq.asyncio
 import multiprocessing as mp
 import asyncio
+import threading
+import copy
+from enum import Enum
+from collections import deque
 
 from ndgpy.data import *
 from ndgpy.utils import *
@@ -17,15 +21,44 @@ from ndgpy.utils import *
 
 NodeID = NewType('NodeID', str)
 
+class Join(Enum):
+	''' When a Collector with several sources computes (see Collector.set_join()).
+	Except for Join.all, inputs which fire again before the others are not waited for, and a node first computes once all have fired.
+	''' 
+	all = 1 		# Once every source has fired since the last compute
+	any = 2 		# Whenever any source fires, on the latest outputs of the others
+	trigger = 3 	# Whenever the trigger source fires, on the latest outputs of the others
+	aligned = 4 	# Whenever a source fires and each other has a held output timestamped within the tolerance of it, on those outputs
+
+offload_thread = threading.local() # `active` in the worker threads of offloaded computes
+
+class DoubleBuffered:
+	''' Output of a node whose compute runs in a worker thread (see Collector.offload): the compute writes a back buffer, 
+	which is swapped in once it returns, so nodes running on the event loop only ever see whole outputs.
+	''' 
+	def __get__(self, node: 'Emitter', cls=None):
+		if node is None:
+			return self
+		return node.buffers[1] if getattr(offload_thread, 'active', False) else node.buffers[0]
+
+	def __set__(self, node: 'Emitter', value: Union[Struct, Batch]):
+		node.buffers = [value, copy.deepcopy(value)] # Front, back
+
 ''' Base node definitions ''' 
 
 class Emitter(ABC):
 	''' Object which emits data and can be run in a loop without parents ''' 
-	def __init__(self, dtype: np.dtype, id: NodeID=None):
+	def __init__(self, dtype: np.dtype, id: NodeID=None, batch: int=None):
+		''' With `batch`, the output is a Batch of up to that many records emitted per activation, rather than a single Struct ''' 
 		self.id = shortuuid.uuid() if id is None else id
-		self.output = Struct(dtype) # Output type
+		self.output = Struct(dtype) if batch is None else Batch(dtype, batch) # Output type
 		self.sinks: Dict[NodeID, Collector] = dict()
 
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		if getattr(cls, 'offload', False) and not isinstance(getattr(cls, 'output', None), DoubleBuffered):
+			cls.output = DoubleBuffered()
+
 	async def __call__(self):
 		result = await self.compute()
 		# await asyncio.sleep(0) # Runs a BFS 
@@ -35,6 +68,12 @@ class Emitter(ABC):
 	def sends_to(self, *procs: Tuple['Collector']): 
 		''' An Emitter can send data to Processes ''' 
 		for proc in procs:
+			assert self.batch_size is None or proc.accepts_batches, f'{type(proc).__name__} does not accept batches'
+			capacity = getattr(proc, 'batch_size', None) # Batched Routers (Lambda, Integrator, Filters) emit at most one record per input record
+			assert self.batch_size is None or capacity is None or capacity >= self.batch_size, \
+				f'{type(proc).__name__} emits batches of up to {capacity} records, fewer than the {self.batch_size} it may receive'
+			assert capacity is None or self.batch_size is not None, \
+				f'{type(proc).__name__} computes on batches, but {type(self).__name__} emits single records'
 			self.sinks[proc.id] = proc
 			if self.id not in proc.sources:
 				proc.receives_from(self)
@@ -58,37 +97,117 @@ class Emitter(ABC):
 	def dtype(self):
 		return self.output.dtype
 
+	@property
+	def batch_size(self) -> int:
+		''' Capacity of the output Batch, or None if emitting single records ''' 
+		return self.output.capacity if type(self.output) == Batch else None
+
 class Collector(ABC):
 	''' Object which collects / drains data (typically, with I/O) ''' 
+	offload = False # Whether compute() runs in a worker thread of the context, for computes which release the GIL (large NumPy kernels, say).
+					# It must not await, and should only touch the node's own state. Set on the class: the output is then double-buffered.
+
 	def __init__(self, id: NodeID=None):
 		self.id = shortuuid.uuid() if id is None else id
 		self.sources: Dict[NodeID, Emitter] = dict()
-		self.flags: Dict[NodeID, bool] = dict() # Completion flags
+		self.arrived = 0 # Bitmask of the sources (by position) fired since the last compute
+		self.join_held: List[deque] = [] # Outputs held per source, for Join.aligned
+		self.join = Join.all
 
 	async def __call__(self, *inputs: Tuple[NodeID]):
 		''' Completion trigger from other nodes ''' 
 		for pid in inputs:
 			assert pid in self.sources
-			self.flags[pid] = True
-
-		if self.is_ready(): 
-			await self.compute(tuple(self.sources[pid].output for pid in inputs))
-			self.reset_flags()
+			if self.offer(pid):
+				await self.compute(self.inputs())
+				self.computed()
+
+	def set_join(self, join: Join, trigger: NodeID=None, field: str='t', tolerance: float=0., depth: int=64):
+		''' Set when this node computes, before it is added to a Layout (see Join). 
+		Join.trigger fires on source `trigger`, or on the subscriber which reads from it in another context.
+		Join.aligned matches outputs whose field `field` differs by at most `tolerance`, holding the last `depth` of each source.
+		''' 
+		assert join is not Join.trigger or trigger is not None, 'Join.trigger needs a trigger source'
+		self.join, self.join_trigger = join, trigger
+		self.join_field, self.join_tolerance, self.join_depth = field, tolerance, depth
+		self.reset_flags()
+
+	def slot(self, pid: NodeID) -> int:
+		''' Position of a source, in connection order ''' 
+		return list(self.sources).index(pid)
+
+	def offer(self, pid: NodeID, k: int=None) -> bool:
+		''' Note that source `pid` (the `k`-th) fired; whether to compute now ''' 
+		k = self.slot(pid) if k is None else k
+		bit, full = 1 << k, (1 << len(self.sources)) - 1
+		if self.join is Join.all:
+			if self.arrived & bit:
+				return False
+			self.arrived |= bit
+			return self.arrived == full
+		if self.join is Join.aligned:
+			return self.align(k, self.sources[pid].output)
+		self.arrived |= bit
+		if self.arrived != full:
+			return False
+		if self.join is Join.trigger:
+			src = self.sources[pid]
+			return self.join_trigger in (pid, getattr(src, 'source_id', None))
+		return True
+
+	def align(self, k: int, value: Struct) -> bool:
+		''' Hold `value` from the `k`-th source, and look for the held output of each other source nearest to it in time, within the tolerance.
+		If all are found, sets them as the inputs, and drops them and the outputs held before them.
+		''' 
+		if len(self.join_held) != len(self.sources):
+			self.join_held = [deque(maxlen=self.join_depth) for _ in self.sources]
+			self.join_matched = tuple(Struct(p.output.dtype) for p in self.sources.values())
+		field, tol = self.join_field, self.join_tolerance
+		rec = value.numpy().copy()
+		t = rec[field]
+		self.join_held[k].append(rec)
+		picks = []
+		for m, held in enumerate(self.join_held):
+			if m == k:
+				picks.append(len(held) - 1)
+				continue
+			dt = [abs(r[field] - t) for r in held]
+			if not dt or min(dt) > tol:
+				return False
+			picks.append(int(np.argmin(dt)))
+		for held, i, out in zip(self.join_held, picks, self.join_matched):
+			out.set(held[i])
+			for _ in range(i + 1):
+				held.popleft()
+		return True
+
+	def inputs(self) -> Tuple[Struct]:
+		''' Arguments of compute(): the outputs of the sources, or the matched outputs of an aligned join ''' 
+		if self.join is Join.aligned:
+			return self.join_matched
+		return tuple(p.output for p in self.sources.values())
+
+	def computed(self):
+		''' Clear the fired sources after a compute, if it waits for them all ''' 
+		if self.join is Join.all:
+			self.arrived = 0
 
-	def is_ready(self):
-		return all(self.flags.values())
+	@property
+	def accepts_batches(self) -> bool:
+		''' Whether compute() handles Batch inputs. Subclasses opt in by overriding. ''' 
+		return False
 
 	def reset_flags(self):
-		''' Reset completion flags '''
-		for k in self.sources:
-			self.flags[k] = False
+		''' Forget the fired sources and held outputs, as when the sources change '''
+		self.arrived = 0
+		self.join_held.clear()
 
 	def receives_from(self, *procs: Tuple['Emitter']):
 		''' A Collector can receive from Emitters & Routers ''' 
 		for proc in procs:
 			assert proc != self
 			self.sources[proc.id] = proc
-			self.flags[proc.id] = False
+			self.reset_flags()
 			if self.id not in proc.sinks:
 				proc.sends_to(self)
 
@@ -96,6 +215,7 @@ class Collector(ABC):
 		for proc in procs:
 			if proc.id in self.sources:
 				del self.sources[proc.id]
+				self.reset_flags()
 				proc.disconnect(self)
 
 	@abstractmethod
@@ -108,20 +228,19 @@ class Collector(ABC):
 
 class Router(Emitter, Collector):
 	''' A node which can do both Collecting (receiving) and Emitting (transmitting) ''' 
-	def __init__(self, dtype: np.dtype, id: NodeID=None):
-		Emitter.__init__(self, dtype, id=id)
+	def __init__(self, dtype: np.dtype, id: NodeID=None, batch: int=None):
+		Emitter.__init__(self, dtype, id=id, batch=batch)
 		Collector.__init__(self, id=self.id)
 
 	async def __call__(self, *inputs: Tuple[NodeID]): 
 		''' Completion trigger from other processes ''' 
 		for pid in inputs:
 			assert pid in self.sources
-			self.flags[pid] = True
-
-		# Advance to sink nodes if sources have completed 
-		if self.is_ready(): 
-			result = await self.compute(tuple(p.output for p in self.sources.values()))
-			self.reset_flags()
+			if not self.offer(pid):
+				continue
+			# Advance to sink nodes if the join is complete
+			result = await self.compute(self.inputs())
+			self.computed()
 			# await asyncio.sleep(0) # Runs a BFS 
 			if result is not False: # Optional propagation
 				await asyncio.gather(*(proc(self.id) for proc in self.sinks.values()))
@@ -162,8 +281,8 @@ class SingleCollector(Collector):
 
 class Pipe(SingleEmitter, SingleCollector):
 	''' Source-to-sink pipe connector ''' 
-	def __init__(self, dtype: np.dtype, id: NodeID=None):
-		SingleEmitter.__init__(self, dtype, id=id)
+	def __init__(self, dtype: np.dtype, id: NodeID=None, batch: int=None):
+		SingleEmitter.__init__(self, dtype, id=id, batch=batch)
 		SingleCollector.__init__(self, id=self.id)
 
 	async def __call__(self, src_id: NodeID):
@@ -174,8 +293,8 @@ class Pipe(SingleEmitter, SingleCollector):
 
 class OutBranch(Emitter, SingleCollector):
 	''' Single-source many-sink connector ''' 
-	def __init__(self, dtype: np.dtype, id: NodeID=None):
-		Emitter.__init__(self, dtype, id=id)
+	def __init__(self, dtype: np.dtype, id: NodeID=None, batch: int=None):
+		Emitter.__init__(self, dtype, id=id, batch=batch)
 		SingleCollector.__init__(self, id=self.id)
 
 	async def __call__(self, src_id: NodeID):
@@ -186,20 +305,19 @@ class OutBranch(Emitter, SingleCollector):
 
 class InBranch(SingleEmitter, Collector):
 	''' Many-source single-sink connector ''' 
-	def __init__(self, dtype: np.dtype, id: NodeID=None):
-		SingleEmitter.__init__(self, dtype, id=id)
+	def __init__(self, dtype: np.dtype, id: NodeID=None, batch: int=None):
+		SingleEmitter.__init__(self, dtype, id=id, batch=batch)
 		Collector.__init__(self, id=self.id)
 
 	async def __call__(self, *inputs: Tuple[NodeID]): 
 		''' Completion trigger from other processes ''' 
 		for pid in inputs:
 			assert pid in self.sources
-			self.flags[pid] = True
-
-		# Advance to sink nodes if sources have completed 
-		if self.is_ready(): 
-			result = await self.compute(tuple(p.output for p in self.sources.values()))
-			self.reset_flags()
+			if not self.offer(pid):
+				continue
+			# Advance to sink nodes if the join is complete
+			result = await self.compute(self.inputs())
+			self.computed()
 			# await asyncio.sleep(0) # Runs a BFS 
 			if result is not False and len(self.sinks) != 0: # Optional propagation
 				await self.sinks[next(iter(self.sinks))](self.id)
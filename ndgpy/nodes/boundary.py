@@ -5,6 +5,8 @@ import zmq.asyncio as azmq
 from enum import Enum
 
 from ndgpy.data.shared import *
+from ndgpy.network import *
+from ndgpy.trace import *
 from .base import *
 from .interfaces import *
 
@@ -12,6 +14,15 @@ class WriteMode(Enum):
 	fill = 1
 	merge = 2
 
+class Flow(Enum):
+	''' Flow control of a link between contexts, for when the writer outpaces a reader. 
+	A link holds a window of writes: 1 if unbuffered, or its buffer or ring size. 
+	''' 
+	block = 1 			# The writer waits for the slowest reader to be less than a window behind; nothing is lost
+	drop_newest = 2 	# The writer drops records which would overwrite unread ones; readers read every record kept, in order
+	drop_oldest = 3 	# The writer overwrites; readers read every record in order, skipping those overwritten
+	conflate = 4 		# The writer overwrites; readers read only the newest record
+
 class Writer(SingleCollector, Resourced):
 	''' A Writer writes input data to a shared location ''' 
 	def __init__(self, link: SerializedData, mode: WriteMode=WriteMode.fill):
@@ -28,10 +39,31 @@ class Writer(SingleCollector, Resourced):
 		self.link_data = deserialize_data(res[Resource.smm], self.link)
 		self.buffered = type(self.link_data) == SharedStreamingArray
 
-	async def compute(self, value: Struct):
+	@property
+	def accepts_batches(self):
+		return True
+
+	@property
+	def window(self) -> int:
+		''' Writes the link holds before overwriting ''' 
+		if type(self.link_data) == SharedRing:
+			return self.link_data.capacity
+		return self.link_data.buf_size if self.buffered else 1
+
+	@property
+	def position(self) -> int:
+		''' Writes made to the link so far ''' 
+		if type(self.link_data) == SharedRing:
+			return self.link_data.head
+		return self.link_data.n_written if self.buffered else self.link_data.version
+
+	async def compute(self, value: Union[Struct, Batch]):
 		# TODO cleanup this interface
 		if self.buffered:
-			self.link_data.consume(value)
+			if type(value) == Batch:
+				self.link_data.extend(value.numpy())
+			else:
+				self.link_data.consume(value)
 		else:
 			if self.mode == WriteMode.fill:
 				self.link_data.set(value)
@@ -39,7 +71,7 @@ class Writer(SingleCollector, Resourced):
 				self.link_data.merge(value)
 
 class Publisher(Writer): 
-	''' A Publisher is a Writer that also sends a signal ''' 
+	''' A Publisher is a Writer that also rings its context's doorbell ''' 
 	def __init__(self, source_id: NodeID, link: SerializedData, emit_every: int=1):
 		''' Publisher can emit every n writes ''' 
 		self.source_id = source_id
@@ -48,49 +80,393 @@ class Publisher(Writer):
 
 	@property 
 	def rspec(self):
-		return super().rspec | {Resource.mc_url, Resource.zmq_ctx}
+		return super().rspec | {Resource.doorbell}
 
 	async def start(self, res: Resources):
 		await super().start(res)
-		self.sock = res[Resource.zmq_ctx].socket(zmq.PUB)
-		# Many-to-many multicasting uses one PUB addr per published node (beware scaling)
-		self.sock.bind(res[Resource.mc_url] + self.source_id)
+		self.doorbell = res[Resource.doorbell]
 		self.n_writes = 0
 
-	async def compute(self, value: Struct):
+	async def compute(self, value: Union[Struct, Batch]):
 		self.n_writes += 1
 		if self.n_writes == self.emit_every:
 			await super().compute(value)
-			await self.sock.send(b'')
+			self.doorbell.ring(self.source_id)
 			self.n_writes = 0
 
 class Subscriber(Emitter, Resourced):
-	''' Subscriber matches with publisher for listening to data across contexts ''' 
-	def __init__(self, source_id: NodeID, link: SerializedData):
+	''' Subscriber matches with publisher for listening to data across contexts.
+	With `batch`, emits Batches: either the publisher's batch (unbuffered links), or the rows written since the last wakeup (buffered links).
+	By default it reads the writes made after it starts; with `resume_at`, those from that write count on (to take over from another subscriber).
+	Buffered links are read newest first, unless `flow` is set to a policy other than Flow.conflate: then every record kept is read, in order.
+	With `credits`, returns the writes it has read to the writer in slot `slot` (see CreditedWriter).
+	''' 
+	def __init__(self, source_id: NodeID, link: SerializedData, source_ctx: str, batch: int=None, resume_at: int=None, 
+			flow: Flow=None, credits: SerializedCredits=None, slot: int=None):
 		self.source_id = source_id
+		self.source_ctx = source_ctx
 		self.link = link
+		self.resume_at = resume_at
+		self.in_order = flow not in (None, Flow.conflate)
+		self.credits = credits
+		self.slot = slot
 		dtype = get_ser_dtype(link)
-		super().__init__(dtype)
+		super().__init__(dtype, batch=batch)
+		self.record = self.output # Where link records are read into
 
 	@property 
 	def rspec(self):
-		return {Resource.mc_url, Resource.zmq_ctx, Resource.smm}
+		return {Resource.doorbell, Resource.smm}
 
 	async def start(self, res: Resources):
 		await Resourced.start(self, res)
 		self.link_data = deserialize_data(res[Resource.smm], self.link)
 		self.buffered = type(self.link_data) == SharedStreamingArray
-		self.sock = res[Resource.zmq_ctx].socket(zmq.SUB)
-		self.sock.connect(res[Resource.mc_url] + self.source_id)
-		self.sock.setsockopt(zmq.SUBSCRIBE, b'')
+		self.doorbell = res[Resource.doorbell]
+		self.event = self.doorbell.listen(self.source_ctx, self.source_id)
+		self.n_read = self.written if self.resume_at is None else self.resume_at # Writes seen
+		self.n_dropped = 0 # Writes overwritten before being read
+		self.credit_data = None if self.credits is None else deserialize_data(res[Resource.smm], self.credits)
+		self.credit()
+		if self.unread:
+			self.event.set()
+
+	async def stop(self):
+		self.doorbell.unlisten(self.source_ctx, self.source_id, self.event)
+		if self.credit_data is not None:
+			self.credit_data.release(self.slot)
+
+	def credit(self):
+		''' Return the writes read so far to the writer ''' 
+		if self.credit_data is not None:
+			self.credit_data.put(self.slot, self.position)
+
+	@property
+	def written(self) -> int:
+		return self.link_data.n_written if self.buffered else self.link_data.version
+
+	@property
+	def position(self) -> int:
+		''' Writes to the link seen so far ''' 
+		return self.n_read
+
+	@property
+	def unread(self) -> int:
+		return self.written - self.n_read
+
+	def follow(self, source_ctx: str):
+		''' Listen for the doorbell of the source in context `source_ctx` instead, after it moved there ''' 
+		event = self.event
+		self.doorbell.unlisten(self.source_ctx, self.source_id, event)
+		self.source_ctx = source_ctx
+		self.event = self.doorbell.listen(source_ctx, self.source_id)
+		event.set() # Wake compute(), which then waits on the new event, to read what was written in between
 
 	async def compute(self):
-		await self.sock.recv() # Any message counts as a computation trigger
+		await self.event.wait() # Rings since the last wakeup are coalesced
+		self.event.clear()
+		if self.buffered and self.in_order:
+			result = self.read_next()
+		else:
+			result = self.read_newest()
+		self.credit()
+		return result
+
+	def read_seq(self, first: int, k: int) -> bool:
+		''' Read the `k` records of a buffered link from number `first` on into the record; whether they were not lapped meanwhile ''' 
+		if self.batch_size is None:
+			return self.link_data.read_seq(first, self.record.data)
+		self.record.data = self.record.buf
+		self.record.n = k
+		return self.link_data.read_seq(first, self.record.buf[:k])
+
+	def read_next(self):
+		''' Read the oldest unread records of a buffered link kept; one, or up to a batch ''' 
+		while True:
+			n_written = self.link_data.n_written
+			first = max(self.n_read, n_written - self.link_data.buf_size) # Skipping those overwritten already
+			if first >= n_written:
+				return False
+			k = 1 if self.batch_size is None else min(n_written - first, self.batch_size)
+			if self.read_seq(first, k):
+				break
+		self.n_dropped += first - self.n_read
+		self.n_read = first + k
+		if n_written > self.n_read: # Read on without waiting for a ring
+			self.event.set()
+
+	def read_newest(self):
+		''' Read the newest record; or for a buffered link with `batch`, the newest unread up to a batch. Nothing if no write is unread
+		(after a spurious wake, say, as by follow()).
+		''' 
 		if self.buffered:
 			# TODO support buffered return?
-			self.output.set(self.link_data[0])
+			while True:
+				n_written = self.link_data.n_written
+				if self.batch_size is None:
+					k = min(n_written - self.n_read, 1)
+				else:
+					k = min(n_written - self.n_read, self.batch_size, self.link_data.buf_size)
+				if k == 0 or self.read_seq(n_written - k, k):
+					break
+			self.n_dropped += max(n_written - self.n_read - k, 0)
+			self.n_read = n_written
+			if k == 0:
+				return False
+		else:
+			if self.link_data.version == self.n_read:
+				return False
+			version = self.link_data.read(self.record)
+			self.n_dropped += max(version - self.n_read - 1, 0)
+			self.n_read = version
+
+class RingPublisher(Writer):
+	''' A Publisher over a SharedRing. Rings its context's doorbell only when a subscriber has stopped polling the ring (see SharedRing.sleep()). ''' 
+	def __init__(self, source_id: NodeID, link: SerializedRing):
+		self.source_id = source_id
+		super().__init__(link)
+
+	@property 
+	def rspec(self):
+		return super().rspec | {Resource.doorbell}
+
+	async def start(self, res: Resources):
+		await super().start(res)
+		self.doorbell = res[Resource.doorbell]
+
+	async def compute(self, value: Union[Struct, Batch]):
+		if type(value) == Batch:
+			self.link_data.push_many(value.numpy())
+		else:
+			self.link_data.push(value)
+		if self.link_data.wake():
+			self.doorbell.ring(self.source_id)
+
+class RingSubscriber(Emitter, Resourced):
+	''' Subscriber which reads every record of a SharedRing in order. 
+	Polls the ring while it is empty, yielding to the event loop for `spin` rounds; then waits for the doorbell of the publisher
+	(running in context `source_ctx`) for up to `max_wait` seconds at a time, or without `source_ctx`, polls backing off exponentially 
+	up to `max_wait` seconds.
+	With `batch`, each activation emits all unread records (up to the batch capacity) as one Batch.
+	With `resume_at`, reads from that record on rather than from those pushed after it starts.
+	With `flow` Flow.conflate, reads only the newest record (counting those skipped as dropped). With `credits`, returns the records it has read
+	to the writer in slot `slot` (see CreditedWriter).
+	''' 
+	def __init__(self, source_id: NodeID, link: SerializedRing, source_ctx: str=None, spin: int=0, max_wait: float=1e-3, batch: int=None, 
+			resume_at: int=None, flow: Flow=None, credits: SerializedCredits=None, slot: int=None):
+		self.source_id = source_id
+		self.source_ctx = source_ctx
+		self.link = link
+		self.resume_at = resume_at
+		self.conflate = flow == Flow.conflate
+		self.credits = credits
+		self.slot = slot
+		self.spin = spin
+		self.max_wait = max_wait
+		super().__init__(get_ser_dtype(link), batch=batch)
+		self.record = self.output # Where link records are read into
+
+	@property 
+	def rspec(self):
+		return {Resource.smm} if self.source_ctx is None else {Resource.smm, Resource.doorbell}
+
+	async def start(self, res: Resources):
+		await Resourced.start(self, res)
+		self.link_data = deserialize_data(res[Resource.smm], self.link)
+		if self.resume_at is not None:
+			self.link_data.cursor = self.resume_at
+		self.credit_data = None if self.credits is None else deserialize_data(res[Resource.smm], self.credits)
+		if self.credit_data is not None:
+			self.credit_data.put(self.slot, self.position)
+		self.doorbell = res.get(Resource.doorbell)
+		self.event = None if self.source_ctx is None else self.doorbell.listen(self.source_ctx, self.source_id)
+
+	async def stop(self):
+		if self.event is not None:
+			self.doorbell.unlisten(self.source_ctx, self.source_id, self.event)
+		if self.credit_data is not None:
+			self.credit_data.release(self.slot)
+
+	def follow(self, source_ctx: str):
+		''' Listen for the doorbell of the source in context `source_ctx` instead, after it moved there ''' 
+		event = self.event
+		if event is None: # Polls only
+			return
+		self.doorbell.unlisten(self.source_ctx, self.source_id, event)
+		self.source_ctx = source_ctx
+		self.event = self.doorbell.listen(source_ctx, self.source_id)
+		event.set() # Wake compute(), to read what was written in between
+
+	@property
+	def n_dropped(self) -> int:
+		return self.link_data.n_dropped
+
+	@property
+	def position(self) -> int:
+		''' Records read so far ''' 
+		return self.link_data.cursor
+
+	@property
+	def unread(self) -> int:
+		return self.link_data.pending
+
+	async def compute(self):
+		ring = self.link_data
+		pop = ring.pop if self.batch_size is None else ring.pop_many
+		n, wait = 0, 0
+		while True:
+			head = ring.head
+			if self.conflate and head - ring.cursor > 1:
+				ring.n_dropped += head - 1 - ring.cursor
+				ring.cursor = head - 1
+			if pop(self.record):
+				break
+			n += 1
+			if n <= self.spin:
+				await asyncio.sleep(0)
+			elif self.event is None:
+				wait = min(max(wait * 2, 1e-6), self.max_wait)
+				await asyncio.sleep(wait)
+			elif self.event.is_set(): # Rung since the last look, perhaps for records already read; look again first
+				self.event.clear()
+			elif self.sleep():
+				await self.event.wait()
+				self.timer.cancel()
+		if self.credit_data is not None:
+			self.credit_data.put(self.slot, ring.cursor)
+
+	def sleep(self) -> bool:
+		''' Ask the publisher for a doorbell; returns whether the ring is still empty, to wait for it. As the ask can be missed (the 
+		publisher may check between the mark and the look), the event is also set after `max_wait` seconds.
+		''' 
+		if not self.link_data.sleep():
+			return False
+		self.timer = asyncio.get_running_loop().call_later(self.max_wait, self.event.set)
+		return True
+
+class CreditedWriter:
+	''' Writer mixin for links with flow control (see Flow): writes at most a window ahead of the slowest reader, as returned by the readers
+	in `credits`. With Flow.block, waits for credits, polling like a RingSubscriber; with Flow.drop_newest, drops the records which 
+	do not fit, counting them in `n_dropped`. Credits are only looked up once the writes fitting as of the last look are used up.
+	''' 
+	spin = 100
+	max_wait = 1e-3
+
+	def __init__(self, *args, credits: SerializedCredits=None, flow: Flow=Flow.block, **kwargs):
+		self.credits = credits
+		self.flow = flow
+		super().__init__(*args, **kwargs)
+
+	async def start(self, res: Resources):
+		await super().start(res)
+		self.credit_data = deserialize_data(res[Resource.smm], self.credits)
+		self.limit = 0 # Writes which fit, as of the last look at the credits
+		self.n_dropped = 0
+
+	async def compute(self, value: Union[Struct, Batch]):
+		k = min(len(value), self.window) if type(value) == Batch else 1
+		position = self.position
+		if position + k > self.limit and not await self.acquire(position, k):
+			self.n_dropped += k
+			return False
+		await super().compute(value)
+
+	async def acquire(self, position: int, k: int) -> bool:
+		''' Whether `k` more writes fit; with Flow.block, once they do ''' 
+		n, wait = 0, 0
+		while True:
+			self.limit = self.credit_data.min(default=position) + self.window
+			if position + k <= self.limit:
+				return True
+			if self.flow != Flow.block:
+				return False
+			n += 1
+			if n > self.spin:
+				wait = min(max(wait * 2, 1e-6), self.max_wait)
+			await asyncio.sleep(wait)
+
+class CreditedPublisher(CreditedWriter, Publisher):
+	''' Publisher over a link with flow control ''' 
+	pass
+
+class CreditedRingPublisher(CreditedWriter, RingPublisher):
+	''' RingPublisher over a link with flow control ''' 
+	pass
+
+class TraceWriter:
+	''' Writer mixin for traced links: writes each record with a trace header (see ndgpy.trace) ''' 
+	trace_in = None # (Origin key, origin stamp, emit stamp) of the next input, set by the TracedExecPlan
+
+	async def start(self, res: Resources):
+		await super().start(res)
+		self.record = Struct(self.link_data.dtype, fill=0)
+		self.rows = None
+		self.source_key = origin_key(self.source_id)
+
+	def wrap(self, value: Union[Struct, Batch]) -> Union[Struct, Batch]:
+		t = clock()
+		origin, t_origin, t_emit = self.trace_in or (self.source_key, t, t)
+		if type(value) == Batch:
+			if self.rows is None or self.rows.capacity < value.capacity:
+				self.rows = Batch(self.link_data.dtype, value.capacity, fill=0)
+			self.rows.n = value.n
+			self.rows.buf['rec'][:value.n] = value.numpy()
+			self.rows.buf['trace'][:value.n] = (origin, t_origin, t_emit, t)
+			return self.rows
+		self.record.data['rec'] = value.data
+		self.record.data['trace'] = (origin, t_origin, t_emit, t)
+		return self.record
+
+	async def compute(self, value: Union[Struct, Batch]):
+		await super().compute(self.wrap(value))
+
+class TracedPublisher(TraceWriter, Publisher):
+	''' Publisher over a traced link ''' 
+	pass
+
+class TracedRingPublisher(TraceWriter, RingPublisher):
+	''' RingPublisher over a traced link ''' 
+	pass
+
+class TracedCreditedPublisher(TraceWriter, CreditedPublisher):
+	''' Publisher over a traced link with flow control ''' 
+	pass
+
+class TracedCreditedRingPublisher(TraceWriter, CreditedRingPublisher):
+	''' RingPublisher over a traced link with flow control ''' 
+	pass
+
+class TraceReader:
+	''' Subscriber mixin for traced links: emits the records without their headers, and keeps the header of the newest one 
+	as `header` (origin key, origin stamp, emit stamp, publish stamp) with the time it was read as `t_wake`.
+	''' 
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		dtype = self.record.dtype['rec']
+		self.output = Struct(dtype) if self.batch_size is None else Batch(dtype, self.record.capacity)
+
+	async def compute(self):
+		if await super().compute() is False:
+			return False
+		self.t_wake = clock()
+		rows = self.record.numpy()
+		if self.batch_size is None:
+			self.output.data[0] = rows['rec']
+			header = rows['trace']
 		else:
-			self.output.set(self.link_data)
+			if len(rows) == 0:
+				return False
+			self.output.set(rows['rec'])
+			header = rows['trace'][-1]
+		self.header = header.item()
+
+class TracedSubscriber(TraceReader, Subscriber):
+	''' Subscriber over a traced link ''' 
+	pass
+
+class TracedRingSubscriber(TraceReader, RingSubscriber):
+	''' RingSubscriber over a traced link ''' 
+	pass
 
 class Trigger(Collector):
 	''' Triggers an event upon particular state. The event should only be used within the same execution context. ''' 
@@ -110,7 +486,9 @@ class Trigger(Collector):
 			self.event.clear()
 
 class FiniteEmitter(Emitter, Resourced):
-	''' Emitter with fixed-term outputs; allows listeners on finish event ''' 
+	''' Emitter with fixed-term outputs; allows listeners on finish event. 
+	The output of the final compute() is propagated like any other; listeners are notified after it, and the emitter is not run again.
+	''' 
 	@property
 	@abstractmethod
 	def finished(self):
@@ -118,24 +496,33 @@ class FiniteEmitter(Emitter, Resourced):
 
 	@property 
 	def rspec(self):
-		return {Resource.zmq_ctx}
+		return {Resource.zmq_ctx, Resource.mc_url}
+
+	@property
+	def fin_url(self) -> str:
+		return f'{mc_url_base}fin_{self.id}'
 
 	async def start(self, res: Resources):
 		await Resourced.start(self, res)
 		self.sock = res[Resource.zmq_ctx].socket(zmq.PUB)
-		self.sock.bind(self.id) # For listeners
+		self.sock.bind(f'{res[Resource.mc_url]}fin_{self.id}') # For listeners
 
 	async def listen(self, zmq_ctx):
 		sock = zmq_ctx.socket(zmq.SUB)
-		sock.connect(self.id)
+		sock.connect(self.fin_url)
 		sock.setsockopt(zmq.SUBSCRIBE, b'')
 		await sock.recv()
+		sock.close()
+
+	async def finish(self):
+		''' Notify listeners ''' 
+		await self.sock.send(b'')
 
 	async def __call__(self):
 		result = await self.compute()
 		# await asyncio.sleep(0) # Runs a BFS 
-		if self.finished:
-			await self.sock.send(b'')
-		elif result is not False: # Optional propagation
+		if result is not False: # Optional propagation
 			await asyncio.gather(*(proc(self.id) for proc in self.sinks.values()))
+		if self.finished:
+			await self.finish()
 			
@@ -0,0 +1,162 @@
+''' Data-parallel replicas of a Router (see Layout.replicate()).
+A Dispatcher sends each input to one of its lanes, each of which is linked to one replica in its own context; a Merge collects the
+replicas' outputs. For ordered merging, records are numbered on dispatch (see sequenced_dtype()), the number is carried around the
+replica by an Untag / Tag pair, and the Dispatcher logs which lane each number went to in a SharedRing that the Merge reads.
+'''
+
+import numpy as np
+import xxhash
+from collections import deque
+
+from ndgpy.data import *
+from .base import *
+from .interfaces import *
+
+log_dtype = np.dtype([('seq', np.int64), ('lane', np.int64)])
+
+def sequenced_dtype(dtype: np.dtype) -> np.dtype:
+	''' Record type of a numbered `dtype` record '''
+	return np.dtype([('rec', np.dtype(dtype)), ('seq', np.int64)])
+
+class Dispatcher(OutBranch, Resourced):
+	''' Sends each input to one of its sinks (lanes, in the order they were connected): in turn, or by the hash of field `key`,
+	so that records with equal keys go to the same lane. The hash is of the field's bytes (xxhash, as Struct.__hash__), so the lane
+	of a key does not depend on the process, unlike hash() of str & bytes.
+	With `log` (a SharedRing of `log_dtype`), numbers its outputs and logs the lane each went to, for a Merge to restore their order.
+	'''
+	def __init__(self, dtype: np.dtype, key: str=None, log: SerializedRing=None):
+		self.key = key
+		self.log = log
+		self.turn = 0 	# Next lane, in turn
+		self.seq = 0 	# Next number
+		OutBranch.__init__(self, dtype if log is None else sequenced_dtype(dtype))
+
+	@property
+	def rspec(self):
+		return {Resource.smm} if self.log is not None else set()
+
+	async def start(self, res: Resources):
+		await Resourced.start(self, res)
+		if self.log is not None:
+			self.log_data = deserialize_data(res[Resource.smm], self.log)
+			self.entry = Struct(log_dtype, fill=0)
+
+	async def __call__(self, src_id: NodeID):
+		lane = await self.compute(self.sources[src_id].output)
+		if lane is not False:
+			await list(self.sinks.values())[lane](self.id)
+
+	async def compute(self, value: Struct):
+		''' Returns the index of the lane to send to '''
+		n = len(self.sinks)
+		if n == 0:
+			return False
+		if self.key is None:
+			lane = self.turn % n
+			self.turn = lane + 1
+		else:
+			lane = xxhash.xxh64_intdigest(value.data[self.key].tobytes()) % n
+		if self.log is None:
+			self.output.set(value)
+		else:
+			self.output['rec'] = value.numpy()
+			self.output['seq'] = self.entry['seq'] = self.seq
+			self.entry['lane'] = lane
+			self.log_data.push(self.entry)
+			self.seq += 1
+		return lane
+
+class Lane(OutBranch):
+	''' Passes on the records a Dispatcher sends it, so that each lane has its own link '''
+	async def compute(self, value: Struct):
+		self.output.set(value)
+
+class Untag(Router):
+	''' Strips the number from a numbered record, to feed a replica. A Router, as SingleCollectors cannot be linked to across contexts. '''
+	async def compute(self, values):
+		self.output.set(values[0]['rec'])
+
+class Tag(Router):
+	''' Numbers the output of a replica (second source) as its input (first source, numbered).
+	Only fires on the replica's output, so inputs it emits nothing for are skipped; the Merge sees them as dropped.
+	'''
+	def __init__(self, dtype: np.dtype):
+		super().__init__(sequenced_dtype(dtype))
+
+	async def compute(self, values):
+		self.output['rec'] = values[1].numpy()
+		self.output['seq'] = values[0]['seq']
+
+class Merge(InBranch, Resourced):
+	''' Emits the outputs of the replicas of a Router as they arrive from sources `lanes` (node IDs, in lane order).
+	With `log` (see Dispatcher), emits them in the order their inputs were dispatched in, from numbered records: an output is held until
+	those of earlier inputs are out. An input its replica emitted nothing for is known to be dropped by the next output of that replica,
+	which has a later number; until then, later outputs are held. If the log is lapped, the held outputs before the next logged input 
+	are emitted in order, and any of those which arrive later are dropped, so the output stays in order.
+	'''
+	def __init__(self, dtype: np.dtype, lanes: List[NodeID], log: SerializedRing=None):
+		self.log = log
+		self.lane_of = {n_id: i for i, n_id in enumerate(lanes)}
+		self.held = [deque() for _ in lanes] 		# Numbered records waiting, per lane
+		self.entry = Struct(log_dtype, fill=0) 	# Log entry of the next record due
+		self.due = False 							# Whether `entry` is unfinished
+		self.n_logged = 0 							# Log entries read
+		self.last = -1 								# Number of the last input out or dropped
+		self.n_dropped = 0 							# Outputs which arrived after later ones were out
+		InBranch.__init__(self, dtype)
+
+	@property
+	def rspec(self):
+		return {Resource.smm} if self.log is not None else set()
+
+	async def start(self, res: Resources):
+		await Resourced.start(self, res)
+		if self.log is not None:
+			self.log_data = deserialize_data(res[Resource.smm], self.log)
+			self.log_data.cursor = self.n_logged
+
+	async def __call__(self, src_id: NodeID):
+		src = self.sources[src_id]
+		if self.log is None:
+			self.output.set(src.output)
+			await self.emit()
+			return
+		if src.output['seq'] <= self.last:
+			self.n_dropped += 1
+			return
+		self.held[self.lane_of[getattr(src, 'source_id', src_id)]].append(src.output.numpy().copy())
+		entry = self.entry
+		while True:
+			if not self.due:
+				if not self.log_data.pop(entry):
+					return
+				self.n_logged, self.due = self.log_data.cursor, True
+			seq = entry['seq']
+			if seq > self.last + 1: # Log lapped
+				await self.flush(seq)
+			held = self.held[entry['lane']]
+			if not held:
+				return
+			if held[0]['seq'] == seq:
+				self.output.set(held.popleft()['rec'])
+				await self.emit()
+			self.last, self.due = seq, False # Out, or dropped
+
+	async def flush(self, seq: int):
+		''' Emit the held outputs numbered before `seq`, in order '''
+		while True:
+			heads = [held for held in self.held if held and held[0]['seq'] < seq]
+			if not heads:
+				break
+			held = min(heads, key=lambda held: held[0]['seq'])
+			self.last = held[0]['seq']
+			self.output.set(held.popleft()['rec'])
+			await self.emit()
+		self.last = seq - 1
+
+	async def compute(self, values):
+		pass
+
+	async def emit(self):
+		if len(self.sinks) != 0:
+			await self.sinks[next(iter(self.sinks))](self.id)
@@ -0,0 +1,350 @@
+''' Numeric filters over a single input field. Each keeps O(1) state per record, in Python floats so that records one at a time pay
+no NumPy scalar overhead, and computes on whole Batches with vectorized NumPy.
+''' 
+
+import math
+import numpy as np
+from collections import deque
+from operator import mul
+
+from .base import *
+
+try:
+	from scipy.signal import lfilter # Optional: filters IIR Batches faster than IIR.chunked()
+except ImportError:
+	lfilter = None
+
+class Filter(OutBranch):
+	''' Emits one value per input record (per row, for Batches) computed from field `field` of its source ''' 
+	def __init__(self, field: str='f0', batch: int=None):
+		super().__init__([('f0', np.float64)], batch=batch)
+		self.field = field
+		self.fields = (None, None, None, None) # Input data & view of its field, output data & view of its field (for records)
+
+	@property
+	def accepts_batches(self):
+		return self.batch_size is not None
+
+	@abstractmethod
+	def step(self, x: float) -> float:
+		''' Output for the next input; None to emit nothing ''' 
+		pass
+
+	@abstractmethod
+	def step_many(self, x: np.ndarray) -> np.ndarray:
+		''' Outputs for the next inputs, in order; may be fewer than the inputs ''' 
+		pass
+
+	def push(self, x: float):
+		''' Record an input after step() ''' 
+		pass
+
+	def push_many(self, x: np.ndarray):
+		''' Record inputs after step_many() ''' 
+		pass
+
+	async def compute(self, value: Union[Struct, Batch]):
+		if self.batch_size is None:
+			in_data, x_view, out_data, y_view = self.fields
+			out = self.output
+			if value.data is not in_data or out.data is not out_data: # Field views are cheaper than Struct item access
+				in_data, x_view, out_data, y_view = self.fields = value.data, value.data[self.field], out.data, out.data['f0']
+			x = x_view.item(0)
+			y = self.step(x)
+			self.push(x)
+			if y is None:
+				return False
+			y_view[0] = y
+		else:
+			x = np.asarray(value[self.field], dtype=np.float64)
+			y = self.step_many(x)
+			self.push_many(x)
+			self.output.n = len(y)
+			if len(y) == 0:
+				return False
+			self.output['f0'] = y
+
+class Windowed(Filter):
+	''' Filter over the last `n` inputs. Running statistics are recomputed from the window every `n` inputs to bound rounding drift. ''' 
+	def __init__(self, n: int, **kwargs):
+		super().__init__(**kwargs)
+		self.n = n
+		self.window = deque(maxlen=n) # Oldest first
+		self.since_sync = 0
+
+	@property
+	def full(self) -> bool:
+		return len(self.window) == self.n
+
+	def recent(self, k: int) -> np.ndarray:
+		''' Last (up to) k inputs, oldest first ''' 
+		k = min(k, len(self.window))
+		return np.array(self.window)[len(self.window)-k:] if k > 0 else np.empty(0)
+
+	def resync(self):
+		''' Recompute running state exactly from the window ''' 
+		pass
+
+	def push(self, x: float):
+		self.window.append(x)
+		self.since_sync += 1
+		if self.since_sync >= self.n:
+			self.resync()
+			self.since_sync = 0
+
+	def push_many(self, x: np.ndarray):
+		self.window.extend(x[-self.n:].tolist())
+		self.resync()
+		self.since_sync = 0
+
+class RollingMean(Windowed):
+	''' Mean of the last `n` inputs ''' 
+	def __init__(self, n: int, **kwargs):
+		super().__init__(n, **kwargs)
+		self.sum = 0.
+
+	def step(self, x: float) -> float:
+		window = self.window
+		if len(window) == self.n:
+			self.sum += x - window[0]
+			return self.sum / self.n
+		self.sum += x
+		return self.sum / (len(window) + 1)
+
+	def step_many(self, x: np.ndarray) -> np.ndarray:
+		prev = self.recent(self.n - 1)
+		cs = np.concatenate(([0.], np.cumsum(np.concatenate((prev, x)))))
+		j = np.arange(len(prev), len(prev) + len(x)) # Positions of new inputs
+		lo = np.maximum(j - self.n + 1, 0)
+		return (cs[j+1] - cs[lo]) / (j + 1 - lo)
+
+	def resync(self):
+		self.sum = math.fsum(self.window)
+
+class RollingVariance(Windowed):
+	''' Variance of the last `n` inputs, from running sums of (shifted) values and squares ''' 
+	def __init__(self, n: int, ddof: int=0, **kwargs):
+		super().__init__(n, **kwargs)
+		self.ddof = ddof
+		self.shift = None # Subtracted from inputs to limit cancellation
+		self.sum, self.sq = 0., 0.
+
+	def variance(self, s, q, m):
+		with np.errstate(invalid='ignore', divide='ignore'):
+			return np.maximum(q - s*s/m, 0) / (m - self.ddof)
+
+	def step(self, x: float) -> float:
+		if self.shift is None:
+			self.shift = x
+		window = self.window
+		if len(window) == self.n:
+			old = window[0] - self.shift
+			self.sum -= old
+			self.sq -= old*old
+		x = x - self.shift
+		self.sum += x
+		self.sq += x*x
+		m = min(len(window) + 1, self.n)
+		return max(self.sq - self.sum*self.sum/m, 0.) / (m - self.ddof) if m > self.ddof else math.nan
+
+	def step_many(self, x: np.ndarray) -> np.ndarray:
+		if self.shift is None:
+			self.shift = x[0]
+		ext = np.concatenate((self.recent(self.n - 1), x)) - self.shift
+		cs = np.concatenate(([0.], np.cumsum(ext)))
+		cq = np.concatenate(([0.], np.cumsum(ext*ext)))
+		j = np.arange(len(ext) - len(x), len(ext))
+		lo = np.maximum(j - self.n + 1, 0)
+		m = j + 1 - lo
+		return np.where(m > self.ddof, self.variance(cs[j+1] - cs[lo], cq[j+1] - cq[lo], m), np.nan)
+
+	def resync(self):
+		if self.shift is not None:
+			w = [v - self.shift for v in self.window]
+			self.sum, self.sq = math.fsum(w), math.fsum(v*v for v in w)
+
+class EWMA(Filter):
+	''' Exponentially weighted moving average, y <- y + alpha * (x - y), starting from the first input ''' 
+	def __init__(self, alpha: float, **kwargs):
+		assert 0 < alpha <= 1
+		super().__init__(**kwargs)
+		self.alpha = alpha
+		self.y = None
+		decay = 1 - alpha
+		# Closed form over a chunk divides by decay**len; keep that above 1e-150
+		self.chunk = int(np.log(1e-150) / np.log(decay)) if 0 < decay < 1 else None
+
+	def step(self, x: float) -> float:
+		self.y = x if self.y is None else self.y + self.alpha * (x - self.y)
+		return self.y
+
+	def step_many(self, x: np.ndarray) -> np.ndarray:
+		if len(x) == 0:
+			return x
+		if self.chunk is None: # alpha == 1
+			self.y = x[-1]
+			return x.copy()
+		y = x[0] if self.y is None else self.y
+		out = np.empty(len(x))
+		for i in range(0, len(x), self.chunk):
+			c = x[i:i+self.chunk]
+			w = (1 - self.alpha) ** np.arange(1, len(c) + 1)
+			# y_t = d^(t+1) * (y_-1 + alpha * sum_{i<=t} x_i / d^(i+1)), with d = 1 - alpha
+			out[i:i+len(c)] = w * (y + self.alpha * np.cumsum(c / w))
+			y = out[i+len(c)-1]
+		self.y = y
+		return out
+
+class FIR(Windowed):
+	''' Finite impulse response filter: y_t = sum_k taps[k] * x_(t-k), treating inputs before the first as 0 ''' 
+	def __init__(self, taps: np.ndarray, **kwargs):
+		self.taps = np.asarray(taps, dtype=np.float64)
+		super().__init__(max(len(self.taps) - 1, 1), **kwargs)
+		self.window.extend([0.] * self.n) # Inputs before the first
+		self.head, self.tail = float(self.taps[0]), self.taps[:0:-1].tolist() # Tap of the newest input; of the earlier ones, oldest first
+
+	def step(self, x: float) -> float:
+		return self.head*x + sum(map(mul, self.tail, self.window))
+
+	def step_many(self, x: np.ndarray) -> np.ndarray:
+		return np.convolve(np.concatenate((self.recent(len(self.taps) - 1), x)), self.taps, 'valid')
+
+class IIR(Filter):
+	''' Infinite impulse response filter with coefficients (b, a), as a transposed direct form II with O(order) state.
+	Batches are filtered with scipy.signal.lfilter when available, and otherwise in chunks of `chunk` samples (see chunked()).
+	''' 
+	chunk = 64 # Samples per chunk of the NumPy batch path
+
+	def __init__(self, b: np.ndarray, a: np.ndarray, **kwargs):
+		super().__init__(**kwargs)
+		order = max(len(a), len(b))
+		self.b = np.zeros(order)
+		self.a = np.zeros(order)
+		self.b[:len(b)] = np.asarray(b, dtype=np.float64) / a[0]
+		self.a[:len(a)] = np.asarray(a, dtype=np.float64) / a[0]
+		self.b0, self.ba = float(self.b[0]), list(zip(self.b[1:].tolist(), self.a[1:].tolist()))
+		self.z = [0.] * (order - 1)
+		self.responses = None
+
+	def step(self, x: float) -> float:
+		z = self.z
+		y = self.b0*x + (z[0] if z else 0.)
+		self.z = [s + b*x - a*y for s, (b, a) in zip(z[1:] + [0.], self.ba)]
+		return y
+
+	def step_many(self, x: np.ndarray) -> np.ndarray:
+		if not self.z: # Order 0: a gain
+			return self.b0 * x
+		if lfilter is not None:
+			y, z = lfilter(self.b, self.a, x, zi=self.z)
+		else:
+			y, z = self.chunked(x, np.array(self.z))
+		self.z = z.tolist()
+		return y
+
+	def chunked(self, x: np.ndarray, z: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+		''' Outputs and final state for inputs `x` from state `z`. In state-space form, z <- A z + B x and y = z[0] + b0 x; so over a chunk
+		of L samples from state z, the outputs are O z + T x and the final state is A^L z + K x, with matrices O, T, K and powers of A
+		computed once. Chunks are then one matrix product for all their inputs, and a step of the state each.
+		''' 
+		L, m = self.chunk, len(z)
+		if self.responses is None:
+			A = np.zeros((m, m))
+			A[:, 0] = -self.a[1:]
+			A[np.arange(m - 1), np.arange(1, m)] = 1.
+			B = self.b[1:] - self.a[1:] * self.b[0]
+			P = [np.eye(m)] # Powers of A
+			for _ in range(L):
+				P.append(A @ P[-1])
+			h = np.array([self.b[0]] + [P[t][0] @ B for t in range(L - 1)]) # Impulse response
+			lag = np.subtract.outer(np.arange(L), np.arange(L))
+			O = np.array([p[0] for p in P[:L]]) # Outputs per unit of state
+			T = np.where(lag >= 0, h[np.maximum(lag, 0)], 0.) # Outputs per input
+			K = np.array([P[L - 1 - t] @ B for t in range(L)]).T # Final state per input
+			self.responses = (P, O, T, K)
+		P, O, T, K = self.responses
+		q, r = divmod(len(x), L)
+		y = np.empty(len(x))
+		if q:
+			X = x[:q*L].reshape(q, L)
+			Y, Z, starts = X @ T.T, X @ K.T, np.empty((q, m))
+			for c in range(q):
+				starts[c] = z
+				z = P[L] @ z + Z[c]
+			y[:q*L] = (Y + starts @ O.T).ravel()
+		if r:
+			c = x[q*L:]
+			y[q*L:] = O[:r] @ z + T[:r, :r] @ c
+			z = P[r] @ z + K[:, L-r:] @ c
+		return y, z
+
+class Downsample(Filter):
+	''' Emits the mean of each consecutive block of `factor` inputs ''' 
+	def __init__(self, factor: int, **kwargs):
+		super().__init__(**kwargs)
+		self.factor = factor
+		self.acc, self.k = 0., 0 # Partial block
+
+	def step(self, x: float) -> float:
+		self.acc += x
+		self.k += 1
+		if self.k == self.factor:
+			y, self.acc, self.k = self.acc / self.factor, 0., 0
+			return y
+
+	def step_many(self, x: np.ndarray) -> np.ndarray:
+		m = (self.k + len(x)) // self.factor # Blocks completed
+		if m == 0:
+			self.acc += x.sum()
+			self.k += len(x)
+			return np.empty(0)
+		first = self.factor - self.k
+		end = first + (m - 1)*self.factor
+		out = np.empty(m)
+		out[0] = (self.acc + x[:first].sum()) / self.factor
+		out[1:] = x[first:end].reshape(m - 1, self.factor).mean(axis=1)
+		self.acc, self.k = x[end:].sum(), len(x) - end
+		return out
+
+class WindowedFFT(Windowed):
+	''' Magnitude spectrum of the last `n` inputs (tapered by `taper`), emitted every `hop` inputs once the window is full.
+	Accepts Batches, but emits a single spectrum of the latest window per activation.
+	''' 
+	def __init__(self, n: int, hop: int=1, taper: np.ndarray=None, field: str='f0'):
+		super().__init__(n, field=field)
+		self.output = Struct(np.dtype([('f0', np.float64, (n//2 + 1,))]))
+		self.hop = hop
+		self.taper = np.hanning(n) if taper is None else taper
+		self.since_emit = 0
+
+	@property
+	def accepts_batches(self):
+		return True
+
+	def spectrum(self, w: np.ndarray) -> np.ndarray:
+		return np.abs(np.fft.rfft(w * self.taper))
+
+	def step(self, x: float) -> np.ndarray:
+		self.since_emit += 1
+		if len(self.window) + 1 >= self.n and self.since_emit >= self.hop:
+			self.since_emit = 0
+			return self.spectrum(np.append(self.recent(self.n - 1), x))
+
+	def step_many(self, x: np.ndarray) -> np.ndarray:
+		self.since_emit += len(x)
+		if len(self.window) + len(x) >= self.n and self.since_emit >= self.hop:
+			self.since_emit = 0
+			return self.spectrum(np.concatenate((self.recent(self.n), x))[-self.n:])
+
+	async def compute(self, value: Union[Struct, Batch]):
+		x = value[self.field]
+		if type(value) == Batch:
+			x = np.asarray(x, dtype=np.float64)
+			y = self.step_many(x)
+			self.push_many(x)
+		else:
+			y = self.step(float(x))
+			self.push(x)
+		if y is None:
+			return False
+		self.output['f0'] = y
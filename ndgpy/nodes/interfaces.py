@@ -14,6 +14,7 @@ class Resource(Enum):
 	orch_rx_url = 4 	# Telemetry rx
 	orch_api = 5 		# Orchestration API
 	smm = 6 			# Shared-memory manager
+	doorbell = 7 		# Context's readiness notification channel
 Resources = Dict[Resource, Any]
 ResourceSpec = Set[Resource]
 
@@ -30,12 +30,21 @@ class Constant(Signal):
 		super().__init__(lambda t: c, **kwargs)
 
 class Lambda(Router):
-	def __init__(self, func: Callable):
+	def __init__(self, func: Callable, batch: int=None):
+		''' With `batch`, `func` is applied once per batch to whole input columns, so it should be vectorized ''' 
 		self.func = func
-		super().__init__([('f0', np.float64)])
+		super().__init__([('f0', np.float64)], batch=batch)
+
+	@property
+	def accepts_batches(self):
+		return self.batch_size is not None
 
 	async def compute(self, values):
-		self.output['f0'] = self.func(*(v.item() for v in values))
+		if self.batch_size is None:
+			self.output['f0'] = self.func(*(v.item() for v in values))
+		else:
+			self.output.n = min(len(v) for v in values)
+			self.output['f0'] = self.func(*(v.item()[:self.output.n] for v in values))
 
 class ParametrizedLambda(Lambda, Parametrized):
 	def __init__(self, func: Callable, params: List[Tuple[float, float, float]]):
@@ -60,21 +69,39 @@ class ParametrizedLambda(Lambda, Parametrized):
 		self.output['f0'] = self.func(*(v.item() for v in values), self.params.item())
 
 class Integrator(OutBranch):
-	def __init__(self):
-		super().__init__([('f0', np.float64)])
+	def __init__(self, batch: int=None):
+		''' With `batch`, emits the running total after each input record ''' 
+		super().__init__([('f0', np.float64)], batch=batch)
+		self.total = 0.
+		if batch is None:
+			self.output['f0'] = 0.
+
+	@property
+	def accepts_batches(self):
+		return self.batch_size is not None
 
 	async def compute(self, value):
-		self.output['f0'] += value.item() # TODO: overflow
+		if self.batch_size is None:
+			self.output['f0'] += value.item() # TODO: overflow
+		else:
+			self.output.n = len(value)
+			np.cumsum(value.item(), out=self.output['f0'])
+			self.output['f0'] += self.total
+			if self.output.n > 0:
+				self.total = self.output['f0'][-1]
 
 ''' Data structures as sources ''' 
 
 class ArraySource(FiniteEmitter):
-	''' Data source which releases data incrementally from a shared array ''' 
-	def __init__(self, arr: SharedArray):
+	''' Data source which releases data incrementally from a shared array. 
+	With `chunk_size`, emits a Batch of up to that many rows per activation instead of one row; with `zero_copy`, the Batch is a (read-only) view into the array.
+	''' 
+	def __init__(self, arr: SharedArray, chunk_size: int=None, zero_copy: bool=False):
 		self.arr_src = arr.serialize()
 		self.i = 0
 		self.n = len(arr)
-		super().__init__(arr.dtype)
+		self.zero_copy = zero_copy
+		super().__init__(arr.dtype, batch=chunk_size)
 
 	@property 
 	def rspec(self):
@@ -89,5 +116,13 @@ class ArraySource(FiniteEmitter):
 		self.arr = deserialize_data(res[Resource.smm], self.arr_src)
 
 	async def compute(self):
-		self.output.set(self.arr[self.i]) 
-		self.i += 1
\ No newline at end of file
+		if self.batch_size is None:
+			self.output.set(self.arr[self.i]) 
+			self.i += 1
+		else:
+			rows = self.arr[self.i:min(self.i+self.batch_size, self.n)]
+			if self.zero_copy:
+				self.output.view(rows)
+			else:
+				self.output.set(rows)
+			self.i += len(rows)
\ No newline at end of file
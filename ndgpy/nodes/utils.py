@@ -13,7 +13,22 @@ def copy_node(n: Node, smm: AFSharedMemoryManager) -> Node:
 		m.sinks = dict()
 	if isinstance(n, Collector):
 		m.sources = dict()
+		m.join_held = []
 	if isinstance(n, Parametrized):
-		m.parameters = n.parameters.copy(smm)
-		m.parameters_serialized = m.parameters.serialize()
-	return m
\ No newline at end of file
+		m.params = n.params.copy(smm)
+		m.params_serialized = m.params.serialize()
+	return m
+
+def detached_copy(n: Node) -> Node:
+	''' Copy of a running node, to start in another context: the same ID and state, without connections, 
+	nor the attributes set by its start() (as recorded in `started_attrs` by the context), which are set up again there. 
+	''' 
+	m = copy.copy(n)
+	for attr in getattr(n, 'started_attrs', ()):
+		delattr(m, attr)
+	if isinstance(n, Emitter):
+		m.sinks = dict()
+	if isinstance(n, Collector):
+		m.sources = dict()
+		m.arrived, m.join_held = 0, []
+	return m
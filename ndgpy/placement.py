@@ -0,0 +1,108 @@
+''' Placement of nodes onto contexts, from their measured cost.
+Each node has a load (fraction of a core its computes use) and each edge a message rate. A context's load is the sum of its nodes'
+loads, plus `link_cost` seconds of CPU per message on each edge it shares with another context (split between both ends).
+A placement should keep every context under `capacity`, and then cut as little message rate as possible.
+'''
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+Edge = Tuple[str, str, float] # (Source node ID, sink node ID, messages/sec)
+Assignment = Dict[str, int] # Node ID -> context index
+
+def context_loads(assign: Assignment, loads: Dict[str, float], edges: List[Edge], link_cost: float) -> np.ndarray:
+	total = np.zeros(max(assign.values(), default=-1) + 1)
+	for n_id, c in assign.items():
+		total[c] += loads[n_id]
+	for a, b, rate in edges:
+		if assign[a] != assign[b]:
+			total[assign[a]] += rate * link_cost / 2
+			total[assign[b]] += rate * link_cost / 2
+	return total
+
+def cost(assign: Assignment, loads: Dict[str, float], edges: List[Edge], link_cost: float, capacity: float) -> Tuple[float, float]:
+	''' (Load above capacity summed over contexts, message rate across contexts); lower is better, in that order '''
+	over = np.maximum(context_loads(assign, loads, edges, link_cost) - capacity, 0).sum()
+	cut = sum(rate for a, b, rate in edges if assign[a] != assign[b])
+	return (round(float(over), 6), cut)
+
+def round_robin(nodes: List[str], k: int) -> Assignment:
+	return {n_id: i % k for i, n_id in enumerate(nodes)}
+
+def partition(nodes: List[str], loads: Dict[str, float], edges: List[Edge], k: int, link_cost: float, capacity: float=0.8) -> Assignment:
+	''' Place `nodes` onto at most `k` contexts:
+	1. merge the ends of the chattiest edges first, while the merged load fits in `capacity`;
+	2. pack the merged groups into contexts, largest first, next to the groups they exchange the most messages with where they fit;
+	3. move single nodes between contexts while that lowers the cost.
+	Uses as few contexts as fit. Returned context indices are 0, 1, ...
+	'''
+	# 1. Heavy-edge merging
+	group = {n_id: n_id for n_id in nodes}
+	members = {n_id: [n_id] for n_id in nodes}
+	weight = {n_id: loads[n_id] for n_id in nodes}
+	for a, b, rate in sorted(edges, key=lambda e: -e[2]):
+		ga, gb = group[a], group[b]
+		if ga != gb and weight[ga] + weight[gb] <= capacity:
+			for n_id in members[gb]:
+				group[n_id] = ga
+			members[ga] += members.pop(gb)
+			weight[ga] += weight.pop(gb)
+
+	# 2. Packing, largest first
+	between: Dict[Tuple[str, str], float] = {}
+	for a, b, rate in edges:
+		if group[a] != group[b]:
+			for key in ((group[a], group[b]), (group[b], group[a])):
+				between[key] = between.get(key, 0) + rate
+	bins: List[List[str]] = []
+	bin_load: List[float] = []
+	for g in sorted(members, key=lambda g: -weight[g]):
+		fits = [i for i in range(len(bins)) if bin_load[i] + weight[g] <= capacity]
+		if fits:
+			i = max(fits, key=lambda i: (sum(between.get((g, h), 0) for h in bins[i]), -bin_load[i]))
+		elif len(bins) < k:
+			bins.append([])
+			bin_load.append(0.)
+			i = len(bins) - 1
+		else:
+			i = int(np.argmin(bin_load))
+		bins[i].append(g)
+		bin_load[i] += weight[g]
+	assign = {n_id: i for i, gs in enumerate(bins) for g in gs for n_id in members[g]}
+
+	# 3. Refinement by single moves
+	best = cost(assign, loads, edges, link_cost, capacity)
+	for _ in range(20):
+		improved = False
+		for n_id in nodes:
+			home = assign[n_id]
+			targets = set(assign.values()) | ({len(bins)} if len(set(assign.values())) < k else set())
+			for c in targets - {home}:
+				assign[n_id] = c
+				new = cost(assign, loads, edges, link_cost, capacity)
+				if new < best:
+					best, home, improved = new, c, True
+				assign[n_id] = home
+		if not improved:
+			break
+
+	used = {c: i for i, c in enumerate(sorted(set(assign.values())))}
+	return {n_id: used[c] for n_id, c in assign.items()}
+
+def best_move(assign: Assignment, loads: Dict[str, float], edges: List[Edge], k: int, link_cost: float, capacity: float, candidates: List[str]) -> Tuple[str, int]:
+	''' The move of one of `candidates` to another of `k` contexts which lowers the load above capacity the most (then the cut), 
+	as (node ID, context index); None if no move lowers the load above capacity.
+	'''
+	base = cost(assign, loads, edges, link_cost, capacity)
+	best, move = base, None
+	for n_id in candidates:
+		home = assign[n_id]
+		for c in range(k):
+			if c == home:
+				continue
+			assign[n_id] = c
+			new = cost(assign, loads, edges, link_cost, capacity)
+			if new[0] < base[0] and new < best:
+				best, move = new, (n_id, c)
+		assign[n_id] = home
+	return move
@@ -0,0 +1,468 @@
+''' Static execution plans for the subgraph running in one context '''
+
+import asyncio
+import copy
+import dis
+import heapq
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple
+
+from .nodes.base import *
+from .nodes.boundary import FiniteEmitter, TraceReader, TraceWriter
+from .trace import Tracer, clock, origin_key
+from .telemetry import sample_every, exact_rate, hist_bins
+
+''' Compute modes '''
+
+SYNC = 0 	# Plain function
+NO_AWAIT = 1 	# Coroutine function which can never suspend; driven to completion without the event loop
+ASYNC = 2 	# Coroutine function which may suspend; awaited
+THREAD = 3 	# Offloaded to a worker thread (see Collector.offload); awaited
+
+suspending_ops = {'GET_AWAITABLE', 'GET_AITER', 'GET_ANEXT', 'BEFORE_ASYNC_WITH', 'YIELD_VALUE', 'YIELD_FROM'}
+
+def compute_mode(fn: Callable) -> int:
+	fn = inspect.unwrap(getattr(fn, '__func__', fn))
+	if not inspect.iscoroutinefunction(fn):
+		return SYNC
+	if any(i.opname in suspending_ops for i in dis.get_instructions(fn)):
+		return ASYNC
+	return NO_AWAIT
+
+def run_sync(coro) -> Any:
+	''' Run a coroutine which never suspends '''
+	try:
+		coro.send(None)
+	except StopIteration as e:
+		return e.value
+	coro.close()
+	raise RuntimeError('Coroutine suspended; it should have been planned as ASYNC')
+
+def call_sync(fn: Callable, args: tuple) -> Any:
+	''' Call a compute which never suspends to completion ''' 
+	result = fn(*args)
+	return run_sync(result) if inspect.iscoroutine(result) else result
+
+def mark_offload_thread():
+	offload_thread.active = True
+
+def offload_pool(threads: int=None) -> ThreadPoolExecutor:
+	''' Thread pool for offloaded computes, whose threads write the back buffers of outputs (see DoubleBuffered) ''' 
+	return ThreadPoolExecutor(threads, thread_name_prefix='offload', initializer=mark_offload_thread)
+
+''' Node kinds, by the __call__ they would otherwise run '''
+
+ROOT = 0 		# Emitter without sources
+SINGLE = 1 		# Computes on its one source's output, every time it fires
+JOIN = 2 		# Computes on all sources' outputs, when its join is complete (see Join)
+OPAQUE = 3 		# Custom __call__; invoked as-is and propagates by itself
+
+kinds = {
+	Emitter.__call__: ROOT,
+	SingleEmitter.__call__: ROOT,
+	FiniteEmitter.__call__: ROOT, # Finish is handled by the context
+	SingleCollector.__call__: SINGLE,
+	Pipe.__call__: SINGLE,
+	OutBranch.__call__: SINGLE,
+	Collector.__call__: JOIN,
+	Router.__call__: JOIN,
+	InBranch.__call__: JOIN,
+}
+
+class Lineage:
+	''' State shared by the successive plans of a context: the `latest` plan, and the number of emissions `in_flight` (being propagated,
+	on the plan they started on). While none are, every task running a plan waits in the compute of a root, and any emission 
+	after the compute is propagated on the latest plan; so the graph can be changed without cutting into an emission.
+	'''
+	def __init__(self):
+		self.latest = None
+		self.in_flight = 0
+		self.offloading: Dict[NodeID, asyncio.Lock] = {} # Held while an offloaded node computes, per node
+		self.snapshots: Dict[NodeID, List[Union[Struct, Batch]]] = {} # Copies of the inputs an offloaded node computes on, per node
+
+class ExecPlan:
+	''' Topologically ordered plan for the nodes of one context.
+	Nodes are indexed by their position in the order; each emission fires the sinks of a node by index, marking its input slot in the
+	node's own bitmask of arrived inputs, which OPAQUE sources delivering through Collector.__call__ share (joins other than Join.all are
+	left to Collector.offer()), and runs ready nodes in order from a heap (so that nodes on cycles can run again in the same wave).
+	Computes which never await are run as plain calls; only those which may suspend are awaited, and offloaded ones in threads from `pool`.
+	Keeps the telemetry counters of each node (see ndgpy.telemetry), carried over from `prev` for the nodes it also ran, unless `telemetry`
+	is off. Only sampled emissions count the activations below their root, so that unsampled ones pay for nothing but the root's countdown
+	to its next sample. Computes of roots which may suspend are not timed, as they mostly wait for input.
+	Emissions in flight are counted in `lineage` (not those of OPAQUE roots, which propagate by themselves).
+	'''
+	def __init__(self, nodes: Dict[NodeID, Node], prev: 'ExecPlan'=None, pool: ThreadPoolExecutor=None, telemetry: bool=True):
+		self.telemetry = telemetry
+		self.order: List[Node] = self.toposort(nodes)
+		self.index: Dict[NodeID, int] = {n.id: i for i, n in enumerate(self.order)}
+		self.kind: List[int] = [kinds.get(type(n).__call__, OPAQUE) for n in self.order]
+		self.mode: List[int] = [compute_mode(n.compute) for n in self.order]
+		for i, n in enumerate(self.order):
+			if getattr(n, 'offload', False):
+				assert self.mode[i] != ASYNC, f'{type(n).__name__}: offloaded computes must not await'
+				self.mode[i] = THREAD
+		self.pool = (prev.pool if prev is not None else None) if pool is None else pool
+		self.sinks: List[List[Tuple[int, int]]] = [[] for _ in self.order] # (sink index, input slot at sink)
+		self.join: List[Join] = [getattr(n, 'join', None) for n in self.order]
+		self.full: List[int] = [(1 << len(n.sources)) - 1 if isinstance(n, Collector) else 0 for n in self.order] # Mask of all inputs, per node
+		for j, n in enumerate(self.order):
+			if isinstance(n, Collector):
+				for k, src_id in enumerate(n.sources):
+					if src_id in self.index:
+						self.sinks[self.index[src_id]].append((j, k))
+		# Telemetry counters, per node
+		self.activations: List[int] = [0] * len(self.order)
+		self.timed: List[int] = [0] * len(self.order)
+		self.busy_ns: List[int] = [0] * len(self.order)
+		self.hist: List[List[int]] = [[0] * hist_bins for _ in self.order]
+		self.waits: List[int] = [0] * len(self.order)
+		self.wait_ns: List[int] = [0] * len(self.order)
+		self.ready_at: List[int] = [0] * len(self.order) # Stamp of being made ready, if the next compute is timed
+		self.countdown: List[int] = [1 if telemetry else 0] * len(self.order) # Emissions to the next sampled one, per root (never reaches 0 without telemetry)
+		self.every: List[int] = [1] * len(self.order) # Emissions the next sampled one stands for, per root
+		self.sampled_at: List[int] = [0] * len(self.order) # Stamp of the last sampled emission, per root
+		self.lineage = Lineage() if prev is None else prev.lineage
+		self.lineage.latest = self
+		if prev is not None:
+			for n_id, i in self.index.items():
+				k = prev.index.get(n_id)
+				if k is not None:
+					self.activations[i], self.timed[i], self.busy_ns[i] = prev.activations[k], prev.timed[k], prev.busy_ns[k]
+					self.waits[i], self.wait_ns[i], self.hist[i] = prev.waits[k], prev.wait_ns[k], prev.hist[k]
+					if telemetry:
+						self.countdown[i], self.every[i], self.sampled_at[i] = prev.countdown[k], prev.every[k], prev.sampled_at[k]
+
+	@staticmethod
+	def toposort(nodes: Dict[NodeID, Node]) -> List[Node]:
+		''' Reverse DFS postorder over sinks; a topological order if the graph is acyclic '''
+		seen, post = set(), []
+		for root in nodes.values():
+			if root.id in seen:
+				continue
+			seen.add(root.id)
+			stack = [(root, iter(getattr(root, 'sinks', {})))]
+			while stack:
+				n, it = stack[-1]
+				for m_id in it:
+					if m_id in nodes and m_id not in seen:
+						seen.add(m_id)
+						stack.append((nodes[m_id], iter(getattr(nodes[m_id], 'sinks', {}))))
+						break
+				else:
+					post.append(n)
+					stack.pop()
+		return post[::-1]
+
+	async def activate(self, n_id: NodeID):
+		''' Run one emission of a root node and everything it triggers, sampled when the root's countdown runs out (see activate_sampled()) '''
+		i = self.index[n_id]
+		countdown = self.countdown[i] - 1
+		self.countdown[i] = countdown
+		if not countdown:
+			await self.activate_sampled(i)
+			return
+		if self.kind[i] == OPAQUE:
+			await self.order[i]()
+			return
+		result = self.run(i)
+		if self.mode[i] >= ASYNC:
+			result = await result
+			if self.lineage.latest is not self: # Recompiled while it waited
+				await self.lineage.latest.follow(n_id, result)
+				return
+		if result is not False and self.sinks[i]:
+			lineage = self.lineage
+			lineage.in_flight += 1
+			try:
+				await self.propagate(i)
+			finally:
+				lineage.in_flight -= 1
+
+	async def follow(self, n_id: NodeID, result: Any):
+		''' Propagate an emission of a root whose compute began on an earlier plan ''' 
+		i = self.index.get(n_id)
+		if i is None or result is False or not self.sinks[i]:
+			return
+		self.lineage.in_flight += 1
+		try:
+			await self.propagate(i)
+		finally:
+			self.lineage.in_flight -= 1
+
+	async def propagate(self, i: int):
+		heap, fired = [], {} # Ready node indices; triggering sources of ready SINGLE/OPAQUE nodes
+		self.fire(i, heap, fired)
+		try:
+			while heap:
+				j = heapq.heappop(heap)
+				node, kind, mode = self.order[j], self.kind[j], self.mode[j]
+				srcs = fired.pop(j)
+				if kind == OPAQUE:
+					for src in srcs:
+						await node(self.order[src].id)
+					continue
+				for src in srcs:
+					result = self.run(j, src)
+					if mode >= ASYNC:
+						result = await result
+					if result is not False and self.sinks[j]:
+						self.fire(j, heap, fired)
+		except BaseException: # Cut short (by a compute which raised, or cancellation)
+			self.abandon(fired)
+			raise
+
+	def run(self, j: int, src: int=None) -> Any:
+		''' Start the compute of node `j`, fired by node `src` (or as a root, without), clearing the arrivals of a Join.all node. Returns its
+		result; for ASYNC & THREAD computes, an awaitable of it.
+		''' 
+		node, mode = self.order[j], self.mode[j]
+		if src is None:
+			args = ()
+		elif self.kind[j] == SINGLE:
+			args = (self.order[src].output,)
+		elif self.join[j] is Join.all:
+			args = (tuple(p.output for p in node.sources.values()),)
+			node.arrived = 0 # Before the compute, so that one which raises does not leave the node waiting on inputs it has had
+		else:
+			args = (node.inputs(),)
+		if mode == SYNC:
+			return node.compute(*args)
+		if mode == NO_AWAIT:
+			return run_sync(node.compute(*args))
+		if mode == ASYNC:
+			return node.compute(*args)
+		return self.offloaded(node, args)
+
+	def abandon(self, fired: Dict[int, List[int]]):
+		''' Clear the arrivals (and wait stamps) of the nodes an emission left ready without running them, so that they fire afresh ''' 
+		for j in fired:
+			self.ready_at[j] = 0
+			if self.join[j] is Join.all:
+				self.order[j].arrived = 0
+
+	def fire(self, i: int, heap: list, fired: Dict[int, List[int]]):
+		''' Mark the emission of node `i` at each of its sinks '''
+		for j, k in self.sinks[i]:
+			if self.kind[j] == JOIN:
+				if self.join[j] is Join.all:
+					sink = self.order[j]
+					arrived = sink.arrived
+					if arrived >> k & 1:
+						continue
+					arrived |= 1 << k
+					sink.arrived = arrived
+					if arrived != self.full[j] or j in fired:
+						continue
+				elif not self.order[j].offer(self.order[i].id, k) or j in fired:
+					continue
+			if j in fired:
+				fired[j].append(i)
+			else:
+				fired[j] = [i]
+				heapq.heappush(heap, j)
+
+	async def offloaded(self, node: Node, args: tuple) -> Any:
+		''' Run the compute of an offloaded node in a worker thread, one at a time per node, then swap in its output.
+		The thread computes on copies of the inputs taken beforehand, as the sources may emit again on the event loop meanwhile.
+		''' 
+		if self.pool is None:
+			self.pool = offload_pool()
+		lock = self.lineage.offloading.get(node.id)
+		if lock is None:
+			lock = self.lineage.offloading[node.id] = asyncio.Lock()
+		buffers = getattr(node, 'buffers', None)
+		async with lock:
+			if buffers is not None:
+				buffers[1].set(buffers[0])
+			args = self.snapshot(node, args)
+			result = await asyncio.get_running_loop().run_in_executor(self.pool, call_sync, node.compute, args)
+			if buffers is not None:
+				buffers.reverse()
+		return result
+
+	def snapshot(self, node: Node, args: tuple) -> tuple:
+		''' `args` of a compute, with each input copied into the buffers kept for `node` ''' 
+		if not args: # Root
+			return args
+		inputs = args if not isinstance(args[0], tuple) else args[0] # SINGLE, or JOIN
+		copies = self.lineage.snapshots.get(node.id)
+		shape = lambda v: (type(v), v.dtype, len(getattr(v, 'buf', v.data))) # Batches by capacity
+		if copies is None or list(map(shape, copies)) != list(map(shape, inputs)):
+			copies = self.lineage.snapshots[node.id] = [copy.deepcopy(v) for v in inputs]
+		else:
+			for c, v in zip(copies, inputs):
+				c.set(v)
+		return (copies[0],) if inputs is args else (tuple(copies),)
+
+	''' Telemetry ''' 
+
+	async def activate_sampled(self, i: int):
+		''' activate() and propagate(), counting activations for the `every` emissions of root `i` since its last sampled one, and timing 
+		every compute and the wait of every node from being made ready to computing. Then sets the emissions to the next sample: one in
+		`sample_every`, or every one while the root emits under `exact_rate`/sec.
+		''' 
+		node, mode = self.order[i], self.mode[i]
+		every, t0 = self.every[i], clock()
+		self.activations[i] += every
+		rate = every * 1e9 / max(t0 - self.sampled_at[i], 1)
+		self.every[i] = self.countdown[i] = 1 if rate < exact_rate else sample_every
+		self.sampled_at[i] = t0
+		if self.kind[i] == OPAQUE:
+			await node()
+			return
+		result = self.run(i)
+		if mode >= ASYNC:
+			result = await result
+			if self.lineage.latest is not self:
+				await self.lineage.latest.follow(node.id, result)
+				return
+		if mode != ASYNC: # Roots which may suspend mostly wait for input
+			self.sample(i, t0)
+		if result is False or not self.sinks[i]:
+			return
+		self.lineage.in_flight += 1
+		try:
+			await self.propagate_sampled(i, every)
+		finally:
+			self.lineage.in_flight -= 1
+
+	async def propagate_sampled(self, i: int, every: int):
+		heap, fired = [], {}
+		self.fire(i, heap, fired)
+		self.stamp_ready(fired)
+		try:
+			while heap:
+				j = heapq.heappop(heap)
+				node, kind, mode = self.order[j], self.kind[j], self.mode[j]
+				srcs = fired.pop(j)
+				self.activations[j] += len(srcs) * every
+				if kind == OPAQUE:
+					for src in srcs:
+						await node(self.order[src].id)
+					continue
+				for src in srcs:
+					t0 = clock()
+					result = self.run(j, src)
+					if mode >= ASYNC:
+						result = await result
+					self.sample(j, t0)
+					if result is not False and self.sinks[j]:
+						self.fire(j, heap, fired)
+						self.stamp_ready(fired)
+		except BaseException: # Cut short (by a compute which raised, or cancellation)
+			self.abandon(fired)
+			raise
+
+	def stamp_ready(self, fired: Dict[int, List[int]]):
+		''' Record when nodes became ready ''' 
+		t = clock()
+		for j in fired:
+			if not self.ready_at[j]:
+				self.ready_at[j] = t
+
+	def sample(self, j: int, t0: int):
+		''' Record the time of a compute of node `j` started at `t0`, and the wait before it ''' 
+		dt = clock() - t0
+		self.timed[j] += 1
+		self.busy_ns[j] += dt
+		self.hist[j][min(dt.bit_length(), hist_bins - 1)] += 1
+		if self.ready_at[j]:
+			self.waits[j] += 1
+			self.wait_ns[j] += t0 - self.ready_at[j]
+			self.ready_at[j] = 0
+
+class TracedExecPlan(ExecPlan):
+	''' ExecPlan which follows each emission back to the node its path began at (a root, or the origin carried by a traced link), 
+	and records per-edge and per-path latencies into `tracer` (see ndgpy.trace). A node fed by several sources inherits the oldest origin.
+	As it stamps every compute anyway, every emission is sampled for telemetry.
+	''' 
+	def __init__(self, nodes: Dict[NodeID, Node], tracer: Tracer, prev: ExecPlan=None, pool: ThreadPoolExecutor=None):
+		super().__init__(nodes, prev, pool)
+		self.tracer = tracer
+		self.reads: List[bool] = [isinstance(n, TraceReader) for n in self.order]
+		self.writes: List[bool] = [isinstance(n, TraceWriter) for n in self.order]
+		self.srcs: List[List[int]] = [[] for _ in self.order] # Source indices, per node
+		for i, sinks in enumerate(self.sinks):
+			for j, _ in sinks:
+				self.srcs[j].append(i)
+		self.keys: List[int] = [origin_key(n.id) for n in self.order]
+		self.origin: List[Tuple[int, int]] = [(k, 0) for k in self.keys] # (Origin key, origin stamp) of the last emission, per node
+		self.t_emit: List[int] = [0] * len(self.order) # Stamp of the last emission, per node
+
+	async def activate(self, n_id: NodeID):
+		i = self.index[n_id]
+		node = self.order[i]
+		self.activations[i] += 1
+		if self.kind[i] == OPAQUE:
+			await node()
+			return
+		mode, t0 = self.mode[i], clock()
+		result = self.run(i)
+		if mode >= ASYNC:
+			result = await result
+			if self.lineage.latest is not self:
+				await self.lineage.latest.follow(n_id, result)
+				return
+		if mode != ASYNC:
+			self.sample(i, t0)
+		if result is not False:
+			await self.emitted(i)
+
+	async def follow(self, n_id: NodeID, result: Any):
+		i = self.index.get(n_id)
+		if i is not None and result is not False:
+			await self.emitted(i)
+
+	async def emitted(self, i: int):
+		''' Stamp the origin of an emission of root `i`, and propagate it ''' 
+		node = self.order[i]
+		if self.reads[i]:
+			origin, t_origin, t_emit, t_publish = node.header
+			self.tracer.wake(node.source_id, t_emit, t_publish, node.t_wake)
+			self.origin[i], self.t_emit[i] = (origin, t_origin), node.t_wake
+		else:
+			t = clock()
+			self.origin[i], self.t_emit[i] = (self.keys[i], t), t
+		if self.sinks[i]:
+			self.lineage.in_flight += 1
+			try:
+				await self.propagate(i)
+			finally:
+				self.lineage.in_flight -= 1
+
+	async def propagate(self, i: int):
+		heap, fired = [], {}
+		tracer, order, origins, t_emit = self.tracer, self.order, self.origin, self.t_emit
+		self.fire(i, heap, fired)
+		self.stamp_ready(fired)
+		try:
+			while heap:
+				j = heapq.heappop(heap)
+				node, kind, mode = order[j], self.kind[j], self.mode[j]
+				for src in fired.pop(j):
+					if kind == JOIN: # Triggered by all sources
+						src = min(self.srcs[j], key=lambda k: origins[k][1])
+					origin, t = origins[src], clock()
+					if self.reads[src]:
+						tracer.consume(order[src].source_id, t_emit[src], t)
+					if self.writes[j]:
+						node.trace_in = (origin[0], origin[1], t_emit[src])
+					else:
+						tracer.path(origin[0], node.id, origin[1], t)
+					self.activations[j] += 1
+					if kind == OPAQUE:
+						await node(order[src].id)
+						origins[j], t_emit[j] = origin, clock()
+						continue
+					result = self.run(j, src)
+					if mode >= ASYNC:
+						result = await result
+					self.sample(j, t)
+					origins[j], t_emit[j] = origin, clock()
+					if result is not False and self.sinks[j]:
+						self.fire(j, heap, fired)
+						self.stamp_ready(fired)
+		except BaseException: # Cut short (by a compute which raised, or cancellation)
+			self.abandon(fired)
+			raise
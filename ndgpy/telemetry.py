@@ -0,0 +1,123 @@
+''' Per-node telemetry.
+Each context's ExecPlan counts the emissions of every root, unless run without telemetry (see Layout.telemetry_period). In one emission in `sample_every` of each root 
+(every one, for roots emitting under `exact_rate`/sec) it also counts the activations of the nodes it reaches, weighted by the emissions it stands for, times every 
+compute, and the wait of every node between being made ready by its sources and its compute starting. The context sends snapshots of the counters to the host
+over the orchestrator rx channel as packed `stats_dtype()` arrays, with the CPU time of the context's process; the host keeps the last 
+two per context to derive rates.
+'''
+
+import numpy as np
+import struct
+import time
+from typing import Dict, List, Tuple
+
+sample_every = 64 	# Emissions sampled per root: one in `sample_every`
+exact_rate = 2000 	# Emissions/sec under which a root has every emission sampled, so that the activations it causes are counted exactly
+hist_bins = 40 		# Compute time histogram bins; bin k counts times of bit length k in ns, i.e. in [2^(k-1), 2^k)
+
+def stats_dtype(id_len: int) -> np.dtype:
+	''' Counters of a node, with a field for IDs of up to `id_len` bytes '''
+	return np.dtype([
+		('id', f'S{id_len}'),
+		('type', 'S32'),
+		('activations', np.int64), 	# Computes run (estimated from the sampled emissions, below roots emitting over `exact_rate`/sec)
+		('timed', np.int64), 		# Computes timed
+		('busy_ns', np.int64), 		# Total time of the timed computes
+		('waits', np.int64), 		# Waits timed
+		('wait_ns', np.int64), 		# Total time of the timed waits
+		('dropped', np.int64), 		# Records overwritten or lapped before being read (subscribers only)
+		('hist', np.uint32, (hist_bins,)),
+	])
+
+def snapshot(plan) -> np.ndarray:
+	''' Counters of every node in an ExecPlan, with the ID field as wide as the longest ID '''
+	ids = [node.id.encode() for node in plan.order]
+	out = np.zeros(len(plan.order), dtype=stats_dtype(max(map(len, ids), default=1)))
+	for i, node in enumerate(plan.order):
+		out[i] = (
+			ids[i], type(node).__name__[:32], plan.activations[i], plan.timed[i], plan.busy_ns[i],
+			plan.waits[i], plan.wait_ns[i], getattr(node, 'n_dropped', 0), plan.hist[i],
+		)
+	return out
+
+def pack(ctx_id: str, stats: np.ndarray) -> List[bytes]:
+	''' Message frames of a snapshot '''
+	header = struct.pack('<qdq', time.monotonic_ns(), time.process_time(), stats.dtype['id'].itemsize)
+	return [b'telemetry', ctx_id.encode(), header, stats.tobytes()]
+
+def unpack(frames: List[bytes]) -> Tuple[str, int, float, np.ndarray]:
+	''' Context ID, time (ns), CPU time of the context (s), and node counters of a snapshot '''
+	t, cpu, id_len = struct.unpack('<qdq', frames[2])
+	return frames[1].decode(), t, cpu, np.frombuffer(frames[3], dtype=stats_dtype(id_len))
+
+def hist_percentile(hist: np.ndarray, q: float) -> float:
+	''' Upper bound of the q-th percentile of a compute time histogram, in ns '''
+	n = hist.sum()
+	if n == 0:
+		return np.nan
+	return float(2 ** np.searchsorted(np.cumsum(hist), q / 100 * n))
+
+class Telemetry:
+	''' Host-side store of the latest snapshots, with derived per-node statistics '''
+	def __init__(self):
+		self.snapshots: Dict[str, List[Tuple[int, float, np.ndarray]]] = {} # Context ID -> last two (time, CPU time, stats)
+
+	def update(self, frames: List[bytes]):
+		ctx_id, t, cpu, stats = unpack(frames)
+		self.snapshots[ctx_id] = self.snapshots.get(ctx_id, [])[-1:] + [(t, cpu, stats)]
+
+	def cpu(self, ctx_id: str) -> float:
+		''' Fraction of a core used by a context, between its last two snapshots ''' 
+		snaps = self.snapshots.get(ctx_id, ())
+		if len(snaps) < 2:
+			return np.nan
+		(t0, cpu0, _), (t1, cpu1, _) = snaps
+		return (cpu1 - cpu0) / (max(t1 - t0, 1) / 1e9)
+
+	def loads(self, ctx_id: str, n_ids: List[str]) -> Tuple[Dict[str, float], Dict[str, float]]:
+		''' Load (fraction of a core) and activation rate of nodes `n_ids` of a context. The CPU time of the context not spent in 
+		their computes (the framework's share, and that of other nodes) is attributed to them in proportion to their rates.
+		''' 
+		rows = {r['id']: r for r in self.nodes() if r['context'] == ctx_id}
+		nan_to_zero = lambda x: 0. if x != x else x # Untimed or idle
+		loads = {n_id: nan_to_zero(rows[n_id]['load']) if n_id in rows else 0. for n_id in n_ids}
+		rates = {n_id: nan_to_zero(rows[n_id]['rate']) if n_id in rows else 0. for n_id in n_ids}
+		overhead, total_rate = max(nan_to_zero(self.cpu(ctx_id)) - sum(loads.values()), 0), sum(rates.values())
+		if total_rate > 0:
+			loads = {n_id: load + overhead * rates[n_id] / total_rate for n_id, load in loads.items()}
+		return loads, rates
+
+	def nodes(self) -> List[Dict]:
+		''' Statistics of every node, over the interval between each context's last two snapshots:
+		activation `rate` (/sec), mean and p99 compute time (us), estimated `load` (fraction of a core), mean wait (us), and drops.
+		'''
+		rows = []
+		for ctx_id, snaps in self.snapshots.items():
+			t1, _, cur = snaps[-1]
+			t0, _, prev = snaps[0] if len(snaps) > 1 else (t1, 0, None)
+			dt = max(t1 - t0, 1) / 1e9
+			before = {r['id']: r for r in prev} if prev is not None else {}
+			for r in cur:
+				p = before.get(r['id'])
+				d = {k: int(r[k]) - (int(p[k]) if p is not None else 0) for k in ('activations', 'timed', 'busy_ns', 'waits', 'wait_ns', 'dropped')}
+				hist = r['hist'] - p['hist'] if p is not None else r['hist']
+				mean_ns = d['busy_ns'] / d['timed'] if d['timed'] else np.nan
+				rate = d['activations'] / dt if p is not None else np.nan
+				rows.append({
+					'context': ctx_id,
+					'id': r['id'].decode(),
+					'type': r['type'].decode(),
+					'activations': int(r['activations']),
+					'rate': rate,
+					'mean_us': mean_ns / 1e3,
+					'p99_us': hist_percentile(hist, 99) / 1e3,
+					'load': mean_ns * rate / 1e9,
+					'wait_us': d['wait_ns'] / d['waits'] / 1e3 if d['waits'] else np.nan,
+					'dropped': int(r['dropped']),
+				})
+		return rows
+
+	def top(self, n: int=10, key: str='load') -> List[Dict]:
+		''' The `n` nodes with the highest `key` '''
+		rows = [r for r in self.nodes() if not np.isnan(r[key])]
+		return sorted(rows, key=lambda r: r[key], reverse=True)[:n]
@@ -0,0 +1,52 @@
+''' Live view of the busiest nodes of a running Layout, from the telemetry it republishes.
+
+Run `python -m ndgpy.top` while a Layout is running.
+'''
+
+import argparse
+import zmq
+
+from .network import telemetry_url
+from .telemetry import Telemetry
+
+columns = [ # Name, width, format
+	('context', 10, '<10.8'), ('id', 10, '<10.8'), ('type', 20, '<20.20'), ('rate', 10, '>10.0f'), ('mean_us', 10, '>10.1f'),
+	('p99_us', 10, '>10.1f'), ('load', 8, '>8.1%'), ('wait_us', 10, '>10.1f'), ('dropped', 10, '>10d'),
+]
+
+def render(rows) -> str:
+	header = ''.join(f'{c:{fmt[0]}{w}}' for c, w, fmt in columns)
+	cell = lambda v, w, fmt: format(v, fmt) if v == v else f'{"-":>{w}}' # Untimed nodes have NaN statistics
+	return '\n'.join([header] + [''.join(cell(r[c], w, fmt) for c, w, fmt in columns) for r in rows])
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='ndgpy-top', description='Live per-node telemetry of a running ndgpy Layout')
+	parser.add_argument('-n', type=int, default=20, help='Number of nodes to show')
+	parser.add_argument('-s', '--sort', default='load', choices=['rate', 'mean_us', 'p99_us', 'load', 'wait_us', 'dropped'], help='Statistic to sort by')
+	parser.add_argument('--once', action='store_true', help='Print one table after the first full round of snapshots, and exit')
+	parser.add_argument('--url', default=telemetry_url)
+	args = parser.parse_args(argv)
+
+	sock = zmq.Context.instance().socket(zmq.SUB)
+	sock.connect(args.url)
+	sock.setsockopt(zmq.SUBSCRIBE, b'telemetry')
+	telemetry = Telemetry()
+	try:
+		while True:
+			telemetry.update(sock.recv_multipart())
+			while sock.poll(0): # Drain the round
+				telemetry.update(sock.recv_multipart())
+			if not all(len(s) > 1 for s in telemetry.snapshots.values()):
+				continue # Rates need two snapshots
+			table = render(telemetry.top(args.n, args.sort))
+			if args.once:
+				print(table)
+				return
+			print('\033[H\033[J' + table, flush=True) # Clear screen
+	except KeyboardInterrupt:
+		pass
+	finally:
+		sock.close(linger=0)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,117 @@
+''' Latency tracing across contexts.
+Traced links carry a header with each record, holding a key of the ID of the node where the record's path began (see origin_key()) and monotonic-ns stamps of
+that origin, of the emission into the link's publisher, and of the publish itself. The receiving context adds the wake (the subscriber
+has read the record) and consume (a downstream node starts computing on it) stamps, and aggregates:
+* per edge (cross-context link, by source node): emit -> publish (writer copy and queueing), publish -> wake (doorbell or ring poll),
+  and wake -> consume (event loop queue);
+* per path (origin node, consuming node): origin -> consume, following records through Routers and Pipes in any number of contexts.
+Tracing is chosen per context and link when they are created; untraced links and plans are unchanged.
+'''
+
+import numpy as np
+import time
+import xxhash
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Tuple
+
+trace_dtype = np.dtype([('origin', np.uint64), ('t_origin', np.int64), ('t_emit', np.int64), ('t_publish', np.int64)])
+
+def traced_dtype(dtype: np.dtype) -> np.dtype:
+	''' Record type of a traced link carrying `dtype` records '''
+	return np.dtype([('rec', dtype), ('trace', trace_dtype)])
+
+clock = time.monotonic_ns # System-wide, so stamps compare across processes
+
+def origin_key(n_id: str) -> int:
+	''' Key of a node ID in trace headers and reports: a hash, so that IDs of any length fit in the header. See named(). '''
+	return xxhash.xxh64_intdigest(n_id.encode())
+
+def named(report: Dict[str, list], n_ids: Iterable[str]) -> Dict[str, list]:
+	''' `report` with the origin key of each path replaced by the ID among `n_ids` it is of (or by its hex, if none is) '''
+	names = {origin_key(n_id): n_id for n_id in n_ids}
+	for p in report['paths']:
+		p['origin'] = names.get(p['origin'], f'{p["origin"]:016x}')
+	return report
+
+class Histogram:
+	''' Log-binned histogram of durations in ns, 16 bins per decade from 100 ns to 100 s '''
+	edges = list(np.geomspace(1e2, 1e11, 9*16 + 1))
+
+	def __init__(self):
+		self.counts = [0] * (len(Histogram.edges) + 1)
+		self.n = 0
+		self.total = 0
+		self.max = 0
+
+	def add(self, dt: int):
+		self.counts[bisect_right(Histogram.edges, dt)] += 1
+		self.n += 1
+		self.total += dt
+		if dt > self.max:
+			self.max = dt
+
+	def merge(self, other: 'Histogram'):
+		self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+		self.n += other.n
+		self.total += other.total
+		self.max = max(self.max, other.max)
+
+	@property
+	def mean(self) -> float:
+		return self.total / max(self.n, 1)
+
+	def percentile(self, q: float) -> float:
+		''' Upper edge of the bin holding the q-th percentile, in ns '''
+		if self.n == 0:
+			return np.nan
+		k = np.searchsorted(np.cumsum(self.counts), q / 100 * self.n)
+		return float(min(Histogram.edges[min(k, len(Histogram.edges) - 1)], self.max))
+
+	def summary(self) -> Dict[str, float]:
+		return {
+			'n': self.n,
+			'mean_us': self.mean / 1e3,
+			'p50_us': self.percentile(50) / 1e3,
+			'p99_us': self.percentile(99) / 1e3,
+			'max_us': self.max / 1e3,
+		}
+
+stages = ('emit->publish', 'publish->wake', 'wake->consume')
+
+class Tracer:
+	''' Per-context aggregation of the stamps of traced records '''
+	def __init__(self):
+		self.edges: Dict[str, Dict[str, Histogram]] = {} # Source node ID -> stage -> histogram
+		self.paths: Dict[Tuple[int, str], Histogram] = {} # (Origin key, consuming node ID) -> histogram
+
+	def stage(self, source_id: str, stage: str) -> Histogram:
+		if source_id not in self.edges:
+			self.edges[source_id] = {s: Histogram() for s in stages}
+		return self.edges[source_id][stage]
+
+	def wake(self, source_id: str, t_emit: int, t_publish: int, t_wake: int):
+		''' Record the delivery of a record over the link from `source_id` '''
+		self.stage(source_id, 'emit->publish').add(t_publish - t_emit)
+		self.stage(source_id, 'publish->wake').add(t_wake - t_publish)
+
+	def consume(self, source_id: str, t_wake: int, t: int):
+		self.stage(source_id, 'wake->consume').add(t - t_wake)
+
+	def path(self, origin: int, node_id: str, t_origin: int, t: int):
+		h = self.paths.get((origin, node_id))
+		if h is None:
+			h = self.paths[(origin, node_id)] = Histogram()
+		h.add(t - t_origin)
+
+	def summary(self) -> Dict[str, list]:
+		''' Plain-typed statistics of every edge and path, in us '''
+		return {
+			'edges': [
+				{'source': src, 'stage': s, **h.summary()}
+				for src, hs in self.edges.items() for s, h in hs.items() if h.n > 0
+			],
+			'paths': [
+				{'origin': origin, 'node': node_id, **h.summary()}
+				for (origin, node_id), h in self.paths.items()
+			],
+		}
@@ -183,6 +183,12 @@ setup(
     #         'sample=sample:main',
     #     ],
     # },
+    entry_points={
+        'console_scripts': [
+            'ndgpy-bench=ndgpy.bench.__main__:main',
+            'ndgpy-top=ndgpy.top:main',
+        ],
+    },
 
     # List additional URLs that are relevant to your project as a dict.
     #